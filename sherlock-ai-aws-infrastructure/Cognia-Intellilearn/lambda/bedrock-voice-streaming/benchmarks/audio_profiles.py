@@ -0,0 +1,113 @@
+"""
+Audio profile benchmark: bytes per second of speech and synthesis latency per profile.
+
+Synthesizes the same tutor sentences with every profile in index.audio_profiles
+(or the ones given with --profiles) through the handler's own Polly path, and
+reports synthesis latency (p50/p95), bytes per second of speech and the size
+relative to the first profile. Codec output cannot be simulated meaningfully,
+so this calls Amazon Polly and needs credentials allowed polly:SynthesizeSpeech.
+Nothing is written to S3.
+
+    python benchmarks/audio_profiles.py
+    python benchmarks/audio_profiles.py --profiles standard mobile --iterations 5 --json profiles.json
+
+Speech duration is read from the audio itself: MP3 frame headers, the last Ogg
+page's granule position, or the PCM sample count.
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.dirname(BENCH_DIR)
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('ENABLE_METRICS', 'false')
+
+sys.path.insert(0, LAMBDA_DIR)
+
+import index  # noqa: E402
+from handler_latency import percentile  # noqa: E402
+
+SENTENCES = [
+    "¡Hola! Soy CognIA, tu asistente de física.",
+    "La cinemática estudia el movimiento de los cuerpos sin considerar las causas que lo producen.",
+    "Según la segunda ley de Newton, la fuerza neta sobre un objeto es igual a su masa por su aceleración, "
+    "así que si duplicas la fuerza sobre el mismo objeto, su aceleración también se duplica.",
+    "¿Quieres que resolvamos juntos un ejercicio práctico sobre energía cinética y potencial?"
+]
+
+
+def speech_seconds(audio: bytes, settings: Dict[str, str]) -> float:
+    sample_rate = int(settings['sampleRate'])
+    if settings['outputFormat'] == 'mp3':
+        return index.mp3_audio_frames(audio)[2] / 1000
+    if settings['outputFormat'] == 'ogg_vorbis':
+        # Granule position of the last page is the stream's PCM sample count
+        last_page = audio.rfind(b'OggS')
+        if last_page < 0 or last_page + 14 > len(audio):
+            return 0.0
+        return struct.unpack_from('<q', audio, last_page + 6)[0] / sample_rate
+    return len(audio) / 2 / sample_rate
+
+
+def run_profile(name: str, iterations: int) -> Dict[str, float]:
+    settings = index.get_voice_settings(name)
+    latencies: List[float] = []
+    total_bytes = 0
+    total_seconds = 0.0
+    for _ in range(iterations):
+        for sentence in SENTENCES:
+            started = time.perf_counter()
+            audio = index.synthesize_polly_audio(sentence, settings)
+            latencies.append((time.perf_counter() - started) * 1000)
+            total_bytes += len(audio)
+            total_seconds += speech_seconds(audio, settings)
+    return {
+        'outputFormat': settings['outputFormat'],
+        'sampleRate': settings['sampleRate'],
+        'engine': settings['engine'],
+        'p50Ms': round(percentile(latencies, 0.50), 1),
+        'p95Ms': round(percentile(latencies, 0.95), 1),
+        'bytesPerSecond': round(total_bytes / total_seconds, 1) if total_seconds else 0.0,
+        'speechSeconds': round(total_seconds, 2),
+        'bytes': total_bytes
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='*', default=list(index.audio_profiles))
+    parser.add_argument('--iterations', type=int, default=3, help='passes over the sample sentences')
+    parser.add_argument('--json', help='write full results to this file')
+    args = parser.parse_args()
+    
+    logging.getLogger().setLevel(logging.ERROR)
+    unknown = [name for name in args.profiles if name not in index.audio_profiles]
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(unknown)}")
+    
+    results = {name: run_profile(name, args.iterations) for name in args.profiles}
+    reference = results[args.profiles[0]]['bytesPerSecond'] or 1
+    print(f"{'profile':<16}{'format':<12}{'rate':>7}{'engine':>10}{'p50 ms':>9}{'p95 ms':>9}{'B/s':>9}{'kbps':>7}{'size':>8}")
+    for name, stats in results.items():
+        print(
+            f"{name:<16}{stats['outputFormat']:<12}{stats['sampleRate']:>7}{stats['engine']:>10}"
+            f"{stats['p50Ms']:>9.0f}{stats['p95Ms']:>9.0f}{stats['bytesPerSecond']:>9.0f}"
+            f"{stats['bytesPerSecond'] * 8 / 1000:>7.1f}{stats['bytesPerSecond'] / reference:>8.0%}"
+        )
+    
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    
+    index.tts_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Cold-start benchmark for the Bedrock voice streaming Lambda.
+
+Each sample runs in a fresh interpreter so module import and client creation
+are measured as a new Lambda container would see them. No AWS calls are made:
+boto3 clients are created but never used, so it runs offline.
+
+    python benchmarks/cold_start.py --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ['bedrock-runtime', 's3', 'cloudwatch', 'polly', 'dynamodb']
+
+OPTIONS_EVENT = {'requestContext': {'http': {'method': 'OPTIONS'}}, 'headers': {}}
+STOP_EVENT = {'body': json.dumps({'audioData': 'x', 'sessionId': 'bench-session', 'action': 'stop_session'})}
+
+
+def run_child(scenario: str) -> dict:
+    """
+    Measure one scenario inside a fresh interpreter
+    """
+    sys.path.insert(0, LAMBDA_DIR)
+    started = time.perf_counter()
+    
+    if scenario == 'eager':
+        # Previous behaviour: five default-config clients built at import time
+        import boto3
+        for service in SERVICES:
+            if service == 'dynamodb':
+                boto3.resource(service, region_name='us-east-1')
+            else:
+                boto3.client(service, region_name='us-east-1')
+    
+    import index
+    imported = time.perf_counter()
+    
+    if scenario in ('eager', 'lazy_options'):
+        index.lambda_handler(OPTIONS_EVENT, None)
+    elif scenario == 'lazy_stop':
+        index.lambda_handler(STOP_EVENT, None)
+    elif scenario == 'lazy_all_clients':
+        for service in SERVICES:
+            index.get_aws_client(service)
+    finished = time.perf_counter()
+    
+    return {
+        'importMs': (imported - started) * 1000,
+        'firstRequestMs': (finished - imported) * 1000,
+        'totalMs': (finished - started) * 1000
+    }
+
+
+def sample(scenario: str) -> dict:
+    env = dict(os.environ, AWS_DEFAULT_REGION='us-east-1', AWS_REGION='us-east-1', ENABLE_METRICS='false')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', scenario],
+        capture_output=True, text=True, env=env, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        print(json.dumps(run_child(args.child)))
+        return
+    
+    scenarios = [
+        ('eager', 'eager clients + OPTIONS (previous)'),
+        ('lazy_options', 'lazy clients + OPTIONS'),
+        ('lazy_stop', 'lazy clients + stop_session'),
+        ('lazy_all_clients', 'lazy clients, all five created')
+    ]
+    print(f"{'scenario':<38}{'import ms':>12}{'1st req ms':>12}{'total ms':>12}")
+    for scenario, label in scenarios:
+        samples = [sample(scenario) for _ in range(args.runs)]
+        medians = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+        print(f"{label:<38}{medians['importMs']:>12.1f}{medians['firstRequestMs']:>12.1f}{medians['totalMs']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Context selection benchmark: BM25 index build and passage selection latency.
+
+Builds index.PassageIndex over a synthetic course corpus (words drawn from a
+Zipf-distributed vocabulary, so common terms have long postings lists as in
+real text) and times PassageIndex.select for queries of increasing length,
+from the topic alone to a long transcript. Each query length is measured with
+the CONTEXT_QUERY_MAX_TERMS cap and, for comparison, without it. No network
+access is needed.
+
+    python benchmarks/context_selection.py
+    python benchmarks/context_selection.py --passages 1000 5000 20000 --iterations 200 --json selection.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.dirname(BENCH_DIR)
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('ENABLE_METRICS', 'false')
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+import index  # noqa: E402
+from handler_latency import percentile  # noqa: E402
+
+PASSAGE_COUNTS = [1000, 5000]
+QUERY_TERMS = [2, 10, 24, 60, 150]  # 2 is a topic-only query
+VOCABULARY_SIZE = 20_000
+SYLLABLES = ['ca', 'to', 'mi', 'ra', 'le', 'su', 'po', 'ne', 'fi', 'go', 'ba', 'del', 'tri', 'sol', 'mon', 'cli']
+
+
+def vocabulary(size: int) -> List[str]:
+    words = (''.join(parts) for length in (2, 3, 4) for parts in itertools.product(SYLLABLES, repeat=length))
+    return list(itertools.islice(words, size))
+
+
+def corpus(count: int, words: List[str], rng: random.Random) -> List[tuple]:
+    """
+    count passages of about CONTEXT_PASSAGE_WORDS words, spread over ten sources
+    """
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return [
+        (f'source{i % 10}.txt', ' '.join(rng.choices(words, weights, k=index.CONTEXT_PASSAGE_WORDS)) + '.')
+        for i in range(count)
+    ]
+
+
+def query(terms: int, words: List[str], rng: random.Random) -> str:
+    # Half frequent and half rare terms, in spoken order rather than grouped
+    frequent = min(terms, 200) // 2
+    chosen = rng.sample(words[:200], frequent) + rng.sample(words[200:], terms - frequent)
+    rng.shuffle(chosen)
+    return ' '.join(chosen)
+
+
+def time_select(passage_index: 'index.PassageIndex', queries: List[str], max_terms: int) -> Dict[str, float]:
+    index.CONTEXT_QUERY_MAX_TERMS = max_terms
+    timings = []
+    for text in queries:
+        started = time.perf_counter()
+        passage_index.select(text, index.CONTEXT_TOP_K, index.CONTEXT_BUDGET_CHARS)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'p50Ms': round(percentile(timings, 0.50), 3), 'p95Ms': round(percentile(timings, 0.95), 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--passages', type=int, nargs='*', default=PASSAGE_COUNTS)
+    parser.add_argument('--query-terms', type=int, nargs='*', default=QUERY_TERMS)
+    parser.add_argument('--iterations', type=int, default=100, help='queries per scenario')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='write full results to this file')
+    args = parser.parse_args()
+    
+    logging.getLogger().setLevel(logging.ERROR)
+    rng = random.Random(args.seed)
+    words = vocabulary(VOCABULARY_SIZE)
+    configured_cap = index.CONTEXT_QUERY_MAX_TERMS
+    
+    results: Dict[str, Dict] = {}
+    print(f"{'scenario':<30}{'build ms':>10}{'capped p50':>12}{'capped p95':>12}{'uncapped p50':>14}{'uncapped p95':>14}")
+    for count in args.passages:
+        passages = corpus(count, words, rng)
+        started = time.perf_counter()
+        passage_index = index.PassageIndex(passages)
+        build_ms = (time.perf_counter() - started) * 1000
+        for terms in args.query_terms:
+            queries = [query(terms, words, rng) for _ in range(args.iterations)]
+            capped = time_select(passage_index, queries, configured_cap)
+            uncapped = time_select(passage_index, queries, terms)
+            scenario = f'passages={count} terms={terms}'
+            results[scenario] = {'buildMs': round(build_ms, 1), 'capped': capped, 'uncapped': uncapped}
+            print(
+                f"{scenario:<30}{build_ms:>10.0f}{capped['p50Ms']:>12.2f}{capped['p95Ms']:>12.2f}"
+                f"{uncapped['p50Ms']:>14.2f}{uncapped['p95Ms']:>14.2f}"
+            )
+    index.CONTEXT_QUERY_MAX_TERMS = configured_cap
+    print(f"(query capped at CONTEXT_QUERY_MAX_TERMS={configured_cap} distinct terms)")
+    
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    
+    index.tts_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""
+In-process stand-ins for the AWS services used by the voice streaming Lambda.
+
+Every fake sleeps according to a LatencyModel so the handler sees realistic
+(but reproducible) service timings without network access. Calls are recorded
+per stage so the benchmark can report where time went.
+"""
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class LatencyModel:
+    """
+    Latency distribution in milliseconds: 'const', 'uniform', 'normal' or 'lognormal'
+    """
+    
+    def __init__(self, mean_ms: float, jitter_ms: float = 0.0, distribution: str = 'lognormal'):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+    
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == 'const' or self.jitter_ms <= 0:
+            return self.mean_ms
+        if self.distribution == 'uniform':
+            return max(0.0, rng.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms))
+        if self.distribution == 'normal':
+            return max(0.0, rng.gauss(self.mean_ms, self.jitter_ms))
+        # lognormal with the requested mean and standard deviation: long right tail
+        variance = (self.jitter_ms / self.mean_ms) ** 2
+        sigma = math.sqrt(math.log(1 + variance))
+        mu = math.log(self.mean_ms) - sigma ** 2 / 2
+        return rng.lognormvariate(mu, sigma)
+
+
+class CallRecorder:
+    """
+    Thread-safe record of (stage, start, end) for every fake service call
+    """
+    
+    def __init__(self):
+        self.calls: List[tuple] = []
+        self._lock = threading.Lock()
+    
+    def record(self, stage: str, started: float, finished: float) -> None:
+        with self._lock:
+            self.calls.append((stage, started, finished))
+    
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = []
+    
+    def stage_wall_ms(self) -> Dict[str, float]:
+        """
+        Wall time per stage from its first call start to its last call end
+        (overlapping parallel calls count once)
+        """
+        spans: Dict[str, List[float]] = {}
+        with self._lock:
+            for stage, started, finished in self.calls:
+                span = spans.setdefault(stage, [started, finished])
+                span[0] = min(span[0], started)
+                span[1] = max(span[1], finished)
+        return {stage: (finished - started) * 1000 for stage, (started, finished) in spans.items()}
+
+
+class FakeBackend:
+    """
+    Shared settings for all fakes: RNG, time scale and call recorder
+    """
+    
+    def __init__(self, seed: int = 7, time_scale: float = 1.0):
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.time_scale = time_scale
+        self.recorder = CallRecorder()
+    
+    def sleep(self, model: LatencyModel) -> None:
+        with self.rng_lock:
+            delay_ms = model.sample(self.rng)
+        time.sleep(delay_ms * self.time_scale / 1000)
+
+
+class StreamingBody:
+    def __init__(self, data: bytes):
+        self._data = io.BytesIO(data)
+    
+    def read(self, *args) -> bytes:
+        return self._data.read(*args)
+
+
+class FakeClientError(Exception):
+    """
+    Mimics botocore's ClientError shape (response['Error']['Code'])
+    """
+    
+    def __init__(self, code: str, operation: str):
+        super().__init__(f"An error occurred ({code}) when calling the {operation} operation")
+        self.response = {'Error': {'Code': code}}
+
+
+SENTENCE_TEMPLATES = [
+    "La energía cinética depende de la masa y de la velocidad del objeto número {n}.",
+    "¿Quieres que veamos un ejemplo práctico del caso {n}?",
+    "Recuerda que el Dr. Newton formuló la ley {n} hace más de tres siglos.",
+    "En la sección {n} del curso encontrarás ejercicios resueltos paso a paso.",
+    "¡Muy bien! Ese razonamiento del punto {n} es correcto."
+]
+
+
+def build_answer(sentences: int, nonce: int = 0) -> str:
+    return ' '.join(
+        SENTENCE_TEMPLATES[i % len(SENTENCE_TEMPLATES)].format(n=nonce * 100 + i + 1)
+        for i in range(sentences)
+    )
+
+
+class FakeEventStream:
+    """
+    Iterable response body that, like botocore's EventStream, can be closed from another thread
+    """
+    
+    def __init__(self, events):
+        self._events = events
+        self.closed = False
+    
+    def __iter__(self):
+        for event in self._events:
+            if self.closed:
+                raise ConnectionError('Connection closed while reading the event stream')
+            yield event
+    
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeBedrockRuntime:
+    """
+    invoke_model_with_response_stream with configurable TTFT, inter-chunk gap and chunk size
+    Usage mirrors Anthropic prompt caching: a system block marked with cache_control
+    is written on first use and read from the cache afterwards.
+    """
+    
+    def __init__(
+        self, backend: FakeBackend, ttft: LatencyModel, chunk_gap: LatencyModel,
+        chunk_chars: int = 12, sentences: int = 3
+    ):
+        self.backend = backend
+        self.ttft = ttft
+        self.chunk_gap = chunk_gap
+        self.chunk_chars = chunk_chars
+        self.sentences = sentences
+        self.nonce = 0
+        self.stop_reason = 'end_turn'
+        self.requests: List[Dict[str, Any]] = []
+        self.streams: List[FakeEventStream] = []
+        self.cached_prefixes: set = set()
+    
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict[str, Any]:
+        self.requests.append(kwargs)
+        text = build_answer(self.sentences, self.nonce)
+        stream = FakeEventStream(self._events(text, self._usage(json.loads(kwargs['body']))))
+        self.streams.append(stream)
+        return {'body': stream}
+    
+    def _usage(self, request: Dict[str, Any]) -> Dict[str, int]:
+        system = request.get('system', '')
+        messages_tokens = len(json.dumps(request.get('messages', []), ensure_ascii=False)) // 4
+        if isinstance(system, str):
+            return {'input_tokens': len(system) // 4 + messages_tokens, 'output_tokens': 1}
+        
+        usage = {'input_tokens': messages_tokens, 'output_tokens': 1,
+                 'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        for block in system:
+            tokens = len(block['text']) // 4
+            if 'cache_control' not in block:
+                usage['input_tokens'] += tokens
+            elif block['text'] in self.cached_prefixes:
+                usage['cache_read_input_tokens'] += tokens
+            else:
+                self.cached_prefixes.add(block['text'])
+                usage['cache_creation_input_tokens'] += tokens
+        return usage
+    
+    def _events(self, text: str, usage: Dict[str, int]):
+        started = time.perf_counter()
+        yield {'chunk': {'bytes': json.dumps({
+            'type': 'message_start',
+            'message': {'usage': usage}
+        }).encode()}}
+        self.backend.sleep(self.ttft)
+        for offset in range(0, len(text), self.chunk_chars):
+            if offset:
+                self.backend.sleep(self.chunk_gap)
+            yield {'chunk': {'bytes': json.dumps({
+                'type': 'content_block_delta',
+                'delta': {'type': 'text_delta', 'text': text[offset:offset + self.chunk_chars]}
+            }).encode()}}
+        yield {'chunk': {'bytes': json.dumps({
+            'type': 'message_delta',
+            'delta': {'stop_reason': self.stop_reason},
+            'usage': {'output_tokens': len(text) // 4}
+        }).encode()}}
+        yield {'chunk': {'bytes': json.dumps({'type': 'message_stop'}).encode()}}
+        self.backend.recorder.record('bedrock', started, time.perf_counter())
+
+
+class FakePolly:
+    """
+    synthesize_speech returning silent MPEG frames sized like 48 kbps speech
+    """
+    
+    FRAME = b'\xff\xf3\x64\xc4' + b'\x00' * 140  # MPEG-2 Layer III, 48 kbps, 24 kHz
+    
+    def __init__(self, backend: FakeBackend, latency: LatencyModel, per_char_ms: float = 0.4):
+        self.backend = backend
+        self.latency = latency
+        self.per_char_ms = per_char_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def synthesize_speech(self, **kwargs) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+        text = kwargs['Text']
+        self.backend.sleep(LatencyModel(
+            self.latency.mean_ms + self.per_char_ms * len(text), self.latency.jitter_ms, self.latency.distribution
+        ))
+        # About 14 characters of speech per second, 42 frames per second
+        frames = max(1, int(len(text) / 14 * 42))
+        self.backend.recorder.record('polly', started, time.perf_counter())
+        return {
+            'AudioStream': StreamingBody(self.FRAME * frames),
+            'ContentType': 'audio/mpeg',
+            'RequestCharacters': len(text)
+        }
+
+
+class FakeS3:
+    """
+    In-memory bucket with latency on get/head/put and ETag support
+    """
+    
+    def __init__(self, backend: FakeBackend, get: LatencyModel, put: LatencyModel, head: LatencyModel):
+        self.backend = backend
+        self.get_latency = get
+        self.put_latency = put
+        self.head_latency = head
+        self.objects: Dict[str, bytes] = {}
+        self.counts = {'get': 0, 'put': 0, 'head': 0}
+        self._lock = threading.Lock()
+    
+    def _count(self, operation: str) -> None:
+        with self._lock:
+            self.counts[operation] += 1
+    
+    def seed_object(self, key: str, data: bytes) -> None:
+        self.objects[key] = data
+    
+    @staticmethod
+    def _etag(data: bytes) -> str:
+        return '"' + hashlib.md5(data).hexdigest() + '"'
+    
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, IfNoneMatch: Optional[str] = None, **kwargs):
+        started = time.perf_counter()
+        self._count('get')
+        self.backend.sleep(self.get_latency)
+        try:
+            if Key not in self.objects:
+                raise FakeClientError('NoSuchKey', 'GetObject')
+            data = self.objects[Key]
+            etag = self._etag(data)
+            if IfNoneMatch and IfNoneMatch == etag:
+                raise FakeClientError('304', 'GetObject')
+            if Range:
+                first, last = Range.split('=')[1].split('-')
+                data = data[int(first):int(last) + 1]
+            return {'Body': StreamingBody(data), 'ETag': etag, 'ContentLength': len(data)}
+        finally:
+            self.backend.recorder.record('s3_get', started, time.perf_counter())
+    
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        started = time.perf_counter()
+        self._count('head')
+        self.backend.sleep(self.head_latency)
+        try:
+            if Key not in self.objects:
+                raise FakeClientError('404', 'HeadObject')
+            return {'ETag': self._etag(self.objects[Key]), 'ContentLength': len(self.objects[Key])}
+        finally:
+            self.backend.recorder.record('s3_head', started, time.perf_counter())
+    
+    def put_object(self, Bucket: str, Key: str, Body: Any = b'', **kwargs):
+        started = time.perf_counter()
+        self._count('put')
+        self.backend.sleep(self.put_latency)
+        data = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        self.objects[Key] = data
+        self.backend.recorder.record('s3_put', started, time.perf_counter())
+        return {'ETag': self._etag(data)}
+
+
+class FakeTable:
+    def __init__(self, backend: FakeBackend, latency: LatencyModel):
+        self.backend = backend
+        self.latency = latency
+        self.items: Dict[tuple, Dict[str, Any]] = {}
+    
+    def put_item(self, Item: Dict[str, Any], **kwargs):
+        started = time.perf_counter()
+        self.backend.sleep(self.latency)
+        self.items[(Item['PK'], Item['SK'])] = Item
+        self.backend.recorder.record('dynamodb', started, time.perf_counter())
+        return {}
+    
+    def get_item(self, Key: Dict[str, Any], **kwargs):
+        started = time.perf_counter()
+        self.backend.sleep(self.latency)
+        item = self.items.get((Key['PK'], Key['SK']))
+        self.backend.recorder.record('dynamodb', started, time.perf_counter())
+        return {'Item': item} if item else {}
+
+
+class FakeDynamoDB:
+    """
+    Stand-in for boto3.resource('dynamodb')
+    """
+    
+    def __init__(self, backend: FakeBackend, latency: LatencyModel):
+        self.tables: Dict[str, FakeTable] = {}
+        self.backend = backend
+        self.latency = latency
+    
+    def Table(self, name: str) -> FakeTable:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(self.backend, self.latency)
+        return self.tables[name]
+
+
+class FakeCloudWatch:
+    def __init__(self, backend: FakeBackend, latency: LatencyModel):
+        self.backend = backend
+        self.latency = latency
+        self.batches = 0
+    
+    def put_metric_data(self, **kwargs):
+        self.backend.sleep(self.latency)
+        self.batches += 1
+        return {}
+
+
+class FakeLambdaContext:
+    """
+    Minimal Lambda context with a fixed invocation timeout
+    """
+    
+    def __init__(self, timeout_ms: int = 30000):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+        self.aws_request_id = 'bench'
+    
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
@@ -0,0 +1,234 @@
+"""
+Offline latency benchmark for lambda_handler with simulated AWS backends.
+
+Runs the real handler against the in-process fakes in benchmarks/fakes.py for
+every combination of context sources (0-3) and answer length (1-10 sentences),
+and reports p50/p95/p99 per stage and end to end. Stages come from the fakes'
+call recorder and from the handler's own trace spans (span.* entries, see
+RequestTrace in index.py). No network access is needed.
+
+    python benchmarks/handler_latency.py                      # run and print
+    python benchmarks/handler_latency.py --save-baseline      # refresh baseline.json
+    python benchmarks/handler_latency.py --compare            # fail on end-to-end/TTFT/TTFA p95 regressions
+
+Simulated latencies are multiplied by --time-scale (default 0.1) to keep the
+suite fast; reported numbers are converted back to simulated milliseconds.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Quiet, deterministic handler configuration; set before index is imported
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('METRICS_MODE', 'batch')
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+import index  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeBackend, FakeBedrockRuntime, FakeCloudWatch, FakeDynamoDB, FakeLambdaContext,
+    FakePolly, FakeS3, LatencyModel
+)
+
+CONTEXT_SOURCE_COUNTS = [0, 1, 2, 3]
+SENTENCE_COUNTS = [1, 3, 5, 10]
+COURSE_MATERIAL = (
+    "Unidad de física básica. La cinemática estudia el movimiento sin considerar sus causas. "
+    "La dinámica relaciona fuerzas y aceleraciones mediante las leyes de Newton. "
+    "La energía se conserva en sistemas aislados y se transforma entre formas cinéticas y potenciales. "
+) * 40
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def build_fakes(args, sentences: int) -> Dict[str, object]:
+    backend = FakeBackend(seed=args.seed, time_scale=args.time_scale)
+    jitter = args.jitter
+    fakes = {
+        'backend': backend,
+        'bedrock-runtime': FakeBedrockRuntime(
+            backend,
+            ttft=LatencyModel(args.bedrock_ttft_ms, args.bedrock_ttft_ms * jitter),
+            chunk_gap=LatencyModel(args.bedrock_chunk_gap_ms, args.bedrock_chunk_gap_ms * jitter),
+            chunk_chars=args.chunk_chars,
+            sentences=sentences
+        ),
+        'polly': FakePolly(backend, LatencyModel(args.polly_ms, args.polly_ms * jitter)),
+        's3': FakeS3(
+            backend,
+            get=LatencyModel(args.s3_get_ms, args.s3_get_ms * jitter),
+            put=LatencyModel(args.s3_put_ms, args.s3_put_ms * jitter),
+            head=LatencyModel(args.s3_get_ms / 2, args.s3_get_ms * jitter / 2)
+        ),
+        'dynamodb': FakeDynamoDB(backend, LatencyModel(args.dynamodb_ms, args.dynamodb_ms * jitter)),
+        'cloudwatch': FakeCloudWatch(backend, LatencyModel(args.s3_put_ms, 0, 'const'))
+    }
+    for i in range(3):
+        fakes['s3'].seed_object(f'courses/bench/material{i}.txt', COURSE_MATERIAL.encode('utf-8'))
+    return fakes
+
+
+def reset_container_state() -> None:
+    """
+    Drop warm-container caches so every iteration measures a cache-cold request
+    """
+    for cache in (index.tts_cache, index.context_cache, index.course_index_cache, index.response_cache.local):
+        with cache._lock:
+            cache._entries.clear()
+    index.circuit_breakers.clear()
+
+
+def run_scenario(args, sources: int, sentences: int) -> Dict[str, List[float]]:
+    fakes = build_fakes(args, sentences)
+    index._clients.clear()
+    index._clients.update({name: fake for name, fake in fakes.items() if name != 'backend'})
+    
+    samples: Dict[str, List[float]] = {}
+    scale = 1 / args.time_scale
+    for iteration in range(args.iterations):
+        if not args.warm:
+            reset_container_state()
+        fakes['bedrock-runtime'].nonce = iteration
+        fakes['backend'].recorder.reset()
+        event = {'body': json.dumps({
+            'audioData': 'UklGRg==' * 64,
+            'sessionId': f'bench-{sources}-{sentences}-{iteration}',
+            'courseId': '000000123',
+            'topic': 'Física',
+            'studentId': 'bench_student',
+            'contextSources': [f'courses/bench/material{i}.txt' for i in range(sources)],
+            'debug': True
+        })}
+        
+        started = time.perf_counter()
+        response = index.lambda_handler(event, FakeLambdaContext())
+        end_to_end_ms = (time.perf_counter() - started) * 1000
+        
+        body = json.loads(response['body'])
+        if not body.get('success'):
+            raise RuntimeError(f"Handler failed: {body}")
+        metadata = body['metadata']
+        
+        observed = {'end_to_end': end_to_end_ms}
+        observed.update(fakes['backend'].recorder.stage_wall_ms())
+        for key, name in (('timeToFirstTokenMs', 'ttft'), ('timeToFirstAudioMs', 'first_audio')):
+            if metadata.get(key) is not None:
+                observed[name] = metadata[key]
+        # Handler-side spans, summed per stage (e.g. span.TTSUnit over all units)
+        for name, stage in metadata['trace']['stages'].items():
+            observed[f'span.{name}'] = stage['totalMs']
+        for stage, value in observed.items():
+            samples.setdefault(stage, []).append(value * scale)
+    return samples
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        stage: {
+            'p50': round(percentile(values, 0.50), 1),
+            'p95': round(percentile(values, 0.95), 1),
+            'p99': round(percentile(values, 0.99), 1)
+        }
+        for stage, values in sorted(samples.items())
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float, min_delta_ms: float,
+            gate_stages: List[str]) -> List[str]:
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, stats in stages.items():
+            if gate_stages and stage not in gate_stages:
+                continue
+            reference = baseline.get(scenario, {}).get(stage)
+            if not reference or reference['p95'] <= 0:
+                continue
+            change = (stats['p95'] - reference['p95']) / reference['p95']
+            # Short stages are dominated by scheduler noise at small time scales
+            if change > tolerance and stats['p95'] - reference['p95'] > min_delta_ms:
+                regressions.append(
+                    f"{scenario} {stage}: p95 {reference['p95']:.1f} -> {stats['p95']:.1f} ms (+{change:.0%})"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--time-scale', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--jitter', type=float, default=0.3, help='standard deviation as a fraction of the mean')
+    parser.add_argument('--warm', action='store_true', help='keep container caches between iterations')
+    parser.add_argument('--bedrock-ttft-ms', type=float, default=450)
+    parser.add_argument('--bedrock-chunk-gap-ms', type=float, default=25)
+    parser.add_argument('--chunk-chars', type=int, default=12)
+    parser.add_argument('--polly-ms', type=float, default=180)
+    parser.add_argument('--s3-get-ms', type=float, default=35)
+    parser.add_argument('--s3-put-ms', type=float, default=45)
+    parser.add_argument('--dynamodb-ms', type=float, default=12)
+    parser.add_argument('--sources', type=int, nargs='*', default=CONTEXT_SOURCE_COUNTS)
+    parser.add_argument('--sentences', type=int, nargs='*', default=SENTENCE_COUNTS)
+    parser.add_argument('--json', help='write full results to this file')
+    parser.add_argument('--save-baseline', action='store_true', help=f'write results to {BASELINE_PATH}')
+    parser.add_argument('--compare', action='store_true', help='compare p95 against the saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.35, help='allowed p95 increase before failing')
+    parser.add_argument('--gate-stages', nargs='*', default=['end_to_end', 'ttft', 'first_audio'],
+                        help='stages checked by --compare (empty checks every stage)')
+    parser.add_argument('--min-delta-ms', type=float, default=100, help='ignore p95 increases smaller than this')
+    args = parser.parse_args()
+    
+    logging.getLogger().setLevel(logging.ERROR)
+    
+    results: Dict[str, Dict] = {}
+    for sources in args.sources:
+        for sentences in args.sentences:
+            scenario = f'sources={sources} sentences={sentences}'
+            results[scenario] = summarize(run_scenario(args, sources, sentences))
+            stats = results[scenario]
+            line = '  '.join(
+                f"{stage} {stats[stage]['p50']:.0f}/{stats[stage]['p95']:.0f}/{stats[stage]['p99']:.0f}"
+                for stage in ('end_to_end', 'ttft', 'first_audio', 'bedrock', 'polly', 's3_get', 's3_put')
+                if stage in stats
+            )
+            print(f"{scenario:<26} {line}")
+    print("(p50/p95/p99 in simulated ms)")
+    
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f"Baseline saved to {BASELINE_PATH}")
+    if args.compare:
+        with open(BASELINE_PATH) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_delta_ms, args.gate_stages)
+        if regressions:
+            print("p95 regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No p95 regressions against baseline")
+    
+    index.tts_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    main()
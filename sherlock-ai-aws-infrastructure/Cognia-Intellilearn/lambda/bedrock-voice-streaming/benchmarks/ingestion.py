@@ -0,0 +1,156 @@
+"""
+Audio ingestion benchmark: parse time and peak memory per upload path.
+
+Builds the same clip as each request shape the handler accepts and measures
+body parsing, validation and reading the audio out for transcription
+(parse_request_body, validate_input, iter_audio_chunks in index.py):
+
+    json_base64   base64 audioData inside a JSON body (previous path)
+    binary        raw audio body, base64-encoded by API Gateway (isBase64Encoded)
+    multipart     multipart/form-data body with an audio file part
+    s3_reference  JSON body with audioS3Key, audio read from the fake S3
+
+Peak memory is the tracemalloc high-water mark during one request, excluding
+the event itself. No network access is needed.
+
+    python benchmarks/ingestion.py
+    python benchmarks/ingestion.py --sizes 100000 700000 --iterations 50 --json ingestion.json
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.dirname(BENCH_DIR)
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('ENABLE_METRICS', 'false')
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+import index  # noqa: E402
+from fakes import FakeBackend, FakeS3, LatencyModel  # noqa: E402
+from handler_latency import percentile  # noqa: E402
+
+AUDIO_SIZES = [100_000, 500_000, 700_000]  # 700 KB is close to the JSON path's 1 MB base64 limit
+BOUNDARY = 'bench-boundary-7d3f'
+UPLOAD_KEY = index.AUDIO_UPLOAD_PREFIX + 'bench/clip.webm'
+
+
+def json_event(audio: bytes) -> Dict:
+    return {'body': json.dumps({
+        'audioData': base64.b64encode(audio).decode('ascii'), 'sessionId': 'bench-session', 'format': 'webm'
+    })}
+
+
+def binary_event(audio: bytes) -> Dict:
+    return {
+        'body': base64.b64encode(audio).decode('ascii'),
+        'isBase64Encoded': True,
+        'headers': {'content-type': 'audio/webm'},
+        'queryStringParameters': {'sessionId': 'bench-session'}
+    }
+
+
+def multipart_event(audio: bytes) -> Dict:
+    body = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="sessionId"\r\n\r\nbench-session\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="audio"; filename="clip.webm"\r\n'
+        f'Content-Type: audio/webm\r\n\r\n'
+    ).encode('ascii') + audio + f'\r\n--{BOUNDARY}--\r\n'.encode('ascii')
+    return {
+        'body': base64.b64encode(body).decode('ascii'),
+        'isBase64Encoded': True,
+        'headers': {'content-type': f'multipart/form-data; boundary={BOUNDARY}'}
+    }
+
+
+def s3_event(audio: bytes) -> Dict:
+    index._clients['s3'].seed_object(UPLOAD_KEY, audio)
+    return {'body': json.dumps({'audioS3Key': UPLOAD_KEY, 'sessionId': 'bench-session', 'format': 'webm'})}
+
+
+PATHS: Dict[str, Callable[[bytes], Dict]] = {
+    'json_base64': json_event,
+    'binary': binary_event,
+    'multipart': multipart_event,
+    's3_reference': s3_event
+}
+
+
+def ingest(event: Dict) -> int:
+    """
+    The handler's ingestion steps up to the audio reaching transcription
+    """
+    body = index.parse_request_body(event)
+    if index.validate_input(body, 'bench'):
+        raise RuntimeError(f"Rejected benchmark request: {sorted(body)}")
+    audio_data = body.get('audioData') or index.fetch_uploaded_audio(body['audioS3Key'], 'bench')
+    return sum(len(chunk) for chunk in index.iter_audio_chunks(audio_data))
+
+
+def run_path(path: str, size: int, iterations: int) -> Dict[str, float]:
+    audio = os.urandom(size)
+    event = PATHS[path](audio)
+    event_bytes = len(event['body'])
+    timings: List[float] = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        decoded = ingest(event)
+        timings.append((time.perf_counter() - started) * 1000)
+    if decoded != size:
+        raise RuntimeError(f"{path}: decoded {decoded} bytes, expected {size}")
+    
+    tracemalloc.start()
+    ingest(event)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'eventBytes': event_bytes,
+        'p50Ms': round(percentile(timings, 0.50), 3),
+        'p95Ms': round(percentile(timings, 0.95), 3),
+        'peakBytes': peak,
+        'peakPerAudioByte': round(peak / size, 2)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='*', default=AUDIO_SIZES, help='decoded audio bytes')
+    parser.add_argument('--paths', nargs='*', default=list(PATHS), choices=list(PATHS))
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--json', help='write full results to this file')
+    args = parser.parse_args()
+    
+    logging.getLogger().setLevel(logging.ERROR)
+    # S3 latency is left out so only parsing and copying are measured
+    no_latency = LatencyModel(0, 0, 'const')
+    index._clients['s3'] = FakeS3(FakeBackend(time_scale=0), get=no_latency, put=no_latency, head=no_latency)
+    
+    results: Dict[str, Dict] = {}
+    print(f"{'scenario':<28}{'event KB':>10}{'p50 ms':>9}{'p95 ms':>9}{'peak KB':>10}{'peak/audio':>12}")
+    for size in args.sizes:
+        for path in args.paths:
+            scenario = f'{path} size={size}'
+            stats = results[scenario] = run_path(path, size, args.iterations)
+            print(
+                f"{scenario:<28}{stats['eventBytes'] / 1000:>10.0f}{stats['p50Ms']:>9.2f}{stats['p95Ms']:>9.2f}"
+                f"{stats['peakBytes'] / 1000:>10.0f}{stats['peakPerAudioByte']:>12.2f}"
+            )
+    
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    
+    index.tts_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    main()
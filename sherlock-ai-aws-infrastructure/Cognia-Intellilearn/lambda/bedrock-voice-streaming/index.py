@@ -1,51 +1,570 @@
 import json
-import boto3
+import sys
 import base64
+import binascii
+import gzip
+import codecs
+import queue
 import os
 import uuid
 import re
+import time
+import random
+import threading
+import hashlib
+import heapq
+import math
+import unicodedata
+from collections import OrderedDict, Counter, deque
 from datetime import datetime
-from typing import Dict, Any, List, Optional
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Callable, Union
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 import logging
+from abc import ABC, abstractmethod
 
 # Configure logging with structured format
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-# Initialize AWS clients with error handling
-try:
-    bedrock_client = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-    s3_client = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-    dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-    cloudwatch = boto3.client('cloudwatch', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-    polly_client = boto3.client('polly', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-except Exception as e:
-    logger.error(f"Failed to initialize AWS clients: {e}")
-    raise
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 # Environment variables with defaults
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '10'))
+BEDROCK_READ_TIMEOUT = float(os.environ.get('BEDROCK_READ_TIMEOUT', '60'))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+# Container-lived circuit breakers per dependency (Polly, S3, each Bedrock tier)
+ENABLE_CIRCUIT_BREAKERS = os.environ.get('ENABLE_CIRCUIT_BREAKERS', 'true').lower() == 'true'
+BREAKER_WINDOW = int(os.environ.get('BREAKER_WINDOW', '20'))  # most recent calls considered
+BREAKER_MIN_CALLS = int(os.environ.get('BREAKER_MIN_CALLS', '5'))
+BREAKER_FAILURE_RATE = float(os.environ.get('BREAKER_FAILURE_RATE', '0.5'))  # errors and slow calls
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '15'))
+BREAKER_HALF_OPEN_CALLS = int(os.environ.get('BREAKER_HALF_OPEN_CALLS', '2'))  # trial calls before closing
+POLLY_SLOW_CALL_MS = int(os.environ.get('POLLY_SLOW_CALL_MS', '3000'))
+S3_SLOW_CALL_MS = int(os.environ.get('S3_SLOW_CALL_MS', '1500'))
+DEPENDENCY_FAILURE_CODES = frozenset((
+    '500', '502', '503', '504', 'InternalError', 'InternalFailure', 'InternalServerError',
+    'InternalServerException', 'ServiceUnavailable', 'ServiceUnavailableException', 'ServiceFailureException',
+    'SlowDown', 'RequestTimeout', 'RequestTimeoutException', 'ModelTimeoutException', 'ModelNotReadyException',
+    'ThrottlingException', 'Throttling', 'TooManyRequestsException'
+))
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'cognia-intellilearn')
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'intellilearn_Data')
 MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+MAX_TOKENS = int(os.environ.get('MAX_TOKENS', '1000'))
+TEMPERATURE = float(os.environ.get('TEMPERATURE', '0.7'))
+TOP_P = float(os.environ.get('TOP_P', '0.9'))
+# Model tiers, preferred first, as a JSON list of
+# {"name", "modelId", "maxTokens", "ttftMs", "tokensPerSecond", "prefillMsPer1kTokens"};
+# unset means BEDROCK_MODEL_ID alone, always with MAX_TOKENS
+MODEL_TIERS = os.environ.get('MODEL_TIERS', '')
+LATENCY_SLO_MS = int(os.environ.get('LATENCY_SLO_MS', '8000'))  # request start to last token
+TTFT_FALLBACK_MS = int(os.environ.get('TTFT_FALLBACK_MS', '3000'))
+MIN_RESPONSE_TOKENS = int(os.environ.get('MIN_RESPONSE_TOKENS', '150'))
+MAX_TOKENS_STEP = 50  # SLO-sized max_tokens are rounded down to a multiple of this
+MODEL_STATS_ALPHA = float(os.environ.get('MODEL_STATS_ALPHA', '0.2'))
+MODEL_THROTTLE_COOLDOWN_SECONDS = int(os.environ.get('MODEL_THROTTLE_COOLDOWN_SECONDS', '30'))
+THROTTLING_ERROR_CODES = (
+    'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException', 'ModelNotReadyException'
+)
 DEFAULT_TTL_DAYS = int(os.environ.get('TTL_DAYS', '30'))
 MAX_CONTEXT_SOURCES = int(os.environ.get('MAX_CONTEXT_SOURCES', '3'))
 MAX_CONTEXT_LENGTH = int(os.environ.get('MAX_CONTEXT_LENGTH', '500'))
 API_KEY = os.environ.get('API_KEY', '')
 ENABLE_METRICS = os.environ.get('ENABLE_METRICS', 'true').lower() == 'true'
+METRICS_MODE = os.environ.get('METRICS_MODE', 'emf')  # 'emf' log lines or one 'batch' put_metric_data
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CognIA/VoiceStreaming')
+# Per-stage timing spans in the response metadata (also enabled per request with "debug": true)
+ENABLE_TRACE_METADATA = os.environ.get('ENABLE_TRACE_METADATA', 'false').lower() == 'true'
+# Fraction of requests whose per-chunk and per-TTS detail is logged at INFO (always at DEBUG)
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+ENVIRONMENT = os.environ.get('ENVIRONMENT', 'production')
+ENABLE_PIPELINED_TTS = os.environ.get('ENABLE_PIPELINED_TTS', 'true').lower() == 'true'
+
+TTS_MAX_WORKERS = max(1, int(os.environ.get('TTS_MAX_WORKERS', '4')))
+POLLY_MAX_CONCURRENCY = max(1, int(os.environ.get('POLLY_MAX_CONCURRENCY', str(TTS_MAX_WORKERS))))
+
+ENABLE_TTS_CACHE = os.environ.get('ENABLE_TTS_CACHE', 'true').lower() == 'true'
+TTS_CACHE_MAX_ENTRIES = int(os.environ.get('TTS_CACHE_MAX_ENTRIES', '2048'))
+TTS_CACHE_PREFIX = os.environ.get('TTS_CACHE_PREFIX', 'AIContent/TTSCache')
+# 'units' uploads one mp3 per synthesis unit; 'single' joins an answer's units into one mp3
+# plus a byte-range manifest (units stay in memory, so the per-unit TTS cache is not used)
+AUDIO_ASSEMBLY = os.environ.get('AUDIO_ASSEMBLY', 'units')
+# Polly output profiles chosen per request ('audioProfile') or per client ('clientType');
+# AUDIO_PROFILES (JSON object) adds or overrides entries of DEFAULT_AUDIO_PROFILES
+AUDIO_PROFILES = os.environ.get('AUDIO_PROFILES', '')
+DEFAULT_AUDIO_PROFILE = os.environ.get('DEFAULT_AUDIO_PROFILE', 'standard')
+AUDIO_PROFILE_BY_CLIENT = os.environ.get('AUDIO_PROFILE_BY_CLIENT', '{"mobile": "mobile"}')
+DEFAULT_AUDIO_PROFILES = {
+    'standard': {'outputFormat': 'mp3', 'sampleRate': '24000', 'engine': 'neural'},
+    'mobile': {'outputFormat': 'mp3', 'sampleRate': '16000', 'engine': 'neural'},
+    # Smallest output, for clients that can play Ogg Vorbis (not every mobile browser can)
+    'ogg_vorbis': {'outputFormat': 'ogg_vorbis', 'sampleRate': '16000', 'engine': 'neural'},
+    'economy': {'outputFormat': 'mp3', 'sampleRate': '22050', 'engine': 'standard'}
+}
+# Polly OutputFormat -> (ContentType, file extension)
+AUDIO_FORMATS = {
+    'mp3': ('audio/mpeg', 'mp3'),
+    'ogg_vorbis': ('audio/ogg', 'ogg'),
+    'pcm': ('audio/L16', 'pcm')
+}
+POLLY_SAMPLE_RATES = {'mp3': ('8000', '16000', '22050', '24000'), 'ogg_vorbis': ('8000', '16000', '22050', '24000'), 'pcm': ('8000', '16000')}
+POLLY_ENGINES = ('standard', 'neural', 'long-form', 'generative')
+# Units up to this size are returned base64 in the response and uploaded off the response path (0 disables)
+AUDIO_INLINE_MAX_BYTES = int(os.environ.get('AUDIO_INLINE_MAX_BYTES', '0'))
+AUDIO_INLINE_MAX_TOTAL_BYTES = int(os.environ.get('AUDIO_INLINE_MAX_TOTAL_BYTES', '1048576'))  # per response, before base64
+# Expected S3 upload time for one unit until this container has measured its own
+AUDIO_UPLOAD_PRIOR_MS = float(os.environ.get('AUDIO_UPLOAD_PRIOR_MS', '60'))
+CONTEXT_FETCH_WORKERS = max(1, int(os.environ.get('CONTEXT_FETCH_WORKERS', str(MAX_CONTEXT_SOURCES))))
+CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get('CONTEXT_CACHE_MAX_ENTRIES', '256'))
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get('CONTEXT_CACHE_TTL_SECONDS', '300'))
+ENABLE_CONTEXT_RANKING = os.environ.get('ENABLE_CONTEXT_RANKING', 'true').lower() == 'true'
+CONTEXT_INDEX_MAX_BYTES = int(os.environ.get('CONTEXT_INDEX_MAX_BYTES', '2000000'))
+CONTEXT_INDEX_MAX_ENTRIES = int(os.environ.get('CONTEXT_INDEX_MAX_ENTRIES', '16'))
+CONTEXT_PASSAGE_WORDS = int(os.environ.get('CONTEXT_PASSAGE_WORDS', '80'))
+CONTEXT_TOP_K = int(os.environ.get('CONTEXT_TOP_K', '4'))
+CONTEXT_BUDGET_CHARS = int(os.environ.get('CONTEXT_BUDGET_CHARS', '1000'))
+# Distinct query terms looked up per search; each one walks a postings list
+CONTEXT_QUERY_MAX_TERMS = int(os.environ.get('CONTEXT_QUERY_MAX_TERMS', '24'))
+PROMPT_INPUT_TOKEN_BUDGET = int(os.environ.get('PROMPT_INPUT_TOKEN_BUDGET', '600'))
+PROMPT_CHARS_PER_TOKEN = float(os.environ.get('PROMPT_CHARS_PER_TOKEN', '3.5'))  # Spanish text with Claude tokenizers
+PROMPT_HISTORY_SHARE = float(os.environ.get('PROMPT_HISTORY_SHARE', '0.35'))  # of the budget left after the template
+PROMPT_HISTORY_MAX_TURNS = int(os.environ.get('PROMPT_HISTORY_MAX_TURNS', '8'))
+PROMPT_HISTORY_MAX_CHARS = int(os.environ.get('PROMPT_HISTORY_MAX_CHARS', '2000'))  # per turn
+# Mark the constant system prompt as a Bedrock prompt-cache checkpoint (model must support caching)
+ENABLE_PROMPT_CACHING = os.environ.get('ENABLE_PROMPT_CACHING', 'false').lower() == 'true'
+# Cache reads bill at 10% of the input rate and cache writes at 125%
+PROMPT_CACHE_READ_COST = 0.1
+PROMPT_CACHE_WRITE_COST = 1.25
+ENABLE_RESPONSE_CACHE = os.environ.get('ENABLE_RESPONSE_CACHE', 'false').lower() == 'true'
+RESPONSE_CACHE_STORE = os.environ.get('RESPONSE_CACHE_STORE', 'dynamodb')
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '3600'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+# The audio size placeholder in the user message changes with every recording but not the answer
+AUDIO_SIZE_REFERENCE = re.compile(r'Audio procesado: \d+ (?:caracteres de datos de audio|bytes de audio)')
+PERSIST_MODE = os.environ.get('PERSIST_MODE', 'sync')  # 'sync' or 'write_behind'
+PERSIST_MAX_WORKERS = max(1, int(os.environ.get('PERSIST_MAX_WORKERS', '3')))
+PERSIST_MAX_PENDING = max(1, int(os.environ.get('PERSIST_MAX_PENDING', '32')))
+PERSIST_MAX_RETRIES = int(os.environ.get('PERSIST_MAX_RETRIES', '3'))
+PERSIST_RETRY_BASE_MS = int(os.environ.get('PERSIST_RETRY_BASE_MS', '50'))
+PERSIST_FLUSH_TIMEOUT_MS = int(os.environ.get('PERSIST_FLUSH_TIMEOUT_MS', '5000'))
+# 'legacy' writes prompt JSON, text output and a DynamoDB item per session;
+# 'compact' writes one gzipped session record and a DynamoDB pointer to it
+ARTIFACT_FORMAT = os.environ.get('ARTIFACT_FORMAT', 'legacy')
+ARTIFACT_PREFIX = os.environ.get('ARTIFACT_PREFIX', 'AIContent/Sessions')
+ARTIFACT_COMPRESSION_LEVEL = int(os.environ.get('ARTIFACT_COMPRESSION_LEVEL', '6'))
+ARTIFACT_VERSION = 1
+# Deadline budgets, carved out of context.get_remaining_time_in_millis() capped at DEADLINE_MAX_MS:
+# API Gateway answers 504 after 30 s however long the Lambda timeout is (0 disables the cap)
+DEADLINE_MAX_MS = int(os.environ.get('DEADLINE_MAX_MS', '29000'))
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', '500'))  # stream_end and response
+DEADLINE_CONTEXT_MAX_MS = int(os.environ.get('DEADLINE_CONTEXT_MAX_MS', '3000'))
+# Stage reserves are shares of the budget, at most the *_MS values
+DEADLINE_GENERATION_MIN_SHARE = float(os.environ.get('DEADLINE_GENERATION_MIN_SHARE', '0.07'))
+DEADLINE_GENERATION_MIN_MS = int(os.environ.get('DEADLINE_GENERATION_MIN_MS', '2000'))
+DEADLINE_TTS_RESERVE_SHARE = float(os.environ.get('DEADLINE_TTS_RESERVE_SHARE', '0.1'))  # left after generation
+DEADLINE_TTS_RESERVE_MS = int(os.environ.get('DEADLINE_TTS_RESERVE_MS', '3000'))
+DEADLINE_PERSIST_RESERVE_SHARE = float(os.environ.get('DEADLINE_PERSIST_RESERVE_SHARE', '0.035'))  # left after TTS
+DEADLINE_PERSIST_RESERVE_MS = int(os.environ.get('DEADLINE_PERSIST_RESERVE_MS', '1000'))
+DEADLINE_TTS_UNIT_MIN_MS = int(os.environ.get('DEADLINE_TTS_UNIT_MIN_MS', '700'))  # to start another unit
+DEADLINE_TRANSCRIPTION_MAX_MS = int(os.environ.get('DEADLINE_TRANSCRIPTION_MAX_MS', '4000'))
+# Speech-to-text for audioData: 'none', 'transcribe' (Amazon Transcribe streaming, needs the
+# amazon-transcribe package) or 'local' (deterministic stand-in for tests and local runs)
+TRANSCRIPTION_ENGINE = os.environ.get('TRANSCRIPTION_ENGINE', 'none')
+TRANSCRIPTION_CHUNK_BYTES = max(3, int(os.environ.get('TRANSCRIPTION_CHUNK_BYTES', '8192')))  # decoded bytes per chunk
+TRANSCRIPTION_LANGUAGE = os.environ.get('TRANSCRIPTION_LANGUAGE', 'es-ES')
+TRANSCRIPTION_SAMPLE_RATE = int(os.environ.get('TRANSCRIPTION_SAMPLE_RATE', '16000'))
+TRANSCRIPT_MAX_CHARS = int(os.environ.get('TRANSCRIPT_MAX_CHARS', '1000'))
+# audioData format -> Amazon Transcribe media encoding (it cannot read WebM)
+TRANSCRIBE_MEDIA_ENCODINGS = {'pcm': 'pcm', 'ogg': 'ogg-opus', 'opus': 'ogg-opus', 'flac': 'flac'}
+# Audio can also arrive as a raw binary or multipart/form-data body, or as audioS3Key naming
+# an object the client uploaded under AUDIO_UPLOAD_PREFIX with a presigned URL
+AUDIO_MAX_BYTES = int(os.environ.get('AUDIO_MAX_BYTES', '4000000'))  # decoded audio for those paths
+AUDIO_UPLOAD_PREFIX = os.environ.get('AUDIO_UPLOAD_PREFIX', 'AIContent/AudioUploads/')
+MULTIPART_FIELDS_MAX_BYTES = 65536  # allowance for form fields and part headers
+BASE64_DECODE_STEP = 16384  # base64 characters decoded per slice; a multiple of 4
+# Request media type -> the audioData format name used by transcription
+AUDIO_MEDIA_FORMATS = {
+    'audio/webm': 'webm', 'audio/ogg': 'ogg', 'audio/opus': 'opus', 'audio/flac': 'flac', 'audio/x-flac': 'flac',
+    'audio/l16': 'pcm', 'audio/pcm': 'pcm', 'audio/wav': 'wav', 'audio/x-wav': 'wav', 'audio/mpeg': 'mp3'
+}
+# Fields that forms and query strings carry JSON-encoded
+FORM_JSON_FIELDS = ('contextSources', 'history', 'debug')
+CLOUDFRONT_URL = os.environ.get('CLOUDFRONT_URL', 'https://d2sn3lk5751y3y.cloudfront.net')
+
+TTS_UNIT_TARGET_CHARS = int(os.environ.get('TTS_UNIT_TARGET_CHARS', '250'))
+TTS_UNIT_MAX_CHARS = int(os.environ.get('TTS_UNIT_MAX_CHARS', '1500'))  # Polly accepts up to 3000
+TTS_FIRST_UNIT_MIN_CHARS = int(os.environ.get('TTS_FIRST_UNIT_MIN_CHARS', '20'))
+
+SENTENCE_TERMINATORS = '.!?…'
+SENTENCE_CLOSERS = '"\'»”’)]'
+INVERTED_MARKS = '¿¡'
+# Abbreviations that never end a sentence. "etc." is left out on purpose: followed by a
+# capitalised word it ends the sentence, and a lowercase continuation already keeps it going.
+ABBREVIATIONS = frozenset("""
+sr sra srta sres dr dra dres lic ing arq prof profa pág pag págs núm num art cap caps vol ej p.ej
+aprox approx ee.uu uu ud uds vd vds vs av avda dpto depto fig min máx mín max cía gral mr mrs ms e.g i.e a.c d.c
+""".split())
+
+# Persona and instructions shared by every request; kept byte-for-byte constant so
+# the provider can cache it. Per-request content goes in the user message.
+SYSTEM_PROMPT = """Eres CognIA, un asistente educativo inteligente especializado en aprendizaje interactivo y personalizado.
+
+📚 INSTRUCCIONES:
+1. Responde como profesor experto en el tema indicado en el contexto educativo
+2. Usa el material de referencia cuando sea relevante
+3. Mantén respuestas conversacionales (máximo 3 oraciones)
+4. Haz preguntas para mantener engagement
+5. Adapta el nivel según las respuestas
+6. Usa tono amigable y profesional
+
+🚀 RESPUESTA:
+Saluda y pregunta específicamente qué aspecto del tema quiere explorar."""
+SYSTEM_PROMPT_FIELD: Any = (
+    [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+    if ENABLE_PROMPT_CACHING else SYSTEM_PROMPT
+)
+
+# AWS clients are created on first use so OPTIONS and stop_session skip boto3 entirely
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+def client_pool_size(service: str) -> int:
+    """
+    Connection pool size matched to the workers that share each client
+    """
+    pool_sizes = {
+        's3': TTS_MAX_WORKERS + CONTEXT_FETCH_WORKERS + PERSIST_MAX_WORKERS,
+        'polly': POLLY_MAX_CONCURRENCY,
+        'dynamodb': PERSIST_MAX_WORKERS + 1,
+        'bedrock-runtime': 2,
+        'cloudwatch': 1
+    }
+    return max(2, pool_sizes.get(service, 10))
+
+def client_config(service: str):
+    """
+    Explicit botocore config: pool size, keep-alive, adaptive retries and timeouts
+    """
+    from botocore.config import Config
+    return Config(
+        region_name=AWS_REGION,
+        max_pool_connections=client_pool_size(service),
+        tcp_keepalive=True,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT if service == 'bedrock-runtime' else AWS_READ_TIMEOUT,
+        retries={'mode': 'adaptive', 'total_max_attempts': AWS_MAX_ATTEMPTS}
+    )
+
+def get_aws_client(service: str):
+    """
+    Return the memoized client (or DynamoDB resource) for a service, creating it on first use
+    """
+    client = _clients.get(service)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(service)
+        if client is None:
+            try:
+                import boto3
+                if service == 'dynamodb':
+                    client = boto3.resource('dynamodb', config=client_config(service))
+                else:
+                    client = boto3.client(service, config=client_config(service))
+            except Exception as e:
+                logger.error("Failed to initialize AWS client %s: %s", service, e)
+                raise
+            _clients[service] = client
+    return client
+
+def aws_error_code(error: Exception) -> Optional[str]:
+    """
+    Error code of a botocore ClientError, without importing botocore
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code')
+    return None
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit breaker is open
+    """
+
+class CircuitBreaker:
+    """
+    Container-lived breaker for one dependency. Opens when errors and calls slower than
+    slow_call_ms reach BREAKER_FAILURE_RATE of the last BREAKER_WINDOW calls, fails fast
+    for BREAKER_OPEN_SECONDS, then lets BREAKER_HALF_OPEN_CALLS trial calls through.
+    Client errors (4xx) count as healthy answers; error codes in ignored_codes are not counted.
+    """
+    
+    STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+    
+    def __init__(self, name: str, slow_call_ms: Optional[float] = None, ignored_codes: Tuple[str, ...] = ()):
+        self.name = name
+        self.slow_call_ms = slow_call_ms
+        self.ignored_codes = ignored_codes
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.outcomes: deque = deque(maxlen=BREAKER_WINDOW)
+        self.rejected = 0
+        self.latency_ms: Optional[float] = None
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open':
+                if time.time() - self.opened_at < BREAKER_OPEN_SECONDS:
+                    self.rejected += 1
+                    return False
+                self.state = 'half_open'
+                self._trials_in_flight = 0
+                self._trial_successes = 0
+                logger.warning("Circuit %s half-open, sending trial calls", self.name)
+            if self.state == 'half_open':
+                if self._trials_in_flight >= BREAKER_HALF_OPEN_CALLS:
+                    self.rejected += 1
+                    return False
+                self._trials_in_flight += 1
+            return True
+    
+    def record(self, failed: Optional[bool], duration_ms: float = 0.0) -> None:
+        """
+        Record a call outcome; failed=None releases a trial slot without counting the call
+        """
+        if failed is not None and self.slow_call_ms is not None and duration_ms > self.slow_call_ms:
+            failed = True
+        with self._lock:
+            if failed is not None:
+                self.latency_ms = duration_ms if self.latency_ms is None else 0.2 * duration_ms + 0.8 * self.latency_ms
+            if self.state == 'half_open':
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+                if failed:
+                    self._open()
+                elif failed is False:
+                    self._trial_successes += 1
+                    if self._trial_successes >= BREAKER_HALF_OPEN_CALLS:
+                        self.state = 'closed'
+                        self.outcomes.clear()
+                        logger.warning("Circuit %s closed", self.name)
+                return
+            if failed is None:
+                return
+            self.outcomes.append(failed)
+            if (
+                self.state == 'closed'
+                and len(self.outcomes) >= BREAKER_MIN_CALLS
+                and sum(self.outcomes) / len(self.outcomes) >= BREAKER_FAILURE_RATE
+            ):
+                self._open()
+    
+    def is_open(self) -> bool:
+        """
+        True while calls would be rejected; unlike allow(), takes no trial slot
+        """
+        with self._lock:
+            return self.state == 'open' and time.time() - self.opened_at < BREAKER_OPEN_SECONDS
+    
+    def _open(self) -> None:
+        self.state = 'open'
+        self.opened_at = time.time()
+        self.outcomes.clear()
+        logger.warning("Circuit %s opened for %.0fs", self.name, BREAKER_OPEN_SECONDS)
+    
+    def call(self, operation: Callable, *args, **kwargs) -> Any:
+        """
+        Run operation through the breaker, raising CircuitOpenError while it is open
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        started = time.perf_counter()
+        try:
+            result = operation(*args, **kwargs)
+        except Exception as e:
+            error_code = aws_error_code(e)
+            failed = None if error_code in self.ignored_codes else (error_code is None or error_code in DEPENDENCY_FAILURE_CODES)
+            self.record(failed, (time.perf_counter() - started) * 1000)
+            raise
+        self.record(False, (time.perf_counter() - started) * 1000)
+        return result
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'failureRate': round(sum(self.outcomes) / len(self.outcomes), 3) if self.outcomes else 0.0,
+                'calls': len(self.outcomes),
+                'latencyMs': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+                'rejected': self.rejected
+            }
+
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Breaker for 'polly', 's3' or 'bedrock:<tier>', created on first use
+    """
+    breaker = circuit_breakers.get(name)
+    if breaker is None:
+        with circuit_breakers_lock:
+            breaker = circuit_breakers.get(name)
+            if breaker is None:
+                if name == 'polly':
+                    breaker = CircuitBreaker(name, POLLY_SLOW_CALL_MS)
+                elif name == 's3':
+                    breaker = CircuitBreaker(name, S3_SLOW_CALL_MS)
+                else:
+                    # TTFT is handled by the model router; throttling by tier fallback
+                    breaker = CircuitBreaker(name, ignored_codes=THROTTLING_ERROR_CODES)
+                circuit_breakers[name] = breaker
+    return breaker
+
+def guarded_call(dependency: str, operation: Callable, *args, **kwargs) -> Any:
+    """
+    Call a dependency through its circuit breaker (directly when breakers are disabled)
+    """
+    if not ENABLE_CIRCUIT_BREAKERS:
+        return operation(*args, **kwargs)
+    return get_circuit_breaker(dependency).call(operation, *args, **kwargs)
+
+def dependency_open(dependency: str) -> bool:
+    """
+    True when the dependency's breaker is open, so work that ends in a call to it can be skipped
+    """
+    return ENABLE_CIRCUIT_BREAKERS and get_circuit_breaker(dependency).is_open()
+
+def s3_call(method: str, **kwargs) -> Any:
+    return guarded_call('s3', getattr(get_aws_client('s3'), method), **kwargs)
+
+def send_breaker_metrics(course_id: str) -> None:
+    """
+    Report each breaker's state (0 closed, 1 half-open, 2 open) as <Dependency>BreakerState
+    """
+    for name, breaker in list(circuit_breakers.items()):
+        metric_prefix = ''.join(part[:1].upper() + part[1:] for part in re.split(r'[^A-Za-z0-9]+', name))
+        send_metric(f"{metric_prefix}BreakerState", CircuitBreaker.STATE_VALUES[breaker.state], course_id, 'None')
+
+def degraded_dependencies() -> List[str]:
+    return sorted(name for name, breaker in circuit_breakers.items() if breaker.state != 'closed')
+
+# Synthesis stage executor, kept alive across warm invocations
+tts_executor = ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS, thread_name_prefix='tts')
+# Caps in-flight synthesize_speech calls to stay under the Polly TPS quota
+polly_semaphore = threading.BoundedSemaphore(POLLY_MAX_CONCURRENCY)
+# Context source executor for concurrent ranged GETs
+context_executor = ThreadPoolExecutor(max_workers=CONTEXT_FETCH_WORKERS, thread_name_prefix='context')
+
+class LRUCache:
+    """
+    Thread-safe LRU cache, kept at module level so it survives warm invocations
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+    
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Content-addressed TTS cache: hash of text and voice settings -> CloudFront URL
+tts_cache = LRUCache(TTS_CACHE_MAX_ENTRIES)
+tts_cache_stats = {'memoryHits': 0, 's3Hits': 0, 'misses': 0}
+tts_cache_stats_lock = threading.Lock()
+# Smoothed audio upload latency, used to estimate what inlining saves
+audio_upload_stats = {'uploads': 0, 'ewmaMs': 0.0}
+audio_upload_stats_lock = threading.Lock()
+
+# Compressed context snippets: source path -> {'snippet', 'etag', 'fetchedAt'}
+context_cache = LRUCache(CONTEXT_CACHE_MAX_ENTRIES)
+# Per-course passage indexes: course and sources -> {'index', 'etags', 'builtAt'}
+course_index_cache = LRUCache(CONTEXT_INDEX_MAX_ENTRIES)
+
+STOPWORDS = frozenset("""
+a al algo como con de del el ella en es esta este eso esto la las le les lo los mas me mi no o para
+pero por que se si sin sobre su sus te tu un una uno unos unas y ya
+an and are as at be by for from how in is it of on or that the this to was what with
+""".split())
+ACCENT_FOLDING = str.maketrans('áàâäãéèêëíìîïóòôöõúùûüñç', 'aaaaaeeeeiiiiooooouuuunc')
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
 
 def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
     """
     Production-ready AWS Lambda handler for Bedrock voice streaming with AI Content architecture
+    Returns every event in one buffered JSON body
+    """
+    return process_voice_request(event, context, BufferedEventSink())
+
+def streaming_handler(event: Dict[str, Any], response_stream, context) -> None:
+    """
+    Response-streaming entry point (function URL with InvokeMode RESPONSE_STREAM)
+    Writes newline-delimited JSON events to response_stream as they are produced:
+    transcription, each ai_response delta, each audio_segment, then stream_end
+    """
+    process_voice_request(event, context, StreamingEventSink(response_stream))
+
+def process_voice_request(event: Dict[str, Any], context, sink: 'BufferedEventSink') -> Dict[str, Any]:
+    """
+    Run a voice streaming request, emitting its events to the given sink
+    The client is answered before pending writes and metrics are flushed
     """
     # Generate unique request ID for tracing
     request_id = str(uuid.uuid4())
+    trace = RequestTrace(request_id, time.perf_counter())
+    deadline = Deadline.from_context(context)
+    result = None
     
+    try:
+        result = handle_voice_request(event, sink, trace, deadline)
+        return result
+    
+    finally:
+        sink.finish(result)
+        # Finish write-behind saves before the invocation freezes (or times out)
+        flush_timeout = deadline.timeout(cap_ms=PERSIST_FLUSH_TIMEOUT_MS)
+        persistence_queue.flush(flush_timeout, request_id)
+        # One batch per request, emitted off the response path
+        trace.log_summary(result)
+        if ENABLE_METRICS:
+            trace.send_metrics()
+            if ENABLE_CIRCUIT_BREAKERS:
+                send_breaker_metrics(trace.course_id)
+            metrics_buffer.flush()
+
+def handle_voice_request(
+    event: Dict[str, Any], sink: 'BufferedEventSink', trace: 'RequestTrace', deadline: 'Deadline'
+) -> Dict[str, Any]:
+    """
+    Validate the request, generate the answer and its audio, and build the response
+    Stage timings are recorded as spans on the request trace. Each stage runs within
+    its share of the deadline; when time runs out, generation is cut short and
+    remaining TTS units are dropped so a partial stream_end is still sent.
+    """
+    request_id = trace.request_id
+    request_started = trace.started
     # Extract origin for CORS
     origin = event.get("headers", {}).get("origin", "https://d2sn3lk5751y3y.cloudfront.net")
     
     try:
-        logger.info(f"[{request_id}] Starting voice streaming request")
+        logger.debug("[%s] Starting voice streaming request", request_id)
         
         # Handle CORS preflight (API Gateway v2 format)
         http_method = event.get('httpMethod') or event.get('requestContext', {}).get('http', {}).get('method')
@@ -55,183 +574,400 @@ def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         # Simple token validation for voice streaming
         auth_header = event.get('headers', {}).get('authorization', '')
         if not auth_header or not auth_header.startswith('Bearer '):
-            logger.info(f"[{request_id}] No authorization header, allowing request for voice streaming")
+            logger.debug("[%s] No authorization header, allowing request for voice streaming", request_id)
         else:
-            logger.info(f"[{request_id}] Authorization header present: {auth_header[:20]}...")
+            logger.debug("[%s] Authorization header present: %.20s...", request_id, auth_header)
         
         # Parse and validate request body
+        validation_started = time.perf_counter()
         try:
-            if 'body' in event:
-                body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-            else:
-                body = event
+            body = parse_request_body(event)
         except json.JSONDecodeError as e:
-            logger.error(f"[{request_id}] Invalid JSON in request body: {e}")
+            logger.error("[%s] Invalid JSON in request body: %s", request_id, e)
             return create_error_response(400, "Invalid JSON format", request_id, origin)
+        except PayloadTooLargeError as e:
+            return create_error_response(413, str(e), request_id, origin)
+        except ValueError as e:
+            logger.error("[%s] Invalid request body: %s", request_id, e)
+            return create_error_response(400, str(e), request_id, origin)
         
         # Robust input validation
         validation_error = validate_input(body, request_id, origin)
+        trace.record('Validation', validation_started, valid=validation_error is None)
         if validation_error:
             return validation_error
         
         # Extract validated payload
-        audio_data = body['audioData']
+        audio_data = body.get('audioData')
+        if not audio_data:
+            try:
+                audio_data = fetch_uploaded_audio(body['audioS3Key'], request_id, trace)
+            except PayloadTooLargeError as e:
+                return create_error_response(413, str(e), request_id, origin)
+            except Exception as e:
+                logger.warning("[%s] Could not read uploaded audio %s: %s", request_id, body['audioS3Key'], e)
+                if aws_error_code(e) in ('404', 'NoSuchKey', 'NotFound'):
+                    return create_error_response(404, "audioS3Key not found", request_id, origin)
+                return create_error_response(503, "Audio storage temporarily unavailable", request_id, origin)
+        
         session_id = body['sessionId']
         course_id = body.get('courseId', '000000000')
         topic = body.get('topic', 'General')
         student_id = body.get('studentId', 'student_default')
         context_sources = body.get('contextSources', [])
+        history = sanitize_history(body.get('history', []))
         action = body.get('action', 'stream_audio')
+        audio_profile = resolve_audio_profile(body)
+        audio_settings = get_voice_settings(audio_profile)
         
         # Sanitize inputs
         course_id = sanitize_string(course_id)
         topic = sanitize_string(topic)
         student_id = sanitize_string(student_id)
+        trace.course_id = course_id
+        include_trace = ENABLE_TRACE_METADATA or body.get('debug') is True
         
-        logger.info(f"[{request_id}] Processing session: {session_id}, Course: {course_id}, Topic: {topic}")
+        logger.info("[%s] Processing session: %s, Course: %s, Topic: %s", request_id, session_id, course_id, topic)
         
         # Handle different actions
         if action == 'stop_session':
             return handle_session_stop(session_id, request_id)
         
+        # Transcribe the student's audio; partial transcripts are streamed as they firm up
+        transcript = transcribe_audio(
+            audio_data, body.get('format', 'webm'), request_id, trace, deadline,
+            on_partial=lambda text: sink.emit({
+                'type': 'transcription',
+                'text': text,
+                'isFinal': False,
+                'sessionId': session_id,
+                'requestId': request_id
+            }) if sink.streaming else None
+        )
+        sink.emit({
+            'type': 'transcription',
+            'text': transcript or f"Audio procesado para sesión de {topic}",
+            'isFinal': True,
+            'sessionId': session_id,
+            'requestId': request_id
+        })
+        
         # Get optimized educational context
+        context_started = time.perf_counter()
         educational_context = get_educational_context_optimized(
-            context_sources, course_id, topic, request_id
+            context_sources, course_id, topic, request_id, query=transcript, trace=trace, deadline=deadline
+        )
+        trace.record('ContextRetrieval', context_started, sources=len(context_sources))
+        
+        # Pack history and ranked context into the input-token budget
+        enhanced_prompt, prompt_tokens = build_educational_prompt(
+            audio_data, topic, educational_context, history, transcript=transcript
         )
         
-        # Create enhanced prompt with context
-        enhanced_prompt = create_educational_prompt(audio_data, topic, educational_context)
+        # Choose the model tier and answer length that fit the latency SLO
+        route = model_router.route(prompt_tokens['total'], (time.perf_counter() - request_started) * 1000)
         
-        # Prepare Bedrock streaming request
+        # Prepare Bedrock streaming request; the system prompt is shared by every request
         bedrock_request = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": int(os.environ.get('MAX_TOKENS', '1000')),
+            "max_tokens": route['maxTokens'],
+            "system": SYSTEM_PROMPT_FIELD,
             "messages": [
                 {
                     "role": "user",
                     "content": enhanced_prompt
                 }
             ],
-            "temperature": float(os.environ.get('TEMPERATURE', '0.7')),
-            "top_p": float(os.environ.get('TOP_P', '0.9'))
+            "temperature": TEMPERATURE,
+            "top_p": TOP_P
         }
         
-        # Invoke Bedrock with error handling
-        try:
-            response = bedrock_client.invoke_model_with_response_stream(
-                modelId=MODEL_ID,
-                contentType='application/json',
-                accept='application/json',
-                body=json.dumps(bedrock_request)
-            )
-        except Exception as e:
-            logger.error(f"[{request_id}] Bedrock invocation failed: {e}")
-            if ENABLE_METRICS:
-                send_metric('BedrockErrors', 1, course_id)
-            return create_error_response(500, "AI service temporarily unavailable", request_id, origin)
+        # Replay a memoized answer for an identical prompt fingerprint
+        watchdog = None
+        bedrock_stream = None
+        generation_truncated = False
+        fingerprint = None
+        cached_response = None
+        bedrock_usage: Dict[str, Any] = {}
+        bedrock_started = time.perf_counter()
+        if ENABLE_RESPONSE_CACHE:
+            fingerprint = response_fingerprint(bedrock_request, route['modelId'])
+            cached_response = response_cache.get(fingerprint, request_id)
+        
+        if cached_response:
+            logger.info("[%s] ♻️ Response cache hit, replaying %d chunks", request_id, len(cached_response['chunks']))
+            text_chunks = iter(cached_response['chunks'])
+        else:
+            # Invoke Bedrock with error handling, falling back to faster tiers when throttled
+            bedrock_started = time.perf_counter()
+            try:
+                response, bedrock_request = invoke_routed_model(bedrock_request, route, request_id)
+            except CircuitOpenError as e:
+                logger.warning("[%s] Bedrock unavailable, failing fast: %s", request_id, e)
+                return create_error_response(503, "AI service temporarily unavailable", request_id, origin)
+            except Exception as e:
+                logger.error("[%s] Bedrock invocation failed: %s", request_id, e)
+                if ENABLE_METRICS:
+                    send_metric('BedrockErrors', 1, course_id)
+                return create_error_response(500, "AI service temporarily unavailable", request_id, origin)
+            bedrock_stream = response['body']
+            text_chunks = iter_bedrock_text(response, bedrock_usage)
+            # A stream that stalls, even before its first token, is closed when only the persistence reserve is left
+            watchdog = deadline.close_at_cutoff(bedrock_stream, deadline.persist_reserve_ms)
         
         # Process streaming response with AI Content integration
+        generation_started = time.perf_counter()
         full_response = ""
         streaming_chunks = []
-        audio_urls = []
+        tts_cache_before = get_tts_cache_stats()
+        synthesis = SynthesisStage(
+            session_id, student_id, request_id, request_started, trace, deadline,
+            # Only MP3 frames can be joined into one object
+            assemble_audio=AUDIO_ASSEMBLY == 'single' and audio_settings['outputFormat'] == 'mp3',
+            audio_profile=audio_profile,
+            on_audio=lambda chunk_index, audio_url, audio_data: sink.emit({
+                'type': 'audio_segment',
+                # Inlined units carry their audio instead of a URL whose upload is still queued
+                **({'audioData': audio_data, 'contentType': audio_settings['contentType']} if audio_data else {'audioUrl': audio_url}),
+                'chunkIndex': chunk_index,
+                'sessionId': session_id,
+                'requestId': request_id
+            }) if sink.streaming else None
+        )
+        segmenter = SentenceSegmenter()
+        packer = SynthesisUnitPacker()
+        time_to_first_token_ms = None
+        first_token_at = None
         
         try:
-            for event_stream in response['body']:
-                chunk = event_stream.get('chunk')
-                if chunk:
-                    chunk_data = json.loads(chunk['bytes'].decode())
-                    
-                    if chunk_data['type'] == 'content_block_delta':
-                        text_chunk = chunk_data['delta'].get('text', '')
-                        if text_chunk:
-                            full_response += text_chunk
-                            
-                            # Create streaming chunk for frontend (text only for now)
-                            chunk_response = {
-                                'type': 'ai_response',
-                                'text': text_chunk,
-                                'sessionId': session_id,
-                                'timestamp': datetime.now().isoformat(),
-                                'requestId': request_id
-                            }
-                            streaming_chunks.append(chunk_response)
-                            
-                            logger.info(f"[{request_id}] AI Chunk: {text_chunk[:50]}...")
+            for text_chunk in text_chunks:
+                # Generation always gets its first token; after that it stops at the TTS cutoff
+                if first_token_at is not None and deadline.expired(deadline.generation_cutoff_ms()):
+                    generation_truncated = True
+                    break
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    time_to_first_token_ms = round((first_token_at - request_started) * 1000, 1)
+                    trace.record('BedrockFirstToken', bedrock_started, first_token_at, cached=bool(cached_response))
+                full_response += text_chunk
+                
+                # Create streaming chunk for frontend (text only for now)
+                chunk_response = {
+                    'type': 'ai_response',
+                    'text': text_chunk,
+                    'sessionId': session_id,
+                    'timestamp': datetime.now().isoformat(),
+                    'requestId': request_id
+                }
+                streaming_chunks.append(chunk_response)
+                sink.emit(chunk_response)
+                
+                trace.count('aiChunks')
+                trace.count('aiChars', len(text_chunk))
+                trace.detail("AI Chunk: %.50s...", text_chunk)
+                
+                # Hand complete sentences to TTS while the model keeps generating
+                if ENABLE_PIPELINED_TTS:
+                    for sentence in segmenter.feed(text_chunk):
+                        for unit in packer.add(sentence):
+                            synthesis.submit(unit)
         
         except Exception as e:
-            logger.error(f"[{request_id}] Error processing streaming response: {e}")
-            return create_error_response(500, "Error processing AI response", request_id, origin)
+            if not deadline.expired(deadline.persist_reserve_ms):
+                logger.error("[%s] Error processing streaming response: %s", request_id, e)
+                if ENABLE_CIRCUIT_BREAKERS and not cached_response:
+                    get_circuit_breaker(f"bedrock:{route['tier']}").record(True)
+                synthesis.cancel()
+                return create_error_response(500, "Error processing AI response", request_id, origin)
+            # The watchdog closed the stream at the generation cutoff
+            generation_truncated = True
+        
+        finally:
+            if watchdog:
+                watchdog.cancel()
+            if generation_truncated and bedrock_stream is not None and hasattr(bedrock_stream, 'close'):
+                close_response_stream(bedrock_stream)
         
-        # Save AI Content with parallel processing
-        save_success = save_ai_content_parallel(
-            session_id, course_id, topic, student_id, 
-            enhanced_prompt, full_response, request_id
+        if generation_truncated:
+            logger.warning("[%s] Generation cut at the deadline after %s chars", request_id, len(full_response))
+        
+        synthesis.mark_generation_done()
+        generation_ended = time.perf_counter()
+        generation_ms = trace.record(
+            'Generation', generation_started, generation_ended, chunks=len(streaming_chunks), cached=bool(cached_response)
         )
+        prompt_cache = prompt_cache_usage(bedrock_usage)
+        output_tokens = bedrock_usage.get('outputTokens')
+        if not cached_response and first_token_at is not None:
+            model_router.observe(
+                route['tier'], (first_token_at - bedrock_started) * 1000, prompt_tokens['total'],
+                output_tokens, generation_ended - first_token_at
+            )
+        if output_tokens:
+            trace.set_value('OutputTokens', output_tokens, 'Count')
+            if first_token_at is not None and generation_ended > first_token_at:
+                trace.set_value(
+                    'GenerationTokensPerSecond',
+                    round(output_tokens / (generation_ended - first_token_at), 1),
+                    'Count/Second'
+                )
+        
+        bedrock_latency_saved_ms = 0
+        if ENABLE_RESPONSE_CACHE:
+            if cached_response:
+                bedrock_latency_saved_ms = max(0, cached_response['generationMs'] - generation_ms)
+                response_cache.record_saved(bedrock_latency_saved_ms)
+            elif full_response and not generation_truncated and bedrock_usage.get('stopReason') == 'end_turn':
+                # Answers cut by max_tokens or the deadline are not replayed
+                response_cache.put(
+                    response_fingerprint(bedrock_request, route['modelId']),
+                    [chunk['text'] for chunk in streaming_chunks], generation_ms, request_id, route['modelId']
+                )
+        
+        persisted_prompt = f"{SYSTEM_PROMPT}\n\n{enhanced_prompt}"
+        if ARTIFACT_FORMAT != 'compact':
+            # Save AI Content with parallel processing (overlaps with pipelined TTS)
+            save_ticket = save_ai_content_parallel(
+                session_id, course_id, topic, student_id, 
+                persisted_prompt, full_response, request_id, trace, route['modelId'], deadline=deadline
+            )
+            if PERSIST_MODE != 'write_behind':
+                save_ticket.wait(deadline.timeout(deadline.tts_reserve_ms))
         
         # Generate audio for the complete response if we have text
         if full_response and len(full_response.strip()) > 0:
-            logger.info(f"[{request_id}] 🎤 Starting TTS generation for complete response: {len(full_response)} chars")
-            logger.info(f"[{request_id}] Full response preview: {full_response[:100]}...")
-            
-            # Split response into sentences for better TTS
-            sentences = []
-            current = ""
-            for char in full_response:
-                current += char
-                if char in '.!?\n' and len(current.strip()) > 10:
-                    sentences.append(current.strip())
-                    current = ""
-            if current.strip():
-                sentences.append(current.strip())
-            
-            # Generate audio for each sentence
-            for i, sentence in enumerate(sentences):
-                if sentence:
-                    audio_url = generate_audio_from_text(
-                        sentence,
-                        session_id,
-                        student_id,
-                        request_id,
-                        i
-                    )
-                    if audio_url:
-                        audio_urls.append(audio_url)
-                        logger.info(f"[{request_id}] Generated audio URL {i+1}/{len(sentences)}: {audio_url}")
+            if ENABLE_PIPELINED_TTS:
+                for sentence in segmenter.flush():
+                    for unit in packer.add(sentence):
+                        synthesis.submit(unit)
+                for unit in packer.flush():
+                    synthesis.submit(unit)
+            else:
+                trace.detail("🎤 Starting TTS generation for complete response: %d chars", len(full_response))
+                trace.detail("Full response preview: %.100s...", full_response)
+                
+                # Split response into sentences and pack them into synthesis units
+                for unit in pack_synthesis_units(split_sentences(full_response)):
+                    synthesis.submit(unit)
         
-        # Create final response chunks
-        final_chunks = [
-            {
-                'type': 'transcription',
-                'text': f"Audio procesado para sesión de {topic}",
-                'sessionId': session_id,
-                'requestId': request_id
-            }
-        ] + streaming_chunks + [
+        audio_urls = synthesis.collect()
+        audio_manifest = None
+        if synthesis.assemble_audio:
+            audio_manifest = synthesis.assemble()
+            audio_urls = [audio_manifest['url']] if audio_manifest else []
+        time_to_first_audio_ms = synthesis.time_to_first_audio_ms()
+        tts_cache_after = get_tts_cache_stats()
+        tts_cache_hits = (
+            tts_cache_after['memoryHits'] + tts_cache_after['s3Hits']
+            - tts_cache_before['memoryHits'] - tts_cache_before['s3Hits']
+        )
+        tts_cache_misses = tts_cache_after['misses'] - tts_cache_before['misses']
+        
+        if ARTIFACT_FORMAT == 'compact':
+            # The session record carries the audio manifest, so it is written once synthesis is done
+            save_ticket = save_ai_content_parallel(
+                session_id, course_id, topic, student_id,
+                persisted_prompt, full_response, request_id, trace, route['modelId'],
+                audio_urls=audio_urls,
+                audio_manifest=audio_manifest,
+                timing={
+                    'timeToFirstTokenMs': time_to_first_token_ms,
+                    'timeToFirstAudioMs': time_to_first_audio_ms,
+                    'generationMs': round(generation_ms, 1),
+                    'elapsedMs': round((time.perf_counter() - request_started) * 1000, 1)
+                },
+                deadline=deadline
+            )
+            if PERSIST_MODE != 'write_behind':
+                save_ticket.wait(deadline.timeout())
+        
+        routing = dict(route, tiers=model_router.snapshot())
+        partial = generation_truncated or synthesis.skipped_units > 0
+        inline_audio = synthesis.inline_summary()
+        audio_profile_summary = {
+            'name': audio_profile,
+            **{key: audio_settings[key] for key in ('outputFormat', 'sampleRate', 'engine', 'contentType')}
+        }
+        degraded = degraded_dependencies()
+        if degraded:
+            trace.annotate(degradedDependencies=degraded)
+        deadline_status = dict(
+            deadline.summary(), generationTruncated=generation_truncated, audioUnitsSkipped=synthesis.skipped_units
+        )
+        
+        # Close the event stream
+        sink.emit(
             {
                 'type': 'stream_end',
                 'sessionId': session_id,
                 'fullResponse': full_response,
                 'audioUrls': audio_urls,
+                **({'audioManifest': audio_manifest} if audio_manifest else {}),
+                # audioUrls leaves inlined units out; audioSegments gives the full playback order.
+                # Streamed clients already received inlined audio with each audio_segment event
+                **({'audioSegments': synthesis.audio_segments(include_data=not sink.streaming)} if inline_audio['chunks'] else {}),
                 'requestId': request_id,
+                'partial': partial,
                 'metadata': {
                     'courseId': course_id,
                     'topic': topic,
                     'studentId': student_id,
                     'contextSourcesUsed': len(context_sources),
                     'responseLength': len(full_response),
-                    'audioChunksGenerated': len(audio_urls),
-                    'model': MODEL_ID
+                    'audioChunksGenerated': len(audio_urls) + inline_audio['chunks'],
+                    'audioChunksFailed': len(synthesis.failed_chunks),
+                    'failedChunkIndexes': synthesis.failed_chunks,
+                    'timeToFirstAudioMs': time_to_first_audio_ms,
+                    'firstAudioBeforeGenerationEnd': synthesis.first_audio_before_generation_end(),
+                    'pipelinedTts': ENABLE_PIPELINED_TTS,
+                    'timeToFirstTokenMs': time_to_first_token_ms,
+                    'promptTokens': prompt_tokens,
+                    'promptCache': prompt_cache,
+                    'model': route['modelId'],
+                    'routing': routing,
+                    'deadline': deadline_status,
+                    'degradedDependencies': degraded,
+                    'inlineAudio': inline_audio,
+                    'audioProfile': audio_profile_summary,
+                    **({'trace': trace.to_metadata()} if include_trace else {})
                 }
             }
-        ]
+        )
         
         # Send success metrics
         if ENABLE_METRICS:
+            if route['fallbacks'] or route['skipped']:
+                send_metric('ModelFallbacks', 1, course_id, 'Count')
+            if partial:
+                send_metric('DeadlinePartialResponses', 1, course_id, 'Count')
+                send_metric('DeadlineSkippedAudioUnits', synthesis.skipped_units, course_id, 'Count')
             send_metric('SessionsProcessed', 1, course_id)
             send_metric('ResponseLength', len(full_response), course_id)
             send_metric('ContextSources', len(context_sources), course_id)
+            send_metric('PromptTokens', prompt_tokens['total'], course_id, 'Count')
+            if prompt_cache['cacheReadTokens'] or prompt_cache['cacheWriteTokens']:
+                send_metric('PromptCacheReadTokens', prompt_cache['cacheReadTokens'], course_id, 'Count')
+                send_metric('InputTokensSaved', prompt_cache['inputTokensSaved'], course_id, 'Count')
+            if ENABLE_RESPONSE_CACHE:
+                send_metric('ResponseCacheHits' if cached_response else 'ResponseCacheMisses', 1, course_id, 'Count')
+                if cached_response:
+                    send_metric('BedrockLatencySaved', bedrock_latency_saved_ms, course_id, 'Milliseconds')
+            if ENABLE_TTS_CACHE:
+                send_metric('TTSCacheHits', tts_cache_hits, course_id, 'Count')
+                send_metric('TTSCacheMisses', tts_cache_misses, course_id, 'Count')
+            if inline_audio['chunks']:
+                send_metric('InlinedAudioBytes', inline_audio['bytes'], course_id, 'Bytes')
+                send_metric('InlineAudioLatencySaved', inline_audio['latencySavedMs'], course_id, 'Milliseconds')
+            if synthesis.failed_chunks:
+                send_metric('TTSErrors', len(synthesis.failed_chunks), course_id)
+            if time_to_first_token_ms is not None:
+                send_metric('TimeToFirstToken', time_to_first_token_ms, course_id, 'Milliseconds')
+            if time_to_first_audio_ms is not None:
+                send_metric('TimeToFirstAudio', time_to_first_audio_ms, course_id, 'Milliseconds')
+            send_metric('RequestLatency', round((time.perf_counter() - request_started) * 1000, 1), course_id, 'Milliseconds')
         
-        logger.info(f"[{request_id}] Successfully processed voice streaming session")
+        save_status = save_ticket.status()
+        trace.annotate(sessionId=session_id, aiContentSaved=save_status, responseCacheHit=bool(cached_response))
         
         # Return streaming response with explicit CORS headers
         return {
@@ -241,48 +977,275 @@ def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
                 "success": True,
                 "sessionId": session_id,
                 "requestId": request_id,
-                "chunks": final_chunks,
+                "chunks": sink.events,
                 "fullResponse": full_response,
                 "audioUrls": audio_urls,
-                "aiContentSaved": save_success,
+                **({"audioManifest": audio_manifest} if audio_manifest else {}),
+                "partial": partial,
+                "aiContentSaved": save_status,
                 "metadata": {
-                    "model": MODEL_ID,
+                    "model": route['modelId'],
+                    "routing": routing,
+                    "deadline": deadline_status,
+                    "degradedDependencies": degraded,
+                    "inlineAudio": inline_audio,
+                    "audioProfile": audio_profile_summary,
                     "courseId": course_id,
                     "topic": topic,
                     "chunksCount": len(streaming_chunks),
-                    "audioChunksGenerated": len(audio_urls),
+                    "audioChunksGenerated": len(audio_urls) + inline_audio['chunks'],
+                    "audioChunksFailed": len(synthesis.failed_chunks),
+                    "failedChunkIndexes": synthesis.failed_chunks,
+                    "timeToFirstTokenMs": time_to_first_token_ms,
+                    "timeToFirstAudioMs": time_to_first_audio_ms,
+                    "ttsCacheHits": tts_cache_hits,
+                    "ttsCacheMisses": tts_cache_misses,
+                    "responseCacheHit": bool(cached_response),
+                    "responseCacheHitRatio": response_cache.hit_ratio() if ENABLE_RESPONSE_CACHE else None,
+                    "bedrockLatencySavedMs": bedrock_latency_saved_ms,
                     "responseLength": len(full_response),
                     "contextSources": len(context_sources),
+                    "promptTokens": prompt_tokens,
+                    "inputTokens": bedrock_usage.get('inputTokens'),
+                    "promptCache": prompt_cache,
+                    "trace": trace.to_metadata() if include_trace else None,
                     "timestamp": datetime.now().isoformat()
                 }
             })
         }
         
     except Exception as e:
-        logger.error(f"[{request_id}] Unhandled error in lambda_handler: {str(e)}")
+        logger.error("[%s] Unhandled error in handle_voice_request: %s", request_id, e)
         if ENABLE_METRICS:
             send_metric('LambdaErrors', 1, 'unknown')
         return create_error_response(500, "Internal server error", request_id, origin)
 
-def validate_input(body: Dict[str, Any], request_id: str, origin: str = "*") -> Optional[Dict[str, Any]]:
+class BufferedEventSink:
+    """
+    Collects response events for a single JSON body
+    """
+    
+    streaming = False
+    
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+    
+    def emit(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            self.events.append(event)
+    
+    def finish(self, result: Optional[Dict[str, Any]]) -> None:
+        pass
+
+class StreamingEventSink(BufferedEventSink):
+    """
+    Writes each response event to the client as a newline-delimited JSON line
+    """
+    
+    streaming = True
+    
+    def __init__(self, response_stream):
+        super().__init__()
+        self.response_stream = response_stream
+        self.written = 0
+    
+    def emit(self, event: Dict[str, Any]) -> None:
+        line = (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            self.response_stream.write(line)
+            if hasattr(self.response_stream, 'flush'):
+                self.response_stream.flush()
+            self.written += 1
+    
+    def finish(self, result: Optional[Dict[str, Any]]) -> None:
+        """
+        Report a failed request as an error event, then close the stream
+        """
+        if result and result.get('statusCode', 200) != 200:
+            try:
+                body = json.loads(result.get('body') or '{}')
+            except (TypeError, ValueError):
+                body = {}
+            self.emit({
+                'type': 'error',
+                'message': body.get('error', 'Internal server error'),
+                'requestId': body.get('requestId')
+            })
+        elif result and not self.written:
+            # Non-streamed replies such as CORS preflight or stop_session
+            self.response_stream.write(result.get('body', '').encode('utf-8'))
+        if hasattr(self.response_stream, 'close'):
+            self.response_stream.close()
+
+class PayloadTooLargeError(ValueError):
+    """
+    Raised when a request's audio exceeds AUDIO_MAX_BYTES
+    """
+
+def get_header(event: Dict[str, Any], name: str) -> str:
+    """
+    Header value by name, compared case-insensitively as HTTP header names are
+    """
+    headers = event.get('headers') or {}
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name and value), '')
+
+def form_field_value(name: str, value: str) -> Any:
+    if name in FORM_JSON_FIELDS:
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value  # rejected by validate_input
+    return value
+
+def decode_event_body(event: Dict[str, Any], max_bytes: int) -> Union[bytes, bytearray]:
+    """
+    The request body as bytes, checking its decoded size before decoding anything
+    """
+    body = event.get('body') or b''
+    if isinstance(body, (bytes, bytearray)):
+        decoded_size = len(body)
+    elif event.get('isBase64Encoded'):
+        decoded_size = len(body) // 4 * 3
+    else:
+        decoded_size = len(body)
+    if decoded_size > max_bytes:
+        raise PayloadTooLargeError(f"audio too large (max {AUDIO_MAX_BYTES} bytes)")
+    
+    if isinstance(body, (bytes, bytearray)):
+        return body
+    if event.get('isBase64Encoded'):
+        # Decode slice by slice into one buffer; b64decode would first copy the whole str to ASCII
+        decoded = bytearray(decoded_size)
+        written = 0
+        for offset in range(0, len(body), BASE64_DECODE_STEP):
+            piece = binascii.a2b_base64(body[offset:offset + BASE64_DECODE_STEP])
+            decoded[written:written + len(piece)] = piece
+            written += len(piece)
+        del decoded[written:]
+        return decoded
+    return body.encode('utf-8')
+
+def parse_multipart(raw: Union[bytes, bytearray], content_type: str) -> Dict[str, Any]:
+    """
+    Split a multipart/form-data body into fields; the part named audioData or audio (or any
+    file part) becomes a memoryview slice of raw, other parts are decoded as text fields
+    """
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not boundary:
+        raise ValueError("multipart body without a boundary")
+    delimiter = b'--' + boundary.group(1).encode('latin-1')
+    view = memoryview(raw)
+    fields: Dict[str, Any] = {}
+    
+    pos = raw.find(delimiter)
+    if pos < 0:
+        raise ValueError("multipart body without parts")
+    while True:
+        pos += len(delimiter)
+        if raw[pos:pos + 2] == b'--':
+            return fields
+        headers_end = raw.find(b'\r\n\r\n', pos)
+        part_end = raw.find(b'\r\n' + delimiter, headers_end) if headers_end >= 0 else -1
+        if part_end < 0:
+            raise ValueError("truncated multipart body")
+        
+        headers = raw[pos:headers_end].decode('latin-1')
+        name = re.search(r'\bname="([^"]*)"', headers)
+        content = view[headers_end + 4:part_end]
+        if name and (name.group(1) in ('audioData', 'audio') or 'filename=' in headers):
+            fields['audioData'] = content
+            part_type = re.search(r'(?im)^content-type:\s*([^\s;]+)', headers)
+            if part_type and part_type.group(1).lower() in AUDIO_MEDIA_FORMATS:
+                fields.setdefault('format', AUDIO_MEDIA_FORMATS[part_type.group(1).lower()])
+        elif name:
+            fields[name.group(1)] = form_field_value(name.group(1), str(content, 'utf-8'))
+        pos = part_end + 2
+
+def parse_request_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Request fields from a JSON body, a raw binary audio body (fields in the query string)
+    or a multipart/form-data body. Binary audio is kept as a memoryview over the decoded
+    body rather than re-encoded or copied. Raises ValueError for malformed bodies.
+    """
+    if 'body' not in event:
+        return event
+    content_type = get_header(event, 'content-type')
+    media_type = content_type.split(';')[0].strip().lower()
+    
+    if media_type == 'multipart/form-data':
+        return parse_multipart(decode_event_body(event, AUDIO_MAX_BYTES + MULTIPART_FIELDS_MAX_BYTES), content_type)
+    
+    if media_type.startswith('audio/') or media_type == 'application/octet-stream':
+        fields = {
+            name: form_field_value(name, value)
+            for name, value in (event.get('queryStringParameters') or {}).items()
+        }
+        fields['audioData'] = memoryview(decode_event_body(event, AUDIO_MAX_BYTES))
+        if media_type in AUDIO_MEDIA_FORMATS:
+            fields.setdefault('format', AUDIO_MEDIA_FORMATS[media_type])
+        return fields
+    
+    return json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+
+def fetch_uploaded_audio(audio_key: str, request_id: str, trace: Optional['RequestTrace'] = None) -> memoryview:
+    """
+    Read audio the client uploaded with a presigned URL; the size is checked from
+    ContentLength before the body is read
+    """
+    started = time.perf_counter()
+    response = s3_call('get_object', Bucket=BUCKET_NAME, Key=audio_key)
+    try:
+        if response.get('ContentLength', 0) > AUDIO_MAX_BYTES:
+            raise PayloadTooLargeError(f"audio too large (max {AUDIO_MAX_BYTES} bytes)")
+        return memoryview(response['Body'].read())
+    finally:
+        close = getattr(response['Body'], 'close', None)
+        if close:
+            close()
+        if trace:
+            trace.record('AudioFetch', started, bytes=response.get('ContentLength'))
+
+def validate_input(body: Any, request_id: str, origin: str = "*") -> Optional[Dict[str, Any]]:
     """
     Robust input validation with detailed error messages
     """
-    required_fields = ['audioData', 'sessionId']
-    optional_fields = ['courseId', 'topic', 'studentId', 'contextSources', 'action']
+    # Valid JSON that is not an object ([], "x", null) has no fields to validate
+    if not isinstance(body, dict):
+        return create_error_response(400, "Request body must be a JSON object", request_id, origin)
+    
+    # audioS3Key stands in for audioData when the client uploaded the audio itself
+    required_fields = ['sessionId'] if body.get('audioS3Key') and not body.get('audioData') else ['audioData', 'sessionId']
+    optional_fields = [
+        'courseId', 'topic', 'studentId', 'contextSources', 'action', 'debug', 'history', 'audioProfile', 'clientType',
+        'format', 'audioS3Key'
+    ]
     
     # Check required fields
     missing = [f for f in required_fields if f not in body or not body[f]]
     if missing:
-        logger.warning(f"[{request_id}] Missing required fields: {missing}")
+        logger.warning("[%s] Missing required fields: %s", request_id, missing)
         return create_error_response(400, f"Missing required fields: {', '.join(missing)}", request_id, origin)
     
     # Validate field types and lengths
-    if not isinstance(body['audioData'], str):
-        return create_error_response(400, "audioData must be a string", request_id, origin)
+    if isinstance(body.get('audioData'), memoryview):
+        # Binary and multipart audio: sized from the view, never copied
+        if body['audioData'].nbytes > AUDIO_MAX_BYTES:
+            return create_error_response(413, f"audio too large (max {AUDIO_MAX_BYTES} bytes)", request_id, origin)
+    elif 'audioData' in body:
+        if not isinstance(body['audioData'], str):
+            return create_error_response(400, "audioData must be a string", request_id, origin)
+        
+        if len(body['audioData']) > 1000000:  # 1MB limit
+            return create_error_response(400, "audioData too large (max 1MB)", request_id, origin)
     
-    if len(body['audioData']) > 1000000:  # 1MB limit
-        return create_error_response(400, "audioData too large (max 1MB)", request_id, origin)
+    if 'audioS3Key' in body and (
+        not isinstance(body['audioS3Key'], str)
+        or not body['audioS3Key'].startswith(AUDIO_UPLOAD_PREFIX)
+        or '..' in body['audioS3Key']
+    ):
+        return create_error_response(400, f"audioS3Key must name an object under {AUDIO_UPLOAD_PREFIX}", request_id, origin)
     
     if not isinstance(body['sessionId'], str) or len(body['sessionId']) < 3:
         return create_error_response(400, "sessionId must be a string with at least 3 characters", request_id, origin)
@@ -291,6 +1254,14 @@ def validate_input(body: Dict[str, Any], request_id: str, origin: str = "*") ->
     if 'contextSources' in body and not isinstance(body['contextSources'], list):
         return create_error_response(400, "contextSources must be an array", request_id, origin)
     
+    if 'history' in body and not isinstance(body['history'], list):
+        return create_error_response(400, "history must be an array", request_id, origin)
+    
+    if 'audioProfile' in body and body['audioProfile'] not in audio_profiles:
+        return create_error_response(
+            400, f"audioProfile must be one of: {', '.join(sorted(audio_profiles))}", request_id, origin
+        )
+    
     return None
 
 def validate_api_key(event: Dict[str, Any]) -> bool:
@@ -317,44 +1288,79 @@ def sanitize_string(value: str) -> str:
     # Limit length
     return sanitized[:100]
 
+def sanitize_history(history: List[Any]) -> List[Dict[str, str]]:
+    """
+    Keep the last PROMPT_HISTORY_MAX_TURNS well-formed turns as {'role', 'text'}
+    """
+    turns = []
+    for turn in history[-PROMPT_HISTORY_MAX_TURNS:]:
+        if not isinstance(turn, dict):
+            continue
+        text = turn.get('text') or turn.get('content')
+        if not isinstance(text, str) or not text.strip():
+            continue
+        turns.append({
+            'role': 'assistant' if turn.get('role') == 'assistant' else 'user',
+            'text': re.sub(r'[<>\\]', '', re.sub(r'\s+', ' ', text.strip()))[:PROMPT_HISTORY_MAX_CHARS]
+        })
+    return turns
+
 def get_educational_context_optimized(
     context_sources: List[str], 
     course_id: str, 
     topic: str, 
-    request_id: str
+    request_id: str,
+    query: Optional[str] = None,
+    trace: Optional['RequestTrace'] = None,
+    deadline: Optional['Deadline'] = None
 ) -> str:
     """
     Optimized educational context retrieval with compression and caching
+    Sources are fetched concurrently and served from the warm-container cache.
+    With ENABLE_CONTEXT_RANKING, passages are ranked against the topic and query
+    (the query capped at TRANSCRIPT_MAX_CHARS, as in the prompt).
+    Sources still loading when the stage's deadline share runs out are skipped.
     """
+    timeout = None
+    if deadline:
+        timeout = deadline.timeout(
+            deadline.generation_min_ms + deadline.generation_cutoff_ms(), DEADLINE_CONTEXT_MAX_MS
+        )
+    stage_end = time.perf_counter() + timeout if timeout is not None else None
     try:
         context_content = []
         
         # Limit sources for performance
-        limited_sources = context_sources[:MAX_CONTEXT_SOURCES]
+        limited_sources = []
+        for source_path in context_sources[:MAX_CONTEXT_SOURCES]:
+            # Validate source path
+            if not source_path or not isinstance(source_path, str) or '..' in source_path:
+                logger.warning("[%s] Invalid source path: %s", request_id, source_path)
+                continue
+            limited_sources.append(source_path)
         
-        for source_path in limited_sources:
+        if ENABLE_CONTEXT_RANKING and limited_sources:
+            ranked_context = get_ranked_context(
+                limited_sources, course_id, f"{topic} {(query or '')[:TRANSCRIPT_MAX_CHARS]}", request_id, trace, timeout
+            )
+            if ranked_context:
+                return ranked_context
+        
+        futures = [
+            context_executor.submit(fetch_context_snippet, source_path, request_id, trace)
+            for source_path in limited_sources
+        ]
+        
+        for source_path, future in zip(limited_sources, futures):
             try:
-                # Validate source path
-                if not source_path or '..' in source_path:
-                    logger.warning(f"[{request_id}] Invalid source path: {source_path}")
-                    continue
-                
-                response = s3_client.get_object(
-                    Bucket=BUCKET_NAME, 
-                    Key=source_path,
-                    Range=f'bytes=0-{MAX_CONTEXT_LENGTH * 2}'  # Limit bytes read
+                truncated_content = future.result(
+                    timeout=max(0.0, stage_end - time.perf_counter()) if stage_end is not None else None
                 )
-                content = response['Body'].read().decode('utf-8', errors='ignore')
-                
-                # Compress content - remove excessive whitespace and line breaks
-                compressed_content = re.sub(r'\s+', ' ', content.strip())
-                truncated_content = compressed_content[:MAX_CONTEXT_LENGTH]
-                
-                context_content.append(f"📄 {source_path.split('/')[-1]}: {truncated_content}")
-                
-            except Exception as e:
-                logger.warning(f"[{request_id}] Could not retrieve context from {source_path}: {e}")
+            except TimeoutError:
+                logger.warning("[%s] Context source %s skipped at the deadline", request_id, source_path)
                 continue
+            if truncated_content is not None:
+                context_content.append(f"📄 {source_path.split('/')[-1]}: {truncated_content}")
         
         if context_content:
             return "\n".join(context_content)
@@ -362,85 +1368,876 @@ def get_educational_context_optimized(
             return f"Contenido educativo relacionado con {topic} en el curso {course_id}"
             
     except Exception as e:
-        logger.error(f"[{request_id}] Error getting educational context: {e}")
+        logger.error("[%s] Error getting educational context: %s", request_id, e)
         return f"Contexto educativo general para {topic}"
 
-def create_educational_prompt(audio_data: str, topic: str, context: str) -> str:
+def fetch_context_snippet(
+    source_path: str, request_id: str, trace: Optional['RequestTrace'] = None
+) -> Optional[str]:
     """
-    Create enhanced educational prompt with context - optimized version
+    Fetch and compress the head of a context source
+    Fresh cache entries skip S3; stale ones are revalidated by ETag
     """
-    # Limit audio data reference for token efficiency
-    audio_ref = f"{len(audio_data)} caracteres de datos de audio"
+    started = time.perf_counter()
+    cached = context_cache.get(source_path)
+    now = time.time()
+    if cached and now - cached['fetchedAt'] < CONTEXT_CACHE_TTL_SECONDS:
+        if trace:
+            trace.record('ContextSource', started, source=source_path, outcome='cached')
+        return cached['snippet']
     
-    return f"""Eres CognIA, un asistente educativo inteligente especializado en aprendizaje interactivo y personalizado.
-
-🎯 CONTEXTO EDUCATIVO:
-Tema: {topic}
-Material de referencia:
-{context[:1000]}
+    outcome = 'failed'
+    try:
+        request = {
+            'Bucket': BUCKET_NAME,
+            'Key': source_path,
+            'Range': f'bytes=0-{MAX_CONTEXT_LENGTH * 2}'  # Limit bytes read
+        }
+        if cached and cached.get('etag'):
+            request['IfNoneMatch'] = cached['etag']
+        
+        try:
+            response = s3_call('get_object', **request)
+        except Exception as e:
+            if cached and aws_error_code(e) in ('304', 'NotModified'):
+                context_cache.put(source_path, dict(cached, fetchedAt=now))
+                outcome = 'revalidated'
+                return cached['snippet']
+            raise
+        
+        content = response['Body'].read().decode('utf-8', errors='ignore')
+        
+        # Compress content - remove excessive whitespace and line breaks
+        compressed_content = re.sub(r'\s+', ' ', content.strip())
+        truncated_content = trim_to_tokens(compressed_content, estimate_tokens(compressed_content[:MAX_CONTEXT_LENGTH]))
+        
+        context_cache.put(source_path, {
+            'snippet': truncated_content,
+            'etag': response.get('ETag'),
+            'fetchedAt': now
+        })
+        outcome = 'fetched'
+        return truncated_content
+        
+    except Exception as e:
+        logger.warning("[%s] Could not retrieve context from %s: %s", request_id, source_path, e)
+        return None
+    
+    finally:
+        if trace:
+            trace.record('ContextSource', started, source=source_path, outcome=outcome)
 
-🎤 SESIÓN DE VOZ:
-Audio procesado: {audio_ref}
+def tokenize_for_search(text: str) -> List[str]:
+    """
+    Lowercase, accent-fold and split text into search terms without stopwords
+    """
+    folded = unicodedata.normalize('NFC', text).lower().translate(ACCENT_FOLDING)
+    return [term for term in SEARCH_TERM_PATTERN.findall(folded) if len(term) > 1 and term not in STOPWORDS]
 
-📚 INSTRUCCIONES:
-1. Responde como profesor experto en {topic}
-2. Usa el material de referencia cuando sea relevante
-3. Mantén respuestas conversacionales (máximo 3 oraciones)
-4. Haz preguntas para mantener engagement
-5. Adapta el nivel según las respuestas
-6. Usa tono amigable y profesional
+def query_terms(query: str, max_terms: Optional[int] = None) -> List[str]:
+    """
+    The first max_terms (CONTEXT_QUERY_MAX_TERMS if None) distinct search terms of a query, in order
+    """
+    return list(dict.fromkeys(tokenize_for_search(query)))[:CONTEXT_QUERY_MAX_TERMS if max_terms is None else max_terms]
 
-🚀 RESPUESTA:
-Saluda y pregunta específicamente qué aspecto de {topic} quiere explorar."""
+def chunk_passages(text: str, max_words: int = CONTEXT_PASSAGE_WORDS) -> List[str]:
+    """
+    Split compressed text into passages of about max_words, on sentence boundaries
+    """
+    passages = []
+    current: List[str] = []
+    current_words = 0
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        words = len(sentence.split())
+        if current and current_words + words > max_words:
+            passages.append(' '.join(current))
+            current, current_words = [], 0
+        current.append(sentence)
+        current_words += words
+    if current:
+        passages.append(' '.join(current))
+    return [passage for passage in passages if passage.strip()]
 
-def save_ai_content_parallel(
-    session_id: str, 
-    course_id: str, 
-    topic: str, 
-    student_id: str, 
-    prompt: str, 
-    response: str,
-    request_id: str
-) -> bool:
+class PassageIndex:
     """
-    Save AI content with parallel processing for better performance
+    In-memory BM25 index over pre-chunked course passages.
+    Term weights are precomputed at build time so a query is a sum over postings.
     """
-    try:
-        timestamp = datetime.now().isoformat()
-        ttl_timestamp = int(datetime.now().timestamp()) + (DEFAULT_TTL_DAYS * 86400)
-        
-        # Use ThreadPoolExecutor for parallel I/O operations
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # Submit all save operations
-            future_prompt = executor.submit(
-                save_bedrock_prompt, session_id, topic, prompt, response, timestamp, request_id
-            )
-            future_text = executor.submit(
-                save_text_output, session_id, student_id, response, timestamp, request_id
-            )
-            future_metadata = executor.submit(
-                save_metadata_to_dynamodb, session_id, course_id, topic, student_id, 
-                prompt, response, timestamp, ttl_timestamp, request_id
-            )
-            
-            # Wait for all operations to complete
-            results = [
-                future_prompt.result(),
-                future_text.result(),
-                future_metadata.result()
-            ]
+    
+    K1 = 1.5
+    B = 0.75
+    
+    def __init__(self, passages: List[Tuple[str, str]]):
+        self.passages = passages  # (source name, passage text)
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        
+        term_counts = [Counter(tokenize_for_search(passage)) for _, passage in passages]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        
+        document_frequency: Counter = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+        
+        total = len(passages)
+        idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        postings = self.postings
+        for passage_id, counts in enumerate(term_counts):
+            norm = self.K1 * (1 - self.B + self.B * lengths[passage_id] / avg_length) if avg_length else self.K1
+            for term, tf in counts.items():
+                weight = idf[term] * tf * (self.K1 + 1) / (tf + norm)
+                if term in postings:
+                    postings[term].append((passage_id, weight))
+                else:
+                    postings[term] = [(passage_id, weight)]
+    
+    def search(self, query: str, k: int) -> List[Tuple[float, int]]:
+        """
+        Return the top-k (score, passage id) pairs for the query
+        Only the query's first CONTEXT_QUERY_MAX_TERMS distinct terms are looked up
+        """
+        scores: Dict[int, float] = {}
+        for term in query_terms(query):
+            for passage_id, weight in self.postings.get(term, ()):
+                scores[passage_id] = scores.get(passage_id, 0.0) + weight
+        return heapq.nlargest(k, ((score, passage_id) for passage_id, score in scores.items()))
+    
+    def select(self, query: str, k: int, budget_chars: int) -> List[Tuple[str, str]]:
+        """
+        Pick the best passages for the query that fit in the character budget
+        """
+        selected = []
+        used = 0
+        for _, passage_id in self.search(query, k):
+            source_name, passage = self.passages[passage_id]
+            if used + len(passage) > budget_chars:
+                if selected:
+                    continue
+                passage = passage[:budget_chars]
+            selected.append((source_name, passage))
+            used += len(passage)
+        return selected
+
+def fetch_context_document(
+    source_path: str, request_id: str, trace: Optional['RequestTrace'] = None
+) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Fetch a full context source for indexing, returning its compressed text and ETag
+    """
+    started = time.perf_counter()
+    outcome = 'failed'
+    try:
+        response = s3_call(
+            'get_object',
+            Bucket=BUCKET_NAME,
+            Key=source_path,
+            Range=f'bytes=0-{CONTEXT_INDEX_MAX_BYTES - 1}'
+        )
+        content = response['Body'].read().decode('utf-8', errors='ignore')
+        outcome = 'fetched'
+        return re.sub(r'\s+', ' ', content.strip()), response.get('ETag')
+    except Exception as e:
+        logger.warning("[%s] Could not retrieve context from %s: %s", request_id, source_path, e)
+        return None
+    finally:
+        if trace:
+            trace.record('ContextSource', started, source=source_path, outcome=outcome)
+
+def get_source_etag(source_path: str) -> Optional[str]:
+    try:
+        return s3_call('head_object', Bucket=BUCKET_NAME, Key=source_path).get('ETag')
+    except Exception:
+        return None
+
+def get_course_index(
+    course_id: str, sources: List[str], request_id: str, trace: Optional['RequestTrace'] = None,
+    timeout: Optional[float] = None
+) -> Optional[PassageIndex]:
+    """
+    Load the passage index for a course's sources, building it once per container
+    Stale indexes are revalidated against the sources' ETags before rebuilding
+    Raises TimeoutError if the sources are not loaded within timeout seconds
+    """
+    stage_end = time.perf_counter() + timeout if timeout is not None else None
+    cache_key = f"{course_id}|{'|'.join(sources)}"
+    cached = course_index_cache.get(cache_key)
+    now = time.time()
+    if cached:
+        if now - cached['builtAt'] < CONTEXT_CACHE_TTL_SECONDS:
+            return cached['index']
+        etags = list(context_executor.map(get_source_etag, sources, timeout=timeout))
+        if etags == cached['etags']:
+            course_index_cache.put(cache_key, dict(cached, builtAt=now))
+            return cached['index']
+    
+    documents = list(context_executor.map(
+        lambda path: fetch_context_document(path, request_id, trace), sources,
+        timeout=max(0.0, stage_end - time.perf_counter()) if stage_end is not None else None
+    ))
+    passages = []
+    etags = []
+    for source_path, document in zip(sources, documents):
+        if document is None:
+            etags.append(None)
+            continue
+        text, etag = document
+        etags.append(etag)
+        source_name = source_path.split('/')[-1]
+        passages.extend((source_name, passage) for passage in chunk_passages(text))
+    
+    if not passages:
+        return None
+    
+    started = time.perf_counter()
+    index = PassageIndex(passages)
+    if trace:
+        trace.record('ContextIndexBuild', started, passages=len(passages))
+    logger.debug(
+        "[%s] Built passage index for course %s: %d passages in %.1fms",
+        request_id, course_id, len(passages), (time.perf_counter() - started) * 1000
+    )
+    course_index_cache.put(cache_key, {'index': index, 'etags': etags, 'builtAt': now})
+    return index
+
+def get_ranked_context(
+    sources: List[str], course_id: str, query: str, request_id: str, trace: Optional['RequestTrace'] = None,
+    timeout: Optional[float] = None
+) -> Optional[str]:
+    """
+    Select the course passages most relevant to the query within CONTEXT_BUDGET_CHARS
+    """
+    try:
+        index = get_course_index(course_id, sources, request_id, trace, timeout)
+    except TimeoutError:
+        logger.warning("[%s] Passage index not ready at the deadline", request_id)
+        return None
+    if index is None:
+        return None
+    
+    started = time.perf_counter()
+    selected = index.select(query, CONTEXT_TOP_K, CONTEXT_BUDGET_CHARS)
+    logger.debug(
+        "[%s] Selected %d/%d passages in %.2fms",
+        request_id, len(selected), len(index.passages), (time.perf_counter() - started) * 1000
+    )
+    if not selected:
+        return None
+    return "\n".join(f"📄 {source_name}: {passage}" for source_name, passage in selected)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap input-token estimate at PROMPT_CHARS_PER_TOKEN characters per token
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN)
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keep the leading whole sentences of text that fit in max_tokens
+    Falls back to a word boundary when the first sentence alone does not fit
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    
+    kept = ''
+    for sentence in split_sentences(text):
+        candidate = f"{kept} {sentence}" if kept else sentence
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    if kept:
+        return kept
+    
+    max_chars = int(max_tokens * PROMPT_CHARS_PER_TOKEN) - 1
+    if max_chars <= 0:
+        return ''
+    return split_long_text(text, max_chars)[0] + '…'
+
+def iter_audio_chunks(
+    audio_data: Union[str, memoryview], chunk_bytes: int = TRANSCRIPTION_CHUNK_BYTES
+) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Decode base64 audioData one slice at a time, so transcription starts before the whole clip is decoded
+    Binary audio is already decoded and is handed out as memoryview slices
+    """
+    if isinstance(audio_data, memoryview):
+        for offset in range(0, audio_data.nbytes, chunk_bytes):
+            yield audio_data[offset:offset + chunk_bytes]
+        return
+    if audio_data.startswith('data:'):
+        audio_data = audio_data.partition(',')[2]
+    step = chunk_bytes // 3 * 4  # whole base64 quanta
+    for offset in range(0, len(audio_data), step):
+        yield base64.b64decode(audio_data[offset:offset + step])
+
+class TranscriptionEngine(ABC):
+    """
+    Speech-to-text interface. transcribe() consumes decoded audio chunks and yields
+    (transcript so far, is_final) as results firm up; the last item has is_final set.
+    """
+    
+    name = 'none'
+    
+    @abstractmethod
+    def transcribe(
+        self, chunks: Iterator[Union[bytes, memoryview]], audio_format: str, request_id: str,
+        timeout: Optional[float] = None
+    ) -> Iterator[Tuple[str, bool]]:
+        ...
+
+class LocalTranscriptionEngine(TranscriptionEngine):
+    """
+    Deterministic stand-in for tests and local runs: audio that is UTF-8 text is its own
+    transcript, one partial per chunk; recognized audio containers transcribe to ''.
+    """
+    
+    name = 'local'
+    AUDIO_SIGNATURES = (b'RIFF', b'OggS', b'fLaC', b'ID3', b'\x1aE\xdf\xa3', b'\xff\xfb', b'\xff\xf3')
+    
+    def transcribe(
+        self, chunks: Iterator[Union[bytes, memoryview]], audio_format: str, request_id: str,
+        timeout: Optional[float] = None
+    ) -> Iterator[Tuple[str, bool]]:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        text = ''
+        for i, chunk in enumerate(chunks):
+            if i == 0 and bytes(chunk[:4]).startswith(self.AUDIO_SIGNATURES):
+                break
+            text += decoder.decode(chunk)
+            if not self._is_speech(text):
+                text = ''
+                break
+            yield ' '.join(text.split()), False
+        else:
+            text += decoder.decode(b'', final=True)
+        yield (' '.join(text.split()) if self._is_speech(text) else ''), True
+    
+    @staticmethod
+    def _is_speech(text: str) -> bool:
+        return all(char.isprintable() or char.isspace() for char in text) and '\ufffd' not in text
+
+class AmazonTranscribeEngine(TranscriptionEngine):
+    """
+    Amazon Transcribe streaming. The SDK is asyncio-based, so the stream runs on its own
+    thread and results are handed back through a queue. The stream is cancelled when the
+    caller stops reading and is bounded by the timeout either way.
+    """
+    
+    name = 'transcribe'
+    
+    def __init__(self, region: str, language_code: str, sample_rate: int):
+        # Optional dependency, imported only when this engine is configured
+        from amazon_transcribe.client import TranscribeStreamingClient
+        self.client_class = TranscribeStreamingClient
+        self.region = region
+        self.language_code = language_code
+        self.sample_rate = sample_rate
+    
+    def transcribe(
+        self, chunks: Iterator[Union[bytes, memoryview]], audio_format: str, request_id: str,
+        timeout: Optional[float] = None
+    ) -> Iterator[Tuple[str, bool]]:
+        encoding = TRANSCRIBE_MEDIA_ENCODINGS.get(audio_format)
+        if encoding is None:
+            raise ValueError(f"Amazon Transcribe cannot read {audio_format} audio")
+        
+        import asyncio
+        results: queue.Queue = queue.Queue()
+        worker: Dict[str, Any] = {}
+        threading.Thread(
+            target=lambda: asyncio.run(self._run(chunks, encoding, results, worker, timeout)),
+            name=f'transcribe-{request_id[:8]}', daemon=True
+        ).start()
+        stage_end = time.perf_counter() + timeout if timeout is not None else None
+        try:
+            while True:
+                try:
+                    item = results.get(timeout=max(0.0, stage_end - time.perf_counter()) if stage_end else None)
+                except queue.Empty:
+                    raise TimeoutError('transcription did not finish before the deadline')
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Timed out, failed or closed early: stop sending audio and waiting for results
+            worker['cancelled'] = True
+            if 'task' in worker:
+                try:
+                    worker['loop'].call_soon_threadsafe(worker['task'].cancel)
+                except RuntimeError:
+                    pass  # the stream already finished
+    
+    async def _run(
+        self, chunks: Iterator[Union[bytes, memoryview]], encoding: str, results: queue.Queue,
+        worker: Dict[str, Any], timeout: Optional[float]
+    ) -> None:
+        import asyncio
+        worker['loop'] = asyncio.get_running_loop()
+        worker['task'] = asyncio.current_task()
+        try:
+            if not worker.get('cancelled'):
+                await asyncio.wait_for(self._stream(chunks, encoding, results), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            pass
+        finally:
+            results.put(None)
+    
+    async def _stream(self, chunks: Iterator[Union[bytes, memoryview]], encoding: str, results: queue.Queue) -> None:
+        import asyncio
+        try:
+            stream = await self.client_class(region=self.region).start_stream_transcription(
+                language_code=self.language_code,
+                media_sample_rate_hz=self.sample_rate,
+                media_encoding=encoding
+            )
+            
+            async def send_audio():
+                for chunk in chunks:
+                    await stream.input_stream.send_audio_event(audio_chunk=bytes(chunk))
+                await stream.input_stream.end_stream()
             
-            success = all(results)
-            logger.info(f"[{request_id}] AI Content save operations completed: {success}")
-            return success
+            async def receive_transcripts():
+                segments: List[str] = []
+                async for event in stream.output_stream:
+                    for result in event.transcript.results:
+                        if not result.alternatives:
+                            continue
+                        text = result.alternatives[0].transcript
+                        if result.is_partial:
+                            results.put((' '.join(segments + [text]), False))
+                        else:
+                            segments.append(text)
+                            results.put((' '.join(segments), False))
+                results.put((' '.join(segments), True))
             
+            await asyncio.gather(send_audio(), receive_transcripts())
+        except Exception as e:
+            results.put(e)
+
+def create_transcription_engine(name: str) -> Optional[TranscriptionEngine]:
+    if name == 'local':
+        return LocalTranscriptionEngine()
+    if name == 'transcribe':
+        try:
+            return AmazonTranscribeEngine(AWS_REGION, TRANSCRIPTION_LANGUAGE, TRANSCRIPTION_SAMPLE_RATE)
+        except ImportError as e:
+            logger.error(
+                "TRANSCRIPTION_ENGINE=transcribe needs the amazon-transcribe package, transcription disabled: %s", e
+            )
+    return None
+
+def transcribe_audio(
+    audio_data: Union[str, memoryview], audio_format: str, request_id: str,
+    trace: Optional['RequestTrace'] = None, deadline: Optional['Deadline'] = None,
+    on_partial: Optional[Callable[[str], None]] = None
+) -> str:
+    """
+    Transcribe audioData with the configured engine, decoding it in chunks and reporting
+    partial transcripts. Generation starts from the final result; at the stage's deadline
+    share the latest partial is used. Returns '' when there is no transcript.
+    """
+    if transcription_engine is None:
+        return ''
+    timeout = deadline.timeout(
+        deadline.generation_min_ms + deadline.generation_cutoff_ms(), DEADLINE_TRANSCRIPTION_MAX_MS
+    ) if deadline else None
+    if timeout is None:
+        timeout = DEADLINE_TRANSCRIPTION_MAX_MS / 1000
+    started = time.perf_counter()
+    transcript = ''
+    partials = 0
+    try:
+        for text, is_final in transcription_engine.transcribe(
+            iter_audio_chunks(audio_data), audio_format, request_id, timeout
+        ):
+            transcript = text
+            if is_final:
+                break
+            partials += 1
+            if on_partial and text:
+                on_partial(text)
     except Exception as e:
-        logger.error(f"[{request_id}] Error in parallel save operations: {e}")
+        logger.warning("[%s] Transcription with %s stopped: %s", request_id, transcription_engine.name, e)
+    finally:
+        if trace:
+            trace.record(
+                'Transcription', started, engine=transcription_engine.name, partials=partials, chars=len(transcript)
+            )
+    return transcript.strip()
+
+def build_educational_prompt(
+    audio_data: Union[str, memoryview], 
+    topic: str, 
+    context: str, 
+    history: Optional[List[Dict[str, str]]] = None,
+    budget_tokens: int = PROMPT_INPUT_TOKEN_BUDGET,
+    transcript: str = ''
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Pack the user message (template, session history and context snippets) into what
+    budget_tokens leaves after SYSTEM_PROMPT. History (newest turns first) gets up to
+    PROMPT_HISTORY_SHARE of it; context snippets fill the rest in rank order. Sections
+    are trimmed at sentence boundaries. Returns the user message and the estimated
+    tokens per section. The transcript is part of the template, capped at TRANSCRIPT_MAX_CHARS.
+    """
+    if len(transcript) > TRANSCRIPT_MAX_CHARS:
+        transcript = trim_to_tokens(transcript, int(TRANSCRIPT_MAX_CHARS / PROMPT_CHARS_PER_TOKEN))
+    system_tokens = estimate_tokens(SYSTEM_PROMPT)
+    template_tokens = estimate_tokens(create_educational_prompt(audio_data, topic, '', '', transcript))
+    remaining = max(0, budget_tokens - system_tokens - template_tokens)
+    trimmed = False
+    
+    history_budget = int(remaining * PROMPT_HISTORY_SHARE)
+    history_lines = []
+    history_tokens = 0
+    for turn in reversed(history or []):
+        speaker = 'CognIA' if turn['role'] == 'assistant' else 'Estudiante'
+        line = f"{speaker}: {turn['text']}"
+        if history_tokens + estimate_tokens(line) > history_budget:
+            line = trim_to_tokens(line, history_budget - history_tokens)
+            trimmed = True
+            if line:
+                history_lines.append(line)
+                history_tokens += estimate_tokens(line)
+            break
+        history_lines.append(line)
+        history_tokens += estimate_tokens(line)
+    history_lines.reverse()
+    
+    context_budget = remaining - history_tokens
+    snippets = [line for line in context.split('\n') if line.strip()]
+    context_lines = []
+    context_tokens = 0
+    for snippet in snippets:
+        if context_tokens + estimate_tokens(snippet) > context_budget:
+            snippet = trim_to_tokens(snippet, context_budget - context_tokens)
+            trimmed = True
+            if snippet:
+                context_lines.append(snippet)
+                context_tokens += estimate_tokens(snippet)
+            break
+        context_lines.append(snippet)
+        context_tokens += estimate_tokens(snippet)
+    
+    prompt = create_educational_prompt(
+        audio_data, topic, '\n'.join(context_lines), '\n'.join(history_lines), transcript
+    )
+    return prompt, {
+        'budget': budget_tokens,
+        'total': system_tokens + estimate_tokens(prompt),
+        'system': system_tokens,
+        'template': template_tokens,
+        'history': history_tokens,
+        'context': context_tokens,
+        'historyTurns': len(history_lines),
+        'contextSnippets': len(context_lines),
+        'contextSnippetsAvailable': len(snippets),
+        'trimmed': trimmed
+    }
+
+def create_educational_prompt(
+    audio_data: Union[str, memoryview], topic: str, context: str, history: str = '', transcript: str = ''
+) -> str:
+    """
+    Create the per-request user message; persona and instructions live in SYSTEM_PROMPT
+    Context and history are expected to be sized by build_educational_prompt
+    """
+    if transcript:
+        audio_ref = f"el estudiante dijo: «{transcript}»"
+    elif isinstance(audio_data, memoryview):
+        audio_ref = f"{audio_data.nbytes} bytes de audio"
+    else:
+        # Limit audio data reference for token efficiency
+        audio_ref = f"{len(audio_data)} caracteres de datos de audio"
+    history_section = f"""
+💬 CONVERSACIÓN PREVIA:
+{history}
+""" if history else ''
+    
+    return f"""🎯 CONTEXTO EDUCATIVO:
+Tema: {topic}
+Material de referencia:
+{context}
+{history_section}
+🎤 SESIÓN DE VOZ:
+Audio procesado: {audio_ref}"""
+
+def prompt_cache_usage(usage: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Input tokens saved by the cached system prompt, relative to sending every token
+    as uncached input (the single user message layout)
+    """
+    cache_read = usage.get('cacheReadInputTokens', 0) or 0
+    cache_write = usage.get('cacheWriteInputTokens', 0) or 0
+    saved = cache_read * (1 - PROMPT_CACHE_READ_COST) - cache_write * (PROMPT_CACHE_WRITE_COST - 1)
+    return {
+        'enabled': ENABLE_PROMPT_CACHING,
+        'cacheReadTokens': cache_read,
+        'cacheWriteTokens': cache_write,
+        'uncachedInputTokens': usage.get('inputTokens'),
+        'inputTokensSaved': round(saved, 1)
+    }
+
+class Deadline:
+    """
+    Invocation deadline taken from the Lambda context and DEADLINE_MAX_MS, less
+    DEADLINE_RESERVE_MS kept for stream_end and the response. Unbounded when neither
+    applies. Stage reserves scale with the budget so short budgets still generate.
+    """
+    
+    def __init__(self, remaining_ms: Optional[float]):
+        self.started = time.perf_counter()
+        self.budget_ms = None if remaining_ms is None else max(0.0, remaining_ms - DEADLINE_RESERVE_MS)
+        self.expires_at = None if self.budget_ms is None else self.started + self.budget_ms / 1000
+        self.generation_min_ms = self.reserve(DEADLINE_GENERATION_MIN_SHARE, DEADLINE_GENERATION_MIN_MS)
+        self.tts_reserve_ms = self.reserve(DEADLINE_TTS_RESERVE_SHARE, DEADLINE_TTS_RESERVE_MS)
+        self.persist_reserve_ms = self.reserve(DEADLINE_PERSIST_RESERVE_SHARE, DEADLINE_PERSIST_RESERVE_MS)
+    
+    @classmethod
+    def from_context(cls, context) -> 'Deadline':
+        limits = [DEADLINE_MAX_MS] if DEADLINE_MAX_MS > 0 else []
+        try:
+            limits.append(float(context.get_remaining_time_in_millis()))
+        except Exception:
+            pass
+        return cls(min(limits) if limits else None)
+    
+    def reserve(self, share: float, cap_ms: float) -> float:
+        """
+        share of the budget, at most cap_ms
+        """
+        if self.budget_ms is None:
+            return float(cap_ms)
+        return min(float(cap_ms), self.budget_ms * share)
+    
+    def generation_cutoff_ms(self) -> float:
+        """
+        Time left when generation stops so TTS and persistence can finish
+        """
+        return self.tts_reserve_ms + self.persist_reserve_ms
+    
+    def remaining_ms(self) -> float:
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, (self.expires_at - time.perf_counter()) * 1000)
+    
+    def expired(self, reserve_ms: float = 0) -> bool:
+        """
+        True once no more than reserve_ms is left for the stages after this one
+        """
+        return self.remaining_ms() <= reserve_ms
+    
+    def timeout(self, reserve_ms: float = 0, cap_ms: Optional[float] = None) -> Optional[float]:
+        """
+        Seconds a stage may wait while leaving reserve_ms, at most cap_ms; None if unbounded
+        """
+        limit_ms = self.remaining_ms() - reserve_ms
+        if cap_ms is not None:
+            limit_ms = min(limit_ms, cap_ms)
+        if limit_ms == float('inf'):
+            return None
+        return max(0.0, limit_ms / 1000)
+    
+    def close_at_cutoff(self, stream: Any, reserve_ms: float) -> Optional[threading.Timer]:
+        """
+        Close a blocking response stream once only reserve_ms is left, so a stalled
+        read cannot run the invocation into its timeout. Cancel the timer when done.
+        """
+        timeout = self.timeout(reserve_ms)
+        if timeout is None or not hasattr(stream, 'close'):
+            return None
+        
+        timer = threading.Timer(timeout, close_response_stream, (stream,))
+        timer.daemon = True
+        timer.start()
+        return timer
+    
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            'budgetMs': round(self.budget_ms, 1) if self.budget_ms is not None else None,
+            'remainingMs': round(self.remaining_ms(), 1) if self.expires_at is not None else None
+        }
+
+def close_response_stream(stream: Any) -> None:
+    """
+    Close a Bedrock response stream so the connection is not left reading an abandoned answer
+    """
+    try:
+        stream.close()
+    except Exception as e:
+        logger.warning("Could not close response stream at the deadline: %s", e)
+
+class PersistenceTicket:
+    """
+    Tracks the writes submitted for one session
+    """
+    
+    def __init__(self, futures: List[Future]):
+        self.futures = futures
+    
+    def wait(self, timeout: Optional[float] = None) -> None:
+        wait(self.futures, timeout=timeout)
+    
+    def status(self) -> str:
+        """
+        'committed' when every write succeeded, 'failed' if any write gave up,
+        otherwise 'queued'
+        """
+        if any(future.done() and not self._succeeded(future) for future in self.futures):
+            return 'failed'
+        if all(future.done() for future in self.futures):
+            return 'committed'
+        return 'queued'
+    
+    @staticmethod
+    def _succeeded(future: Future) -> bool:
+        return not future.cancelled() and future.exception() is None and bool(future.result())
+
+class PersistenceQueue:
+    """
+    Container-lived write pool with bounded queueing and retries with backoff
+    """
+    
+    def __init__(self, max_workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='persist')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending: set = set()
+        self._lock = threading.Lock()
+    
+    def submit(self, operation, *args, timeout: Optional[float] = None) -> Future:
+        """
+        Queue a save helper that returns True on success. A write that finds the queue
+        full for timeout seconds (PERSIST_FLUSH_TIMEOUT_MS if None) is returned already failed
+        """
+        future = self.try_submit(operation, *args, timeout=timeout)
+        if future is None:
+            logger.warning("Persistence queue full, %s not queued", getattr(operation, '__name__', operation))
+            future = Future()
+            future.set_result(False)
+        return future
+    
+    def try_submit(self, operation, *args, timeout: Optional[float] = None) -> Optional[Future]:
+        """
+        Queue a save helper, waiting at most timeout seconds (PERSIST_FLUSH_TIMEOUT_MS if None)
+        for a slot; None if the queue stayed full
+        """
+        if not self.slots.acquire(timeout=PERSIST_FLUSH_TIMEOUT_MS / 1000 if timeout is None else timeout):
+            return None
+        try:
+            future = self.executor.submit(self._run_with_retries, operation, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        with self._lock:
+            self.pending.add(future)
+        future.add_done_callback(self._release)
+        return future
+    
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self.pending.discard(future)
+        self.slots.release()
+    
+    @staticmethod
+    def _run_with_retries(operation, *args) -> bool:
+        for attempt in range(PERSIST_MAX_RETRIES + 1):
+            if operation(*args):
+                return True
+            if attempt < PERSIST_MAX_RETRIES:
+                # Exponential backoff with jitter
+                delay_ms = PERSIST_RETRY_BASE_MS * (2 ** attempt) * random.uniform(0.5, 1.5)
+                time.sleep(delay_ms / 1000)
         return False
+    
+    def flush(self, timeout: float, request_id: str = '-') -> bool:
+        """
+        Wait for all pending writes, returning False if any are still running at the timeout
+        """
+        with self._lock:
+            pending = list(self.pending)
+        if not pending:
+            return True
+        _, not_done = wait(pending, timeout=timeout)
+        if not_done:
+            logger.warning("[%s] %s AI Content writes still pending after flush", request_id, len(not_done))
+        return not not_done
+
+persistence_queue = PersistenceQueue(PERSIST_MAX_WORKERS, PERSIST_MAX_PENDING)
+
+def save_ai_content_parallel(
+    session_id: str, 
+    course_id: str, 
+    topic: str, 
+    student_id: str, 
+    prompt: str, 
+    response: str,
+    request_id: str,
+    trace: Optional['RequestTrace'] = None,
+    model_id: str = MODEL_ID,
+    audio_urls: Optional[List[str]] = None,
+    timing: Optional[Dict[str, Any]] = None,
+    audio_manifest: Optional[Dict[str, Any]] = None,
+    deadline: Optional['Deadline'] = None
+) -> PersistenceTicket:
+    """
+    Save AI content with parallel processing for better performance
+    Writes run on the shared persistence queue; the returned ticket reports their status
+    While the queue is full, writes wait for a slot only until the deadline's persist reserve
+    Each write is traced from submission, so queueing and retries count toward its span
+    With ARTIFACT_FORMAT=compact the session is a single artifact write instead
+    """
+    timestamp = datetime.now().isoformat()
+    ttl_timestamp = int(datetime.now().timestamp()) + (DEFAULT_TTL_DAYS * 86400)
+    if ARTIFACT_FORMAT == 'compact':
+        writes = [
+            ('artifact', save_session_artifact, (
+                session_id, course_id, topic, student_id, prompt, response, audio_urls or [], timing or {},
+                timestamp, ttl_timestamp, request_id, model_id, audio_manifest
+            ))
+        ]
+    else:
+        writes = [
+            ('prompt', save_bedrock_prompt, (session_id, topic, prompt, response, timestamp, request_id, model_id)),
+            ('text', save_text_output, (session_id, student_id, response, timestamp, request_id)),
+            ('metadata', save_metadata_to_dynamodb, (
+                session_id, course_id, topic, student_id, 
+                prompt, response, timestamp, ttl_timestamp, request_id, model_id
+            ))
+        ]
+    
+    timeout = deadline.timeout(deadline.persist_reserve_ms, PERSIST_FLUSH_TIMEOUT_MS) if deadline else None
+    stage_end = time.perf_counter() + timeout if timeout is not None else None
+    try:
+        futures = []
+        for target, operation, args in writes:
+            submitted = time.perf_counter()
+            future = persistence_queue.submit(
+                operation, *args, timeout=max(0.0, stage_end - submitted) if stage_end is not None else None
+            )
+            if trace:
+                future.add_done_callback(
+                    lambda done, target=target, submitted=submitted: trace.record(
+                        'PersistWrite', submitted, target=target, ok=PersistenceTicket._succeeded(done)
+                    )
+                )
+            futures.append(future)
+    except Exception as e:
+        logger.error("[%s] Error in parallel save operations: %s", request_id, e)
+        failed: Future = Future()
+        failed.set_result(False)
+        return PersistenceTicket([failed])
+    
+    return PersistenceTicket(futures)
 
 def save_bedrock_prompt(
     session_id: str, topic: str, prompt: str, response: str, 
-    timestamp: str, request_id: str
+    timestamp: str, request_id: str, model_id: str = MODEL_ID
 ) -> bool:
     """
     Save Bedrock prompt to S3
@@ -453,11 +2250,12 @@ def save_bedrock_prompt(
             'prompt': prompt,
             'response': response,
             'timestamp': timestamp,
-            'model': MODEL_ID,
+            'model': model_id,
             'requestId': request_id
         }
         
-        s3_client.put_object(
+        s3_call(
+            'put_object',
             Bucket=BUCKET_NAME,
             Key=key,
             Body=json.dumps(prompt_data, indent=2, ensure_ascii=False),
@@ -469,11 +2267,11 @@ def save_bedrock_prompt(
             }
         )
         
-        logger.debug(f"[{request_id}] Bedrock prompt saved: {key}")
+        logger.debug("[%s] Bedrock prompt saved: %s", request_id, key)
         return True
         
     except Exception as e:
-        logger.error(f"[{request_id}] Error saving Bedrock prompt: {e}")
+        logger.error("[%s] Error saving Bedrock prompt: %s", request_id, e)
         return False
 
 def save_text_output(
@@ -486,7 +2284,8 @@ def save_text_output(
     try:
         key = f"AIContent/TextOutput/{student_id}/{session_id}.txt"
         
-        s3_client.put_object(
+        s3_call(
+            'put_object',
             Bucket=BUCKET_NAME,
             Key=key,
             Body=response,
@@ -499,24 +2298,27 @@ def save_text_output(
             }
         )
         
-        logger.debug(f"[{request_id}] Text output saved: {key}")
+        logger.debug("[%s] Text output saved: %s", request_id, key)
         return True
         
     except Exception as e:
-        logger.error(f"[{request_id}] Error saving text output: {e}")
+        logger.error("[%s] Error saving text output: %s", request_id, e)
         return False
 
 def save_metadata_to_dynamodb(
     session_id: str, course_id: str, topic: str, student_id: str,
-    prompt: str, response: str, timestamp: str, ttl_timestamp: int, request_id: str
+    prompt: str, response: str, timestamp: str, ttl_timestamp: int, request_id: str,
+    model_id: str = MODEL_ID, artifact: Optional[Dict[str, Any]] = None
 ) -> bool:
     """
     Save session metadata to DynamoDB
+    artifact adds the compact session record's pointer and summary fields to the item
     """
     try:
-        table = dynamodb.Table(DYNAMODB_TABLE)
+        table = get_aws_client('dynamodb').Table(DYNAMODB_TABLE)
         table.put_item(
             Item={
+                **(artifact or {}),
                 'PK': f'VOICE_SESSION#{session_id}',
                 'SK': 'METADATA',
                 'sessionId': session_id,
@@ -525,7 +2327,7 @@ def save_metadata_to_dynamodb(
                 'studentId': student_id,
                 'responseLength': len(response),
                 'promptLength': len(prompt),
-                'model': MODEL_ID,
+                'model': model_id,
                 'createdAt': timestamp,
                 'requestId': request_id,
                 'TTL': ttl_timestamp,
@@ -534,39 +2336,330 @@ def save_metadata_to_dynamodb(
             }
         )
         
-        logger.debug(f"[{request_id}] Session metadata saved to DynamoDB")
+        logger.debug("[%s] Session metadata saved to DynamoDB", request_id)
         return True
         
     except Exception as e:
-        logger.error(f"[{request_id}] Error saving session metadata: {e}")
+        logger.error("[%s] Error saving session metadata: %s", request_id, e)
         return False
 
-def send_metric(metric_name: str, value: float, course_id: str) -> None:
+def session_artifact_key(student_id: str, session_id: str) -> str:
+    return f"{ARTIFACT_PREFIX}/{student_id}/{session_id}.json.gz"
+
+def save_session_artifact(
+    session_id: str, course_id: str, topic: str, student_id: str, prompt: str, response: str,
+    audio_urls: List[str], timing: Dict[str, Any], timestamp: str, ttl_timestamp: int,
+    request_id: str, model_id: str = MODEL_ID, audio_manifest: Optional[Dict[str, Any]] = None
+) -> bool:
     """
-    Send custom CloudWatch metrics
+    Save the whole session as one gzipped JSON object, then point the DynamoDB item at it
+    The pointer is only written after the object, so readers never follow a dangling key
     """
     try:
-        cloudwatch.put_metric_data(
-            Namespace='CognIA/VoiceStreaming',
-            MetricData=[{
+        key = session_artifact_key(student_id, session_id)
+        record = {
+            'version': ARTIFACT_VERSION,
+            'sessionId': session_id,
+            'courseId': course_id,
+            'topic': topic,
+            'studentId': student_id,
+            'prompt': prompt,
+            'response': response,
+            'audio': [{'index': i, 'url': url} for i, url in enumerate(audio_urls)],
+            **({'audioManifest': audio_manifest} if audio_manifest else {}),
+            'timing': timing,
+            'model': model_id,
+            'timestamp': timestamp,
+            'requestId': request_id
+        }
+        raw = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        body = gzip.compress(raw, compresslevel=ARTIFACT_COMPRESSION_LEVEL, mtime=0)
+        
+        s3_call(
+            'put_object',
+            Bucket=BUCKET_NAME,
+            Key=key,
+            Body=body,
+            ContentType='application/json',
+            ContentEncoding='gzip',
+            Metadata={
+                'sessionId': session_id,
+                'requestId': request_id,
+                'artifactVersion': str(ARTIFACT_VERSION)
+            }
+        )
+        logger.debug(
+            "[%s] Session artifact saved: %s (%s bytes, %s uncompressed)", request_id, key, len(body), len(raw)
+        )
+        
+        return save_metadata_to_dynamodb(
+            session_id, course_id, topic, student_id, prompt, response, timestamp, ttl_timestamp,
+            request_id, model_id,
+            artifact={
+                'artifactKey': key,
+                'artifactVersion': ARTIFACT_VERSION,
+                'artifactBytes': len(body),
+                'audioChunks': len(audio_urls),
+                # DynamoDB numbers must not be floats
+                'timeToFirstAudioMs': round(timing['timeToFirstAudioMs']) if timing.get('timeToFirstAudioMs') is not None else None
+            }
+        )
+        
+    except Exception as e:
+        logger.error("[%s] Error saving session artifact: %s", request_id, e)
+        return False
+
+def load_session_artifact(session_id: str, request_id: str = '-') -> Optional[Dict[str, Any]]:
+    """
+    Read a saved session in either layout: the compact record the DynamoDB item points to,
+    or the legacy prompt JSON and text output. Returns the compact record shape or None
+    """
+    try:
+        table = get_aws_client('dynamodb').Table(DYNAMODB_TABLE)
+        item = table.get_item(Key={'PK': f'VOICE_SESSION#{session_id}', 'SK': 'METADATA'}).get('Item')
+        if not item:
+            return None
+        
+        if item.get('artifactKey'):
+            body = s3_call('get_object', Bucket=BUCKET_NAME, Key=item['artifactKey'])['Body'].read()
+            if body[:2] == b'\x1f\x8b':
+                body = gzip.decompress(body)
+            return json.loads(body)
+        
+        prompt_data = json.loads(s3_call(
+            'get_object', Bucket=BUCKET_NAME, Key=f"AIContent/BedrockPrompts/{item['topic']}/{session_id}.json"
+        )['Body'].read())
+        return {
+            'version': 0,
+            'sessionId': session_id,
+            'courseId': item.get('courseId'),
+            'topic': item.get('topic'),
+            'studentId': item.get('studentId'),
+            'prompt': prompt_data.get('prompt'),
+            # The text output object holds the same response; it is only read when the prompt record lacks it
+            'response': prompt_data.get('response') if 'response' in prompt_data else s3_call(
+                'get_object', Bucket=BUCKET_NAME, Key=f"AIContent/TextOutput/{item['studentId']}/{session_id}.txt"
+            )['Body'].read().decode('utf-8'),
+            'audio': [],
+            'timing': {},
+            'model': prompt_data.get('model', item.get('model')),
+            'timestamp': prompt_data.get('timestamp', item.get('createdAt')),
+            'requestId': prompt_data.get('requestId', item.get('requestId'))
+        }
+        
+    except Exception as e:
+        logger.error("[%s] Error loading session %s: %s", request_id, session_id, e)
+        return None
+
+class RequestTrace:
+    """
+    Lightweight timing spans and log counters for one request, recorded from any thread.
+    Spans are emitted as <name>Latency metrics and, in debug mode, returned in the metadata.
+    Hot-path events are counted and summarized in one log record per request; their
+    detail lines are only logged for a LOG_SAMPLE_RATE sample of requests or at DEBUG.
+    """
+    
+    def __init__(self, request_id: str, started: float):
+        self.request_id = request_id
+        self.started = started
+        self.course_id = 'unknown'
+        self.spans: List[Dict[str, Any]] = []
+        self.values: Dict[str, Tuple[float, str]] = {}
+        self.counters: Counter = Counter()
+        self.annotations: Dict[str, Any] = {}
+        self.sampled = random.random() < LOG_SAMPLE_RATE
+        self._lock = threading.Lock()
+    
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+    
+    def annotate(self, **fields) -> None:
+        with self._lock:
+            self.annotations.update(fields)
+    
+    def detail(self, message: str, *args) -> None:
+        """
+        Log a %-style detail line; arguments are only formatted if the line is emitted
+        """
+        level = logging.INFO if self.sampled else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, '[%s] ' + message, self.request_id, *args)
+    
+    def record(self, name: str, started: float, ended: Optional[float] = None, **attributes) -> float:
+        """
+        Close a span that began at the perf_counter() value started; returns its duration in ms
+        """
+        if ended is None:
+            ended = time.perf_counter()
+        span = {
+            'name': name,
+            'startMs': round((started - self.started) * 1000, 1),
+            'durationMs': round((ended - started) * 1000, 1)
+        }
+        span.update(attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span['durationMs']
+    
+    def set_value(self, name: str, value: float, unit: str) -> None:
+        with self._lock:
+            self.values[name] = (value, unit)
+    
+    def to_metadata(self) -> Dict[str, Any]:
+        """
+        Spans in start order plus per-stage count, total and max durations
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['startMs'])
+            values = {name: value for name, (value, _) in self.values.items()}
+        stages: Dict[str, Dict[str, float]] = {}
+        for span in spans:
+            stage = stages.setdefault(span['name'], {'count': 0, 'totalMs': 0.0, 'maxMs': 0.0})
+            stage['count'] += 1
+            stage['totalMs'] = round(stage['totalMs'] + span['durationMs'], 1)
+            stage['maxMs'] = max(stage['maxMs'], span['durationMs'])
+        return {'spans': spans, 'stages': stages, 'values': values}
+    
+    def log_summary(self, result: Optional[Dict[str, Any]]) -> None:
+        """
+        Write the request's single structured summary record
+        """
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        trace = self.to_metadata()
+        with self._lock:
+            summary = {
+                'event': 'request_summary',
+                'requestId': self.request_id,
+                'courseId': self.course_id,
+                'statusCode': result.get('statusCode') if result else 500,
+                'latencyMs': round((time.perf_counter() - self.started) * 1000, 1),
+                'counters': dict(self.counters),
+                'stages': trace['stages'],
+                'values': trace['values'],
+                'sampled': self.sampled
+            }
+            summary.update(self.annotations)
+        logger.info(json.dumps(summary, ensure_ascii=False))
+    
+    def send_metrics(self) -> None:
+        with self._lock:
+            spans = list(self.spans)
+            values = dict(self.values)
+        for span in spans:
+            send_metric(f"{span['name']}Latency", span['durationMs'], self.course_id, 'Milliseconds')
+        for name, (value, unit) in values.items():
+            send_metric(name, value, self.course_id, unit)
+
+class MetricsBuffer:
+    """
+    Collects a request's metric data points and flushes them as one batch.
+    Repeated values of a metric (latencies) are kept as a histogram.
+    """
+    
+    def __init__(self):
+        self._points: Dict[Tuple[str, str, str], List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, metric_name: str, value: float, course_id: str, unit: str) -> None:
+        with self._lock:
+            self._points.setdefault((metric_name, course_id, unit), []).append(value)
+    
+    def drain(self) -> Dict[Tuple[str, str, str], List[float]]:
+        with self._lock:
+            points, self._points = self._points, {}
+        return points
+    
+    def flush(self) -> None:
+        """
+        Emit buffered metrics without blocking the caller; failures are only logged
+        """
+        points = self.drain()
+        if not points:
+            return
+        try:
+            if METRICS_MODE == 'batch':
+                metrics_executor.submit(put_metric_batch, points)
+            else:
+                write_emf_records(points)
+        except Exception as e:
+            logger.warning("Failed to flush %s CloudWatch metrics: %s", len(points), e)
+
+def write_emf_records(points: Dict[Tuple[str, str, str], List[float]]) -> None:
+    """
+    Write metrics as CloudWatch Embedded Metric Format log lines, one per course
+    """
+    by_course: Dict[str, Dict[str, Any]] = {}
+    for (metric_name, course_id, unit), values in points.items():
+        record = by_course.setdefault(course_id, {'metrics': [], 'values': {}})
+        record['metrics'].append({'Name': metric_name, 'Unit': unit})
+        record['values'][metric_name] = values[0] if len(values) == 1 else values
+    
+    timestamp = int(time.time() * 1000)
+    for course_id, record in by_course.items():
+        emf = {
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Course', 'Environment']],
+                    'Metrics': record['metrics']
+                }]
+            },
+            'Course': course_id,
+            'Environment': ENVIRONMENT
+        }
+        emf.update(record['values'])
+        sys.stdout.write(json.dumps(emf) + '\n')
+    sys.stdout.flush()
+
+def put_metric_batch(points: Dict[Tuple[str, str, str], List[float]]) -> None:
+    """
+    Send buffered metrics with a single put_metric_data call (runs on the metrics executor)
+    """
+    try:
+        timestamp = datetime.now()
+        metric_data = []
+        for (metric_name, course_id, unit), values in points.items():
+            histogram = Counter(values)
+            metric_data.append({
                 'MetricName': metric_name,
                 'Dimensions': [
                     {'Name': 'Course', 'Value': course_id},
-                    {'Name': 'Environment', 'Value': os.environ.get('ENVIRONMENT', 'production')}
+                    {'Name': 'Environment', 'Value': ENVIRONMENT}
                 ],
-                'Value': value,
-                'Unit': 'Count' if metric_name.endswith('Errors') or metric_name == 'SessionsProcessed' else 'None',
-                'Timestamp': datetime.now()
-            }]
-        )
+                'Values': list(histogram.keys()),
+                'Counts': [float(count) for count in histogram.values()],
+                'Unit': unit,
+                'Timestamp': timestamp
+            })
+        for start in range(0, len(metric_data), 1000):
+            get_aws_client('cloudwatch').put_metric_data(
+                Namespace=METRICS_NAMESPACE,
+                MetricData=metric_data[start:start + 1000]
+            )
     except Exception as e:
-        logger.warning(f"Failed to send CloudWatch metric {metric_name}: {e}")
+        logger.warning("Failed to send CloudWatch metric batch: %s", e)
+
+metrics_buffer = MetricsBuffer()
+# Single background worker so batch flushes never hold up a response
+metrics_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metrics')
+
+def send_metric(metric_name: str, value: float, course_id: str, unit: Optional[str] = None) -> None:
+    """
+    Buffer a custom CloudWatch metric for the end-of-request flush
+    """
+    if unit is None:
+        unit = 'Count' if metric_name.endswith('Errors') or metric_name == 'SessionsProcessed' else 'None'
+    
+    metrics_buffer.add(metric_name, value, course_id, unit)
 
 def handle_session_stop(session_id: str, request_id: str) -> Dict[str, Any]:
     """
     Handle session stop cleanup with metrics
     """
-    logger.info(f"[{request_id}] Stopping session: {session_id}")
+    logger.info("[%s] Stopping session: %s", request_id, session_id)
     
     if ENABLE_METRICS:
         send_metric('SessionsStopped', 1, 'unknown')
@@ -619,57 +2712,1177 @@ def create_error_response(status_code: int, message: str, request_id: str, origi
         })
     }
 
-def generate_audio_from_text(text: str, session_id: str, student_id: str, request_id: str, chunk_index: int = 0) -> Optional[str]:
+def parse_audio_profiles(config: str) -> Dict[str, Dict[str, str]]:
+    """
+    Merge the AUDIO_PROFILES JSON object over DEFAULT_AUDIO_PROFILES, dropping invalid entries
+    """
+    profiles = {name: dict(profile) for name, profile in DEFAULT_AUDIO_PROFILES.items()}
+    try:
+        overrides = json.loads(config) if config else {}
+    except json.JSONDecodeError as e:
+        logger.error("Invalid AUDIO_PROFILES, using the default profiles: %s", e)
+        overrides = {}
+    
+    for name, profile in (overrides.items() if isinstance(overrides, dict) else []):
+        if not isinstance(profile, dict):
+            continue
+        merged = dict(profiles.get(name, DEFAULT_AUDIO_PROFILES['standard']), **profile)
+        merged['sampleRate'] = str(merged['sampleRate'])
+        if (
+            merged['outputFormat'] not in AUDIO_FORMATS
+            or merged['sampleRate'] not in POLLY_SAMPLE_RATES[merged['outputFormat']]
+            or merged['engine'] not in POLLY_ENGINES
+        ):
+            logger.error("Ignoring invalid audio profile %s: %s", name, profile)
+            continue
+        profiles[name] = {key: merged[key] for key in ('outputFormat', 'sampleRate', 'engine')}
+    return profiles
+
+def parse_client_audio_profiles(config: str) -> Dict[str, str]:
+    try:
+        mapping = json.loads(config) if config else {}
+    except json.JSONDecodeError as e:
+        logger.error("Invalid AUDIO_PROFILE_BY_CLIENT, ignoring it: %s", e)
+        return {}
+    return {str(client): str(profile) for client, profile in mapping.items()} if isinstance(mapping, dict) else {}
+
+audio_profiles = parse_audio_profiles(AUDIO_PROFILES)
+client_audio_profiles = parse_client_audio_profiles(AUDIO_PROFILE_BY_CLIENT)
+
+def resolve_audio_profile(body: Dict[str, Any]) -> str:
+    """
+    Profile named by the request, else the one mapped to its clientType, else DEFAULT_AUDIO_PROFILE
+    """
+    for name in (body.get('audioProfile'), client_audio_profiles.get(str(body.get('clientType')))):
+        if name in audio_profiles:
+            return name
+    return DEFAULT_AUDIO_PROFILE if DEFAULT_AUDIO_PROFILE in audio_profiles else 'standard'
+
+def get_voice_settings(audio_profile: str = DEFAULT_AUDIO_PROFILE) -> Dict[str, str]:
+    """
+    Resolve the Polly voice settings used for synthesis with the given audio profile
+    """
+    profile = audio_profiles.get(audio_profile) or audio_profiles['standard']
+    content_type, extension = AUDIO_FORMATS[profile['outputFormat']]
+    if profile['outputFormat'] == 'pcm':
+        # Polly PCM is signed 16-bit little-endian mono
+        content_type = f"{content_type};rate={profile['sampleRate']};channels=1"
+    # Select voice based on language detection
+    voice_id = 'Mia' if 'es' in os.environ.get('DEFAULT_LANGUAGE', 'es') else 'Joanna'
+    return {
+        'voiceId': voice_id,
+        'engine': profile['engine'],
+        'outputFormat': profile['outputFormat'],
+        'sampleRate': profile['sampleRate'],
+        'languageCode': 'es-ES' if voice_id == 'Mia' else 'en-US',
+        'contentType': content_type,
+        'extension': extension
+    }
+
+def normalize_tts_text(text: str) -> str:
+    """
+    Normalize text so equivalent sentences share one cache entry
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+def tts_cache_key(text: str, settings: Dict[str, str]) -> str:
+    """
+    Content address for synthesized audio: normalized text plus voice settings
+    """
+    material = '\x1f'.join([
+        normalize_tts_text(text),
+        settings['voiceId'],
+        settings['engine'],
+        settings['outputFormat'],
+        settings['sampleRate'],
+        settings['languageCode']
+    ])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def record_tts_cache(outcome: str) -> None:
+    with tts_cache_stats_lock:
+        tts_cache_stats[outcome] += 1
+
+def get_tts_cache_stats() -> Dict[str, int]:
+    with tts_cache_stats_lock:
+        return dict(tts_cache_stats)
+
+def record_audio_upload(duration_ms: float) -> None:
+    with audio_upload_stats_lock:
+        audio_upload_stats['ewmaMs'] = (
+            duration_ms if audio_upload_stats['uploads'] == 0
+            else 0.2 * duration_ms + 0.8 * audio_upload_stats['ewmaMs']
+        )
+        audio_upload_stats['uploads'] += 1
+
+def expected_audio_upload_ms() -> float:
+    with audio_upload_stats_lock:
+        if audio_upload_stats['uploads'] == 0:
+            return AUDIO_UPLOAD_PRIOR_MS
+        return audio_upload_stats['ewmaMs']
+
+def lookup_tts_cache(cache_key: str, audio_key: str, request_id: str) -> Optional[str]:
+    """
+    Look up synthesized audio in the in-memory tier, then the shared S3 prefix
+    Returns the CloudFront URL on a hit
+    """
+    cloudfront_url = tts_cache.get(cache_key)
+    if cloudfront_url:
+        record_tts_cache('memoryHits')
+        return cloudfront_url
+    
+    try:
+        s3_call('head_object', Bucket=BUCKET_NAME, Key=audio_key)
+    except Exception as e:
+        if aws_error_code(e) not in ('404', 'NoSuchKey', 'NotFound') and not isinstance(e, CircuitOpenError):
+            logger.warning("[%s] TTS cache lookup failed for %s: %s", request_id, audio_key, e)
+        record_tts_cache('misses')
+        return None
+    
+    cloudfront_url = f"{CLOUDFRONT_URL}/{audio_key}"
+    tts_cache.put(cache_key, cloudfront_url)
+    record_tts_cache('s3Hits')
+    return cloudfront_url
+
+def synthesize_polly_audio(text: str, settings: Dict[str, str], trace: Optional['RequestTrace'] = None) -> bytes:
+    """
+    Synthesize text with Polly under the concurrency limit and the Polly circuit breaker
+    """
+    if trace:
+        trace.count('pollyCalls')
+        trace.count('pollyChars', len(text))
+    with polly_semaphore:
+        # Synthesis and the stream read count toward the Polly breaker's latency
+        return guarded_call('polly', lambda: get_aws_client('polly').synthesize_speech(
+            Text=text,
+            OutputFormat=settings['outputFormat'],
+            SampleRate=settings['sampleRate'],
+            VoiceId=settings['voiceId'],
+            Engine=settings['engine'],
+            LanguageCode=settings['languageCode']
+        )['AudioStream'].read())
+
+def generate_audio_from_text(
+    text: str, session_id: str, student_id: str, request_id: str, chunk_index: int = 0,
+    trace: Optional['RequestTrace'] = None,
+    inline_audio: Optional[Callable[[int, bytes], bool]] = None,
+    audio_profile: str = DEFAULT_AUDIO_PROFILE
+) -> Optional[str]:
     """
     Generate audio from text using Amazon Polly and save to S3
     Returns the S3 URL of the generated audio file
+    With ENABLE_TTS_CACHE, repeated sentences reuse audio under TTS_CACHE_PREFIX
+    Audio up to AUDIO_INLINE_MAX_BYTES is offered to inline_audio; when accepted,
+    the upload is queued on the persistence queue instead of awaited and the
+    returned URL may not exist yet, so it must not be handed to clients
+    audio_profile selects the output format, sample rate and engine (see AUDIO_PROFILES)
     """
+    detail = trace.detail if trace else (lambda message, *args: logger.debug('[%s] ' + message, request_id, *args))
     try:
-        logger.info(f"[{request_id}] 🔊 Generating audio chunk {chunk_index} for text: {text[:50]}...")
-        # Select voice based on language detection
-        voice_id = 'Mia' if 'es' in os.environ.get('DEFAULT_LANGUAGE', 'es') else 'Joanna'
+        settings = get_voice_settings(audio_profile)
+        
+        cache_key = None
+        if ENABLE_TTS_CACHE:
+            cache_key = tts_cache_key(text, settings)
+            audio_key = f"{TTS_CACHE_PREFIX}/{cache_key}.{settings['extension']}"
+            cached_url = lookup_tts_cache(cache_key, audio_key, request_id)
+            if cached_url:
+                detail("♻️ TTS cache hit for chunk %d: %s", chunk_index, cached_url)
+                return cached_url
+        else:
+            timestamp = datetime.now().isoformat().split('T')[0]
+            audio_key = f"AIContent/VoiceSessions/{student_id}/{timestamp}/{session_id}_chunk{chunk_index}.{settings['extension']}"
+        
+        # Audio that cannot be stored has no URL: skip Polly while S3 is failing fast
+        if dependency_open('s3'):
+            raise CircuitOpenError("s3 circuit is open")
+        
+        detail("🔊 Generating audio chunk %d for text: %.50s...", chunk_index, text)
         
         # Synthesize speech using Polly
-        logger.info(f"[{request_id}] 🗣️ Calling Polly with voice {voice_id} for {len(text)} chars")
-        polly_response = polly_client.synthesize_speech(
-            Text=text,
-            OutputFormat='mp3',
-            VoiceId=voice_id,
-            Engine='neural',  # Use neural voice for better quality
-            LanguageCode='es-ES' if voice_id == 'Mia' else 'en-US'
-        )
-        logger.info(f"[{request_id}] ✅ Polly synthesis successful")
+        detail("🗣️ Calling Polly with voice %s for %d chars", settings['voiceId'], len(text))
+        audio_stream = synthesize_polly_audio(text, settings, trace)
+        detail("✅ Polly synthesis successful")
+        
+        metadata = {
+            'sessionId': session_id,
+            'studentId': student_id,
+            'chunkIndex': str(chunk_index),
+            'requestId': request_id,
+            'createdAt': datetime.now().isoformat()
+        }
         
-        # Read audio stream
-        audio_stream = polly_response['AudioStream'].read()
+        # Generate CloudFront URL
+        cloudfront_url = f"{CLOUDFRONT_URL}/{audio_key}"
+        if inline_audio and len(audio_stream) <= AUDIO_INLINE_MAX_BYTES and inline_audio(chunk_index, audio_stream):
+            # The client plays the inlined bytes; the object is kept for history
+            upload_args = (audio_key, audio_stream, metadata, cache_key, request_id, settings['contentType'])
+            if persistence_queue.try_submit(save_audio_object, *upload_args, timeout=0) is None:
+                # Queue full: upload on this worker rather than wait for a slot
+                save_audio_object(*upload_args)
+            detail("Audio inlined (%d bytes), upload queued: %s", len(audio_stream), cloudfront_url)
+            return cloudfront_url
         
         # Save audio to S3
-        timestamp = datetime.now().isoformat().split('T')[0]
-        audio_key = f"AIContent/VoiceSessions/{student_id}/{timestamp}/{session_id}_chunk{chunk_index}.mp3"
+        if not save_audio_object(audio_key, audio_stream, metadata, cache_key, request_id, settings['contentType']):
+            return None
+        detail("Audio generated and saved: %s", cloudfront_url)
+        
+        return cloudfront_url
+        
+    except CircuitOpenError as e:
+        detail("Skipping audio chunk %d: %s", chunk_index, e)
+        return None
+    except Exception as e:
+        logger.error("[%s] Error generating audio with Polly: %s", request_id, e)
+        return None
+
+def save_audio_object(
+    audio_key: str, audio: bytes, metadata: Dict[str, str], cache_key: Optional[str], request_id: str,
+    content_type: str = 'audio/mpeg'
+) -> bool:
+    """
+    Save synthesized audio to S3 and, for cacheable units, publish it to the TTS cache
+    """
+    try:
+        started = time.perf_counter()
+        s3_call(
+            'put_object',
+            Bucket=BUCKET_NAME,
+            Key=audio_key,
+            Body=audio,
+            ContentType=content_type,
+            Metadata=metadata
+        )
+        record_audio_upload((time.perf_counter() - started) * 1000)
+        if cache_key:
+            tts_cache.put(cache_key, f"{CLOUDFRONT_URL}/{audio_key}")
+        return True
+        
+    except Exception as e:
+        logger.error("[%s] Error saving audio %s: %s", request_id, audio_key, e)
+        return False
+
+def synthesize_audio_unit(
+    text: str, request_id: str, chunk_index: int = 0, trace: Optional['RequestTrace'] = None,
+    audio_profile: str = DEFAULT_AUDIO_PROFILE
+) -> Optional[bytes]:
+    """
+    Synthesize one unit for audio assembly, keeping the MP3 in memory instead of uploading it
+    """
+    detail = trace.detail if trace else (lambda message, *args: logger.debug('[%s] ' + message, request_id, *args))
+    try:
+        # The assembled object is uploaded to S3 too
+        if dependency_open('s3'):
+            raise CircuitOpenError("s3 circuit is open")
+        detail("🔊 Synthesizing audio unit %d for assembly: %.50s...", chunk_index, text)
+        return synthesize_polly_audio(text, get_voice_settings(audio_profile), trace)
+    except CircuitOpenError as e:
+        detail("Skipping audio chunk %d: %s", chunk_index, e)
+        return None
+    except Exception as e:
+        logger.error("[%s] Error generating audio with Polly: %s", request_id, e)
+        return None
+
+# MPEG audio Layer III tables, indexed by the frame header fields
+MP3_BITRATES_KBPS = {
+    'mpeg1': (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    'mpeg2': (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def parse_mp3_frame_header(data: bytes, pos: int) -> Optional[Tuple[int, float]]:
+    """
+    Parse the Layer III frame header at pos, returning (frame length in bytes, duration in ms)
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 0x03  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = (data[pos + 1] >> 1) & 0x03  # 1 = Layer III
+    bitrate_index = data[pos + 2] >> 4
+    sample_rate_index = (data[pos + 2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    padding = (data[pos + 2] >> 1) & 0x01
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    if version == 3:
+        bitrate = MP3_BITRATES_KBPS['mpeg1'][bitrate_index] * 1000
+        return 144 * bitrate // sample_rate + padding, 1152 * 1000 / sample_rate
+    bitrate = MP3_BITRATES_KBPS['mpeg2'][bitrate_index] * 1000
+    return 72 * bitrate // sample_rate + padding, 576 * 1000 / sample_rate
+
+def mp3_audio_frames(data: bytes) -> Tuple[int, int, float]:
+    """
+    Locate the audio frames of one MP3 unit, skipping an ID3v2 tag, a leading Xing/Info/VBRI
+    frame and a truncated last frame, so units can be concatenated into one stream
+    Returns (start offset, end offset, duration in ms); units that do not parse are kept whole
+    """
+    pos = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        tag_size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+    
+    start = end = None
+    duration_ms = 0.0
+    while True:
+        frame = parse_mp3_frame_header(data, pos)
+        if frame is None or pos + frame[0] > len(data):
+            break
+        frame_length, frame_ms = frame
+        if start is None and any(tag in data[pos + 4:pos + 40] for tag in (b'Xing', b'Info', b'VBRI')):
+            # Encoder header frame; it describes the unit alone and carries no audio
+            pos += frame_length
+            continue
+        if start is None:
+            start = pos
+        pos += frame_length
+        end = pos
+        duration_ms += frame_ms
+    
+    if start is None:
+        return 0, len(data), 0.0
+    return start, end, duration_ms
+
+def save_assembled_audio(
+    units: List[Tuple[int, str, bytes]], session_id: str, student_id: str, request_id: str,
+    timeout: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Join an answer's MP3 units into one object and describe each unit's byte range and timing
+    The manifest is returned to the client and written next to the audio off the response path,
+    waiting at most timeout seconds for a persistence queue slot
+    """
+    try:
+        parts = []
+        segments = []
+        offset = 0
+        start_ms = 0.0
+        for chunk_index, text, data in units:
+            start, end, duration_ms = mp3_audio_frames(data)
+            parts.append(data[start:end])
+            segments.append({
+                'chunkIndex': chunk_index,
+                'offset': offset,
+                'length': end - start,
+                'startMs': round(start_ms, 1),
+                'durationMs': round(duration_ms, 1),
+                'chars': len(text)
+            })
+            offset += end - start
+            start_ms += duration_ms
         
-        s3_client.put_object(
+        timestamp = datetime.now().isoformat().split('T')[0]
+        audio_key = f"AIContent/VoiceSessions/{student_id}/{timestamp}/{session_id}_{request_id}.mp3"
+        s3_call(
+            'put_object',
             Bucket=BUCKET_NAME,
             Key=audio_key,
-            Body=audio_stream,
+            Body=b''.join(parts),
             ContentType='audio/mpeg',
             Metadata={
                 'sessionId': session_id,
                 'studentId': student_id,
-                'chunkIndex': str(chunk_index),
+                'segments': str(len(segments)),
                 'requestId': request_id,
                 'createdAt': datetime.now().isoformat()
             }
         )
         
-        # Generate CloudFront URL
-        cloudfront_url = f"https://d2sn3lk5751y3y.cloudfront.net/{audio_key}"
-        logger.info(f"[{request_id}] Audio generated and saved: {cloudfront_url}")
-        
-        return cloudfront_url
+        manifest_key = audio_key[:-len('.mp3')] + '.json'
+        manifest = {
+            'version': 1,
+            'url': f"{CLOUDFRONT_URL}/{audio_key}",
+            'manifestUrl': f"{CLOUDFRONT_URL}/{manifest_key}",
+            'contentType': 'audio/mpeg',
+            'bytes': offset,
+            'durationMs': round(start_ms, 1),
+            'segments': segments
+        }
+        persistence_queue.submit(save_audio_manifest, manifest_key, manifest, request_id, timeout=timeout)
+        return manifest
         
     except Exception as e:
-        logger.error(f"[{request_id}] Error generating audio with Polly: {e}")
+        logger.error("[%s] Error saving assembled audio: %s", request_id, e)
         return None
 
+def save_audio_manifest(key: str, manifest: Dict[str, Any], request_id: str) -> bool:
+    """
+    Save an assembled answer's byte-range manifest to S3
+    """
+    try:
+        s3_call(
+            'put_object',
+            Bucket=BUCKET_NAME,
+            Key=key,
+            Body=json.dumps(manifest, separators=(',', ':')),
+            ContentType='application/json'
+        )
+        return True
+    except Exception as e:
+        logger.error("[%s] Error saving audio manifest: %s", request_id, e)
+        return False
+
+def parse_model_tiers(config: str) -> List[Dict[str, Any]]:
+    """
+    Parse the MODEL_TIERS JSON list; empty when it is unset or invalid
+    """
+    try:
+        raw_tiers = json.loads(config) if config else []
+    except json.JSONDecodeError as e:
+        logger.error("Invalid MODEL_TIERS, routing to %s only: %s", MODEL_ID, e)
+        raw_tiers = []
+    
+    tiers = []
+    for i, tier in enumerate(raw_tiers if isinstance(raw_tiers, list) else []):
+        if not isinstance(tier, dict) or not tier.get('modelId'):
+            continue
+        tiers.append({
+            'name': str(tier.get('name', f'tier{i}')),
+            'modelId': tier['modelId'],
+            'maxTokens': int(tier.get('maxTokens', MAX_TOKENS)),
+            # Priors used until the container has observed the model
+            'ttftMs': float(tier.get('ttftMs', 600)),
+            'tokensPerSecond': float(tier.get('tokensPerSecond', 80)),
+            'prefillMsPer1kTokens': float(tier.get('prefillMsPer1kTokens', 100))
+        })
+    return tiers
+
+class ModelRouter:
+    """
+    Chooses a model tier and max_tokens per request from LATENCY_SLO_MS, the prompt
+    size and container-lived EWMAs of each tier's TTFT and output throughput.
+    Tiers are ordered preferred first, fastest last. A tier is skipped for the next
+    one when its expected TTFT passes TTFT_FALLBACK_MS, it cannot fit
+    MIN_RESPONSE_TOKENS in the SLO, or it was throttled recently.
+    Without configured tiers BEDROCK_MODEL_ID is the only tier and keeps MAX_TOKENS.
+    """
+    
+    def __init__(self, tiers: List[Dict[str, Any]]):
+        self.size_answers = bool(tiers)
+        self.tiers = tiers or [{
+            'name': 'primary', 'modelId': MODEL_ID, 'maxTokens': MAX_TOKENS,
+            'ttftMs': 600.0, 'tokensPerSecond': 80.0, 'prefillMsPer1kTokens': 100.0
+        }]
+        self.stats = {
+            tier['name']: {'ttftMs': None, 'tokensPerSecond': None, 'samples': 0, 'throttles': 0, 'throttledUntil': 0.0}
+            for tier in self.tiers
+        }
+        self._lock = threading.Lock()
+    
+    def expected(self, tier: Dict[str, Any], prompt_tokens: int) -> Tuple[float, float]:
+        stats = self.stats[tier['name']]
+        base_ttft_ms = stats['ttftMs'] if stats['ttftMs'] is not None else tier['ttftMs']
+        ttft_ms = base_ttft_ms + prompt_tokens / 1000 * tier['prefillMsPer1kTokens']
+        return ttft_ms, stats['tokensPerSecond'] or tier['tokensPerSecond']
+    
+    def fitting_tokens(self, tier: Dict[str, Any], ttft_ms: float, tokens_per_second: float, elapsed_ms: float) -> int:
+        """
+        Output tokens the tier can generate before the SLO, rounded down to MAX_TOKENS_STEP
+        """
+        if not self.size_answers:
+            return tier['maxTokens']
+        budget_ms = LATENCY_SLO_MS - elapsed_ms - ttft_ms
+        return int(budget_ms / 1000 * tokens_per_second) // MAX_TOKENS_STEP * MAX_TOKENS_STEP
+    
+    def route(self, prompt_tokens: int, elapsed_ms: float) -> Dict[str, Any]:
+        """
+        Pick the first tier that fits, or the fastest one, with max_tokens sized to the SLO
+        """
+        now = time.time()
+        skipped = []
+        chosen = None
+        with self._lock:
+            for tier in self.tiers:
+                ttft_ms, tokens_per_second = self.expected(tier, prompt_tokens)
+                fitting_tokens = self.fitting_tokens(tier, ttft_ms, tokens_per_second, elapsed_ms)
+                candidate = (tier, ttft_ms, tokens_per_second, fitting_tokens)
+                if not self.size_answers:
+                    chosen = candidate  # nothing to fall back to
+                    break
+                if self.stats[tier['name']]['throttledUntil'] > now:
+                    skipped.append({'tier': tier['name'], 'reason': 'throttled'})
+                elif ttft_ms > TTFT_FALLBACK_MS:
+                    skipped.append({'tier': tier['name'], 'reason': 'ttft'})
+                elif fitting_tokens < MIN_RESPONSE_TOKENS:
+                    skipped.append({'tier': tier['name'], 'reason': 'slo'})
+                else:
+                    chosen = candidate
+                    break
+            if chosen is None:
+                # Nothing fits: take the fastest tier that is not cooling down
+                available = [t for t in self.tiers if self.stats[t['name']]['throttledUntil'] <= now] or self.tiers
+                tier = available[-1]
+                ttft_ms, tokens_per_second = self.expected(tier, prompt_tokens)
+                fitting_tokens = self.fitting_tokens(tier, ttft_ms, tokens_per_second, elapsed_ms)
+                chosen = (tier, ttft_ms, tokens_per_second, fitting_tokens)
+        
+        tier, ttft_ms, tokens_per_second, fitting_tokens = chosen
+        return {
+            'tier': tier['name'],
+            'modelId': tier['modelId'],
+            'maxTokens': max(MIN_RESPONSE_TOKENS, min(tier['maxTokens'], fitting_tokens)),
+            'expectedTtftMs': round(ttft_ms, 1),
+            'expectedTokensPerSecond': round(tokens_per_second, 1),
+            'sloMs': LATENCY_SLO_MS,
+            'promptTokens': prompt_tokens,
+            'skipped': skipped,
+            'fallbacks': []
+        }
+    
+    def fallback_chain(self, tier_name: str) -> List[Dict[str, Any]]:
+        """
+        The routed tier followed by the faster tiers after it
+        """
+        names = [tier['name'] for tier in self.tiers]
+        return self.tiers[names.index(tier_name):]
+    
+    def observe(
+        self, tier_name: str, ttft_ms: float, prompt_tokens: int,
+        output_tokens: Optional[int], decode_seconds: float
+    ) -> None:
+        """
+        Fold one generation into the tier's EWMAs; TTFT is stored net of prompt prefill
+        """
+        tier = next(tier for tier in self.tiers if tier['name'] == tier_name)
+        base_ttft_ms = max(0.0, ttft_ms - prompt_tokens / 1000 * tier['prefillMsPer1kTokens'])
+        with self._lock:
+            stats = self.stats[tier_name]
+            stats['samples'] += 1
+            stats['ttftMs'] = base_ttft_ms if stats['ttftMs'] is None else (
+                MODEL_STATS_ALPHA * base_ttft_ms + (1 - MODEL_STATS_ALPHA) * stats['ttftMs']
+            )
+            if output_tokens and decode_seconds > 0:
+                tokens_per_second = output_tokens / decode_seconds
+                stats['tokensPerSecond'] = tokens_per_second if stats['tokensPerSecond'] is None else (
+                    MODEL_STATS_ALPHA * tokens_per_second + (1 - MODEL_STATS_ALPHA) * stats['tokensPerSecond']
+                )
+    
+    def record_throttle(self, tier_name: str) -> None:
+        with self._lock:
+            self.stats[tier_name]['throttles'] += 1
+            self.stats[tier_name]['throttledUntil'] = time.time() + MODEL_THROTTLE_COOLDOWN_SECONDS
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Observed latency per tier for the response metadata
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                name: {
+                    'ttftMs': round(stats['ttftMs'], 1) if stats['ttftMs'] is not None else None,
+                    'tokensPerSecond': round(stats['tokensPerSecond'], 1) if stats['tokensPerSecond'] is not None else None,
+                    'samples': stats['samples'],
+                    'throttles': stats['throttles'],
+                    'throttled': stats['throttledUntil'] > now
+                }
+                for name, stats in self.stats.items()
+            }
+
+def invoke_routed_model(
+    bedrock_request: Dict[str, Any], route: Dict[str, Any], request_id: str
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Invoke the routed tier, moving to the next faster tier when Bedrock throttles
+    or the tier's circuit breaker is open
+    Updates route with the tier used; returns the stream and the request body sent
+    """
+    last_error: Optional[Exception] = None
+    for tier in model_router.fallback_chain(route['tier']):
+        request_body = dict(bedrock_request, max_tokens=min(route['maxTokens'], tier['maxTokens']))
+        try:
+            response = guarded_call(
+                f"bedrock:{tier['name']}",
+                get_aws_client('bedrock-runtime').invoke_model_with_response_stream,
+                modelId=tier['modelId'],
+                contentType='application/json',
+                accept='application/json',
+                body=json.dumps(request_body)
+            )
+        except CircuitOpenError as e:
+            route['fallbacks'].append({'tier': tier['name'], 'error': 'CircuitOpen'})
+            last_error = e
+            continue
+        except Exception as e:
+            error_code = aws_error_code(e)
+            if error_code not in THROTTLING_ERROR_CODES:
+                raise
+            logger.warning("[%s] Bedrock tier %s throttled (%s), falling back", request_id, tier['name'], error_code)
+            model_router.record_throttle(tier['name'])
+            route['fallbacks'].append({'tier': tier['name'], 'error': error_code})
+            last_error = e
+            continue
+        if route['fallbacks']:
+            ttft_ms, tokens_per_second = model_router.expected(tier, route['promptTokens'])
+            route.update(expectedTtftMs=round(ttft_ms, 1), expectedTokensPerSecond=round(tokens_per_second, 1))
+        route.update(tier=tier['name'], modelId=tier['modelId'], maxTokens=request_body['max_tokens'])
+        return response, request_body
+    raise last_error
+
+def iter_bedrock_text(response: Dict[str, Any], usage: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    Yield text deltas from a Bedrock invoke_model_with_response_stream response
+    Token counts reported by the stream are stored in usage as inputTokens/outputTokens
+    and, with prompt caching, cacheReadInputTokens/cacheWriteInputTokens; the
+    message's stop_reason is stored as stopReason
+    """
+    for event_stream in response['body']:
+        chunk = event_stream.get('chunk')
+        if chunk:
+            chunk_data = json.loads(chunk['bytes'].decode())
+            
+            if chunk_data['type'] == 'content_block_delta':
+                text_chunk = chunk_data['delta'].get('text', '')
+                if text_chunk:
+                    yield text_chunk
+            elif usage is not None:
+                if chunk_data['type'] == 'message_start':
+                    message_usage = chunk_data.get('message', {}).get('usage', {})
+                    for field, name in (
+                        ('input_tokens', 'inputTokens'),
+                        ('cache_read_input_tokens', 'cacheReadInputTokens'),
+                        ('cache_creation_input_tokens', 'cacheWriteInputTokens')
+                    ):
+                        if field in message_usage:
+                            usage[name] = message_usage[field]
+                elif chunk_data['type'] == 'message_delta':
+                    if chunk_data.get('delta', {}).get('stop_reason'):
+                        usage['stopReason'] = chunk_data['delta']['stop_reason']
+                    if 'output_tokens' in chunk_data.get('usage', {}):
+                        usage['outputTokens'] = chunk_data['usage']['output_tokens']
+                invocation_metrics = chunk_data.get('amazon-bedrock-invocationMetrics')
+                if invocation_metrics:
+                    usage['inputTokens'] = invocation_metrics.get('inputTokenCount', usage.get('inputTokens'))
+                    usage['outputTokens'] = invocation_metrics.get('outputTokenCount', usage.get('outputTokens'))
+                    for field, name in (
+                        ('cacheReadInputTokenCount', 'cacheReadInputTokens'),
+                        ('cacheWriteInputTokenCount', 'cacheWriteInputTokens')
+                    ):
+                        if field in invocation_metrics:
+                            usage[name] = invocation_metrics[field]
+
+class SentenceSegmenter:
+    """
+    Incremental sentence segmenter for streamed text deltas.
+    Understands Spanish ¿…? and ¡…! pairs, abbreviations, initials and decimals.
+    Each character is scanned once; only a trailing terminator waits for lookahead.
+    """
+    
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._open_marks = 0
+    
+    def feed(self, delta: str) -> List[str]:
+        """
+        Add a text delta and return the sentences it completes
+        """
+        self._buffer += delta
+        return self._scan(final=False)
+    
+    def flush(self) -> List[str]:
+        """
+        Return the remaining sentences at the end of the stream
+        """
+        sentences = self._scan(final=True)
+        remainder = self._buffer.strip()
+        if remainder:
+            sentences.append(remainder)
+        self._buffer, self._pos, self._open_marks = '', 0, 0
+        return sentences
+    
+    def _scan(self, final: bool) -> List[str]:
+        buffer = self._buffer
+        length = len(buffer)
+        sentences = []
+        start = 0
+        i = self._pos
+        
+        while i < length:
+            char = buffer[i]
+            
+            if char in INVERTED_MARKS:
+                self._open_marks += 1
+                i += 1
+                continue
+            
+            if char == '\n':
+                if buffer[start:i].strip():
+                    sentences.append(buffer[start:i].strip())
+                start = i + 1
+                self._open_marks = 0
+                i += 1
+                continue
+            
+            if char not in SENTENCE_TERMINATORS:
+                i += 1
+                continue
+            
+            # Take the whole run of terminators and closing quotes/brackets
+            end = i
+            while end < length and buffer[end] in SENTENCE_TERMINATORS:
+                end += 1
+            while end < length and buffer[end] in SENTENCE_CLOSERS:
+                end += 1
+            following = end
+            while following < length and buffer[following] in ' \t':
+                following += 1
+            if following >= length and not final:
+                break  # Wait for the next delta to decide
+            
+            if self._is_boundary(buffer, start, i, end, following):
+                sentence = buffer[start:end].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = end
+                self._open_marks = 0
+            i = end
+        
+        self._buffer = buffer[start:]
+        self._pos = max(0, i - start)
+        return sentences
+    
+    def _is_boundary(self, buffer: str, start: int, run_start: int, run_end: int, following: int) -> bool:
+        run = buffer[run_start:run_end]
+        next_char = buffer[run_end] if run_end < len(buffer) else ''
+        next_word_char = buffer[following] if following < len(buffer) else ''
+        
+        # Terminators glued to the next character: 3.5, EE.UU., www.example.com
+        if next_char and not next_char.isspace():
+            return False
+        # A lowercase continuation means the sentence goes on (abbreviation or ¿…? clause)
+        if next_word_char.islower():
+            return False
+        
+        closes_marks = sum(1 for char in run if char in '?!')
+        if closes_marks:
+            self._open_marks = max(0, self._open_marks - closes_marks)
+        elif run.rstrip(SENTENCE_CLOSERS) == '.':
+            word_start = buffer.rfind(' ', start, run_start) + 1
+            word = buffer[word_start:run_start].lstrip(INVERTED_MARKS + '"\'«(').lower()
+            if word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+                return False
+        
+        return self._open_marks == 0 or not closes_marks
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split a complete response into sentences for TTS
+    """
+    segmenter = SentenceSegmenter()
+    return segmenter.feed(text) + segmenter.flush()
+
+def split_long_text(text: str, max_chars: int) -> List[str]:
+    """
+    Split text longer than max_chars on whitespace so Polly accepts every piece
+    """
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+class SynthesisUnitPacker:
+    """
+    Merges consecutive sentences into synthesis units of up to TTS_UNIT_TARGET_CHARS,
+    so an answer needs fewer Polly round trips. The first unit is released as soon
+    as it reaches TTS_FIRST_UNIT_MIN_CHARS to keep time-to-first-audio low.
+    """
+    
+    def __init__(
+        self,
+        target_chars: int = TTS_UNIT_TARGET_CHARS,
+        max_chars: int = TTS_UNIT_MAX_CHARS,
+        first_unit_min_chars: int = TTS_FIRST_UNIT_MIN_CHARS
+    ):
+        self.target_chars = target_chars
+        self.max_chars = max_chars
+        self.first_unit_min_chars = first_unit_min_chars
+        self.pending = ''
+        self.units_released = 0
+    
+    def add(self, sentence: str) -> List[str]:
+        """
+        Add a complete sentence and return any units that are ready
+        """
+        units = []
+        for piece in split_long_text(sentence, self.max_chars):
+            if self.pending and len(self.pending) + 1 + len(piece) > self.target_chars:
+                units.append(self.pending)
+                self.pending = ''
+            self.pending = f"{self.pending} {piece}" if self.pending else piece
+            
+            first_unit = self.units_released + len(units) == 0
+            if len(self.pending) >= (self.first_unit_min_chars if first_unit else self.target_chars):
+                units.append(self.pending)
+                self.pending = ''
+        self.units_released += len(units)
+        return units
+    
+    def flush(self) -> List[str]:
+        units = [self.pending] if self.pending else []
+        self.pending = ''
+        self.units_released += len(units)
+        return units
+
+def pack_synthesis_units(sentences: List[str]) -> List[str]:
+    """
+    Pack a complete list of sentences into synthesis units
+    """
+    packer = SynthesisUnitPacker()
+    units = []
+    for sentence in sentences:
+        units.extend(packer.add(sentence))
+    return units + packer.flush()
+
+class SynthesisStage:
+    """
+    Request-scoped TTS stage that synthesizes sentences on the shared executor
+    as soon as they are submitted, tracking time-to-first-audio.
+    Up to TTS_MAX_WORKERS sentences are synthesized concurrently.
+    With assemble_audio, units are kept in memory and uploaded as one object by assemble().
+    """
+    
+    def __init__(
+        self, session_id: str, student_id: str, request_id: str, request_started: float,
+        trace: Optional['RequestTrace'] = None, deadline: Optional['Deadline'] = None,
+        on_audio: Optional[Callable[[int, Optional[str], Optional[str]], None]] = None, assemble_audio: bool = False,
+        audio_profile: str = DEFAULT_AUDIO_PROFILE
+    ):
+        self.session_id = session_id
+        self.student_id = student_id
+        self.request_id = request_id
+        self.request_started = request_started
+        self.trace = trace
+        self.deadline = deadline
+        self.futures: List[Future] = []
+        self.skipped_units = 0
+        self._closed = False
+        self.first_audio_at: Optional[float] = None
+        self.generation_done_at: Optional[float] = None
+        self.failed_chunks: List[int] = []
+        self.on_audio = on_audio
+        self.assemble_audio = assemble_audio
+        self.audio_profile = audio_profile
+        self.content_type = get_voice_settings(audio_profile)['contentType']
+        self.texts: List[str] = []
+        self.inlined: Dict[int, str] = {}
+        self.inlined_bytes = 0
+        self.inline_latency_saved_ms = 0.0
+        self.delivered: List[Tuple[int, str]] = []
+        self._ready: Dict[int, Optional[str]] = {}
+        self._next_to_emit = 0
+        self._lock = threading.Lock()
+    
+    def submit(self, text: str) -> None:
+        """
+        Queue a sentence for synthesis, keeping its position as chunk index
+        """
+        if not text:
+            return
+        if self.deadline and self.deadline.expired(self.deadline.persist_reserve_ms + DEADLINE_TTS_UNIT_MIN_MS):
+            self.skipped_units += 1
+            return
+        chunk_index = len(self.futures)
+        self.texts.append(text)
+        future = tts_executor.submit(self._synthesize, text, chunk_index, time.perf_counter())
+        self.futures.append(future)
+        future.add_done_callback(lambda done: self._record_audio_ready(chunk_index, done))
+    
+    def _synthesize(self, text: str, chunk_index: int, submitted: float) -> Optional[str]:
+        started = time.perf_counter()
+        audio_url = None
+        try:
+            if self.assemble_audio:
+                audio_url = synthesize_audio_unit(text, self.request_id, chunk_index, self.trace, self.audio_profile)
+            else:
+                audio_url = generate_audio_from_text(
+                    text, self.session_id, self.student_id, self.request_id, chunk_index, self.trace,
+                    inline_audio=self._inline_audio if AUDIO_INLINE_MAX_BYTES > 0 else None,
+                    audio_profile=self.audio_profile
+                )
+            return audio_url
+        finally:
+            if self.trace:
+                self.trace.record(
+                    'TTSUnit', started, chunkIndex=chunk_index, chars=len(text),
+                    queuedMs=round((started - submitted) * 1000, 1), ok=audio_url is not None
+                )
+    
+    def _inline_audio(self, chunk_index: int, audio: bytes) -> bool:
+        """
+        Accept a unit's audio for inlining while the response stays under AUDIO_INLINE_MAX_TOTAL_BYTES
+        """
+        with self._lock:
+            if self._closed or self.inlined_bytes + len(audio) > AUDIO_INLINE_MAX_TOTAL_BYTES:
+                return False
+            self.inlined[chunk_index] = base64.b64encode(audio).decode('ascii')
+            self.inlined_bytes += len(audio)
+            # The client skips both the upload and a CDN fetch; only the upload is measurable here
+            self.inline_latency_saved_ms += expected_audio_upload_ms()
+        return True
+    
+    def _record_audio_ready(self, chunk_index: int, future: Future) -> None:
+        if self.assemble_audio:
+            # Nothing is playable until assemble() has uploaded the joined object
+            return
+        audio_url = None
+        if not future.cancelled() and future.exception() is None:
+            audio_url = future.result()
+        with self._lock:
+            if audio_url and self.first_audio_at is None:
+                self.first_audio_at = time.perf_counter()
+            if self.on_audio is None or self._closed:
+                return
+            # Hand audio to the listener in chunk order, skipping failed chunks
+            self._ready[chunk_index] = audio_url
+            while self._next_to_emit in self._ready:
+                ready_url = self._ready.pop(self._next_to_emit)
+                if ready_url:
+                    inline_data = self.inlined.get(self._next_to_emit)
+                    try:
+                        self.on_audio(self._next_to_emit, None if inline_data else ready_url, inline_data)
+                    except Exception as e:
+                        logger.warning("[%s] Audio listener failed: %s", self.request_id, e)
+                self._next_to_emit += 1
+    
+    def mark_generation_done(self) -> None:
+        self.generation_done_at = time.perf_counter()
+    
+    def cancel(self) -> None:
+        for future in self.futures:
+            future.cancel()
+    
+    def collect(self) -> List[str]:
+        """
+        Wait for all submitted sentences and return their URLs in chunk order
+        Failed sentences are left out of the URLs and recorded in failed_chunks;
+        units unfinished at the deadline are dropped and counted in skipped_units.
+        Inlined units are left out too, since their upload may still be queued
+        (see audio_segments())
+        """
+        if self.deadline:
+            wait(self.futures, timeout=self.deadline.timeout(self.deadline.persist_reserve_ms))
+        with self._lock:
+            # Audio finishing after this point is not announced to the client
+            self._closed = True
+        
+        audio_urls = []
+        for i, future in enumerate(self.futures):
+            if not future.done():
+                future.cancel()
+                self.skipped_units += 1
+                continue
+            try:
+                audio_url = future.result()
+            except Exception as e:
+                logger.error("[%s] TTS chunk %s failed: %s", self.request_id, i, e)
+                audio_url = None
+            if not audio_url:
+                self.failed_chunks.append(i)
+                continue
+            self.delivered.append((i, audio_url))
+            if i not in self.inlined:
+                audio_urls.append(audio_url)
+        return audio_urls
+    
+    def assemble(self) -> Optional[Dict[str, Any]]:
+        """
+        Upload the collected units as one MP3 and return its byte-range manifest
+        Call after collect(); failed and skipped units are left out
+        """
+        units = [
+            (i, self.texts[i], future.result()) for i, future in enumerate(self.futures)
+            if future.done() and not future.cancelled() and future.exception() is None and future.result()
+        ]
+        if not units:
+            return None
+        manifest = save_assembled_audio(
+            units, self.session_id, self.student_id, self.request_id,
+            self.deadline.timeout(self.deadline.persist_reserve_ms) if self.deadline else None
+        )
+        if manifest is None:
+            self.failed_chunks.extend(i for i, _, _ in units)
+            return None
+        self.first_audio_at = time.perf_counter()
+        if self.on_audio is not None:
+            try:
+                self.on_audio(0, manifest['url'], None)
+            except Exception as e:
+                logger.warning("[%s] Audio listener failed: %s", self.request_id, e)
+        return manifest
+    
+    def audio_segments(self, include_data: bool = True) -> List[Dict[str, Any]]:
+        """
+        Every collected unit in playback order: a URL for uploaded units, the
+        audio itself for inlined ones (without include_data, just their index)
+        """
+        with self._lock:
+            segments = []
+            for chunk_index, audio_url in self.delivered:
+                if chunk_index not in self.inlined:
+                    segments.append({'chunkIndex': chunk_index, 'audioUrl': audio_url})
+                elif include_data:
+                    segments.append({
+                        'chunkIndex': chunk_index, 'audioData': self.inlined[chunk_index], 'contentType': self.content_type
+                    })
+                else:
+                    segments.append({'chunkIndex': chunk_index, 'inlined': True})
+            return segments
+    
+    def inline_summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'chunks': len(self.inlined),
+                'bytes': self.inlined_bytes,
+                'latencySavedMs': round(self.inline_latency_saved_ms, 1)
+            }
+    
+    def time_to_first_audio_ms(self) -> Optional[float]:
+        if self.first_audio_at is None:
+            return None
+        return round((self.first_audio_at - self.request_started) * 1000, 1)
+    
+    def first_audio_before_generation_end(self) -> bool:
+        return (
+            self.first_audio_at is not None
+            and self.generation_done_at is not None
+            and self.first_audio_at < self.generation_done_at
+        )
+
+def response_fingerprint(bedrock_request: Dict[str, Any], model_id: str) -> str:
+    """
+    Fingerprint a Bedrock request body, ignoring text that does not affect the answer
+    max_tokens is left out: it only bounds the answer, and only complete answers are stored
+    """
+    stable = {key: value for key, value in bedrock_request.items() if key != 'max_tokens'}
+    stable['messages'] = [
+        {**message, 'content': AUDIO_SIZE_REFERENCE.sub('Audio procesado: audio', message['content'])}
+        if isinstance(message.get('content'), str) else message
+        for message in bedrock_request.get('messages', [])
+    ]
+    material = json.dumps(
+        {'modelId': model_id, 'request': stable}, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class InMemoryResponseStore:
+    """
+    Process-local response store, the stand-in for DynamoDB in tests and local runs
+    """
+    
+    def __init__(self):
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.items.get(fingerprint)
+    
+    def put(self, fingerprint: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.items[fingerprint] = entry
+
+class DynamoDBResponseStore:
+    """
+    Response store backed by the application table, expired through its TTL attribute
+    """
+    
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+    
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        item = get_aws_client('dynamodb').Table(self.table_name).get_item(
+            Key={'PK': f'RESPONSE_CACHE#{fingerprint}', 'SK': 'RESPONSE'}
+        ).get('Item')
+        if not item:
+            return None
+        return {
+            'chunks': list(item['chunks']),
+            'generationMs': int(item['generationMs']),
+            'expiresAt': int(item['TTL'])
+        }
+    
+    def put(self, fingerprint: str, entry: Dict[str, Any]) -> None:
+        get_aws_client('dynamodb').Table(self.table_name).put_item(
+            Item={
+                'PK': f'RESPONSE_CACHE#{fingerprint}',
+                'SK': 'RESPONSE',
+                'chunks': entry['chunks'],
+                'generationMs': int(entry['generationMs']),
+                'model': entry.get('model', MODEL_ID),
+                'createdAt': datetime.now().isoformat(),
+                'TTL': int(entry['expiresAt'])
+            }
+        )
+
+class ResponseCache:
+    """
+    Two-tier response memoization: an in-process LRU in front of a shared store
+    """
+    
+    def __init__(self, store: Any, ttl_seconds: int, max_entries: int):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries)
+        self.stats = {'hits': 0, 'misses': 0, 'latencySavedMs': 0.0}
+        self._lock = threading.Lock()
+    
+    def get(self, fingerprint: str, request_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        entry = self.local.get(fingerprint)
+        if entry is None or entry['expiresAt'] <= now:
+            try:
+                entry = self.store.get(fingerprint)
+            except Exception as e:
+                logger.warning("[%s] Response cache lookup failed: %s", request_id, e)
+                entry = None
+            if entry is not None and entry['expiresAt'] > now:
+                self.local.put(fingerprint, entry)
+        
+        hit = entry is not None and entry['expiresAt'] > now
+        with self._lock:
+            self.stats['hits' if hit else 'misses'] += 1
+        return entry if hit else None
+    
+    def put(
+        self, fingerprint: str, chunks: List[str], generation_ms: float, request_id: str, model_id: str = MODEL_ID
+    ) -> None:
+        entry = {
+            'chunks': chunks,
+            'generationMs': int(generation_ms),
+            'model': model_id,
+            'expiresAt': int(time.time()) + self.ttl_seconds
+        }
+        self.local.put(fingerprint, entry)
+        try:
+            self.store.put(fingerprint, entry)
+        except Exception as e:
+            logger.warning("[%s] Response cache write failed: %s", request_id, e)
+    
+    def record_saved(self, latency_ms: float) -> None:
+        with self._lock:
+            self.stats['latencySavedMs'] += latency_ms
+    
+    def hit_ratio(self) -> Optional[float]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return round(self.stats['hits'] / lookups, 4) if lookups else None
+
+model_router = ModelRouter(parse_model_tiers(MODEL_TIERS))
+
+transcription_engine = create_transcription_engine(TRANSCRIPTION_ENGINE)
+
+response_cache = ResponseCache(
+    InMemoryResponseStore() if RESPONSE_CACHE_STORE == 'memory' else DynamoDBResponseStore(DYNAMODB_TABLE),
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES
+)
+
 # Export for Lambda deployment
-__all__ = ['lambda_handler'] 
\ No newline at end of file
+__all__ = ['lambda_handler', 'streaming_handler'] 
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Shared fixtures: index.py imported against the in-process AWS fakes from benchmarks/fakes.py
+"""
+import json
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.dirname(TESTS_DIR)
+
+# Handler configuration is read at import time
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('ENABLE_METRICS', 'false')
+
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'benchmarks'))
+sys.path.insert(0, LAMBDA_DIR)
+
+import index  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeBackend, FakeBedrockRuntime, FakeCloudWatch, FakeDynamoDB, FakeLambdaContext, FakePolly, FakeS3, LatencyModel
+)
+
+
+@pytest.fixture
+def fakes():
+    """
+    Zero-latency fake clients installed in index._clients, with container caches cleared
+    """
+    backend = FakeBackend(time_scale=0)
+    instant = LatencyModel(0, 0, 'const')
+    clients = {
+        'bedrock-runtime': FakeBedrockRuntime(backend, ttft=instant, chunk_gap=instant, sentences=2),
+        'polly': FakePolly(backend, instant, per_char_ms=0),
+        's3': FakeS3(backend, get=instant, put=instant, head=instant),
+        'dynamodb': FakeDynamoDB(backend, instant),
+        'cloudwatch': FakeCloudWatch(backend, instant)
+    }
+    saved = dict(index._clients)
+    index._clients.clear()
+    index._clients.update(clients)
+    for cache in (index.tts_cache, index.context_cache, index.course_index_cache, index.response_cache.local):
+        with cache._lock:
+            cache._entries.clear()
+    index.circuit_breakers.clear()
+    yield clients
+    index._clients.clear()
+    index._clients.update(saved)
+    index.circuit_breakers.clear()
+
+
+@pytest.fixture
+def invoke(fakes):
+    """
+    Call lambda_handler with a JSON body (or a full event) and return (statusCode, parsed body)
+    """
+    def call(body=None, event=None, timeout_ms=30000):
+        response = index.lambda_handler(event or {'body': json.dumps(body)}, FakeLambdaContext(timeout_ms))
+        return response['statusCode'], json.loads(response['body'])
+    return call
@@ -0,0 +1,122 @@
+import pytest
+
+import index
+
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+
+
+def mp3_frame(version=MPEG2, bitrate_index=6, sample_rate_index=1, padding=0, length=None, payload=b''):
+    """
+    One Layer III frame: header, then payload padded with zeros to length
+    Defaults are Polly's 24 kHz MPEG-2 output at 48 kbps (144-byte, 24 ms frames)
+    """
+    header = bytes([
+        0xFF, 0xE0 | version << 3 | 1 << 1 | 1, bitrate_index << 4 | sample_rate_index << 2 | padding << 1, 0xC4
+    ])
+    body = header + payload
+    return body + b'\x00' * ((length or 144) - len(body))
+
+
+def id3_tag(size, footer=False):
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b'ID3\x04\x00' + bytes([0x10 if footer else 0]) + syncsafe + b'\x00' * size + (b'3DI' + b'\x00' * 7 if footer else b'')
+
+
+@pytest.mark.parametrize('header, length, duration_ms', [
+    ({'version': MPEG2, 'bitrate_index': 6, 'sample_rate_index': 1}, 144, 24.0),  # 24 kHz, 48 kbps
+    ({'version': MPEG2, 'bitrate_index': 4, 'sample_rate_index': 2}, 144, 36.0),  # 16 kHz, 32 kbps
+    ({'version': MPEG2, 'bitrate_index': 8, 'sample_rate_index': 0}, 208, 26.122),  # 22.05 kHz, 64 kbps
+    ({'version': MPEG1, 'bitrate_index': 9, 'sample_rate_index': 0}, 417, 26.122),  # 44.1 kHz, 128 kbps
+    ({'version': MPEG1, 'bitrate_index': 9, 'sample_rate_index': 0, 'padding': 1}, 418, 26.122),
+    ({'version': MPEG25, 'bitrate_index': 1, 'sample_rate_index': 2}, 72, 72.0)  # 8 kHz, 8 kbps
+])
+def test_frame_header(header, length, duration_ms):
+    frame = mp3_frame(length=length, **header)
+    parsed_length, parsed_ms = index.parse_mp3_frame_header(frame, 0)
+    assert parsed_length == length
+    assert parsed_ms == pytest.approx(duration_ms, abs=0.001)
+
+
+@pytest.mark.parametrize('data', [
+    b'\xff\xe8\x64\xc4',  # reserved MPEG version
+    b'\xff\xf5\x64\xc4',  # Layer II
+    b'\xff\xf3\xf4\xc4',  # bad bitrate index
+    b'\xff\xf3\x0c\xc4',  # reserved sample rate
+    b'\xff\xf3\x64',  # truncated header
+    b'OggS\x00\x02\x00\x00'
+])
+def test_invalid_headers(data):
+    assert index.parse_mp3_frame_header(data, 0) is None
+
+
+def test_frame_count_and_duration():
+    unit = mp3_frame() * 42
+    assert index.mp3_audio_frames(unit) == (0, 42 * 144, pytest.approx(1008.0))
+
+
+def test_id3_tag_and_encoder_frame_are_skipped():
+    tag = id3_tag(100)
+    xing = mp3_frame(payload=b'\x00' * 17 + b'Xing')
+    unit = tag + xing + mp3_frame() * 10
+    start, end, duration_ms = index.mp3_audio_frames(unit)
+    assert start == len(tag) + 144
+    assert end == len(unit)
+    assert duration_ms == pytest.approx(240.0)
+
+
+def test_id3_footer_is_skipped():
+    tag = id3_tag(20, footer=True)
+    assert index.mp3_audio_frames(tag + mp3_frame() * 3)[:2] == (len(tag), len(tag) + 3 * 144)
+
+
+def test_truncated_last_frame_is_dropped():
+    unit = mp3_frame() * 5 + mp3_frame()[:60]
+    assert index.mp3_audio_frames(unit) == (0, 5 * 144, pytest.approx(120.0))
+
+
+def test_trailing_garbage_ends_the_unit():
+    unit = mp3_frame() * 3 + b'TAG' + b'\x00' * 125
+    assert index.mp3_audio_frames(unit)[:2] == (0, 3 * 144)
+
+
+@pytest.mark.parametrize('data', [b'', b'not audio at all', b'OggS' + b'\x00' * 200, bytes(range(256))])
+def test_unparseable_units_are_kept_whole(data):
+    assert index.mp3_audio_frames(data) == (0, len(data), 0.0)
+
+
+def test_assembled_object_and_manifest(fakes):
+    units = [
+        (0, 'Hola.', id3_tag(30) + mp3_frame() * 4),
+        (1, 'Segunda frase.', mp3_frame() * 6 + mp3_frame()[:10]),
+        (2, 'Tercera.', mp3_frame(version=MPEG2, bitrate_index=4, sample_rate_index=2) * 2)
+    ]
+    manifest = index.save_assembled_audio(units, 'session-1', 'student-1', 'req-1')
+    
+    assert [segment['offset'] for segment in manifest['segments']] == [0, 576, 1440]
+    assert [segment['length'] for segment in manifest['segments']] == [576, 864, 288]
+    assert [segment['startMs'] for segment in manifest['segments']] == [0.0, 96.0, 240.0]
+    assert manifest['durationMs'] == 312.0
+    assert manifest['bytes'] == 1728
+    
+    key = manifest['url'][len(index.CLOUDFRONT_URL) + 1:]
+    body = fakes['s3'].objects[key]
+    assert body == mp3_frame() * 10 + mp3_frame(version=MPEG2, bitrate_index=4, sample_rate_index=2) * 2
+    segment = manifest['segments'][1]
+    assert index.mp3_audio_frames(body[segment['offset']:segment['offset'] + segment['length']])[2] == 144.0
+
+
+def test_handler_assembles_mp3_profiles(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_ASSEMBLY', 'single')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'})
+    assert status == 200
+    manifest = body['audioManifest']
+    assert manifest['segments']
+    assert manifest['durationMs'] == pytest.approx(sum(segment['durationMs'] for segment in manifest['segments']), abs=0.5)
+
+
+def test_non_mp3_profiles_fall_back_to_units(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_ASSEMBLY', 'single')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1', 'audioProfile': 'ogg_vorbis'})
+    assert status == 200
+    assert 'audioManifest' not in body
+    assert body['audioUrls'] and all(url.endswith('.ogg') for url in body['audioUrls'])
@@ -0,0 +1,65 @@
+import index
+
+
+def open_breaker(name):
+    breaker = index.get_circuit_breaker(name)
+    breaker._open()
+    return breaker
+
+
+def test_breaker_opens_on_failures_and_fails_fast():
+    breaker = index.CircuitBreaker('test')
+    for _ in range(index.BREAKER_MIN_CALLS):
+        breaker.record(True)
+    assert breaker.state == 'open'
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+
+def test_is_open_takes_no_trial_slot(monkeypatch):
+    breaker = index.CircuitBreaker('test')
+    breaker._open()
+    monkeypatch.setattr(breaker, 'opened_at', breaker.opened_at - index.BREAKER_OPEN_SECONDS - 1)
+    assert not breaker.is_open()
+    assert breaker.state == 'open'
+    for _ in range(index.BREAKER_HALF_OPEN_CALLS):
+        assert breaker.allow()
+    assert breaker.state == 'half_open'
+
+
+def test_open_s3_breaker_skips_polly(fakes, invoke):
+    open_breaker('s3')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'})
+    assert status == 200
+    assert body['fullResponse']
+    assert body['audioUrls'] == []
+    assert fakes['polly'].calls == 0
+    assert 's3' in body['metadata']['degradedDependencies']
+
+
+def test_open_s3_breaker_skips_polly_for_assembly(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_ASSEMBLY', 'single')
+    open_breaker('s3')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'})
+    assert status == 200
+    assert 'audioManifest' not in body
+    assert fakes['polly'].calls == 0
+
+
+def test_memory_cached_audio_is_still_served(monkeypatch, fakes, invoke):
+    request = {'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'}
+    first = invoke(request)[1]
+    calls = fakes['polly'].calls
+    open_breaker('s3')
+    second = invoke(dict(request, sessionId='session-2'))[1]
+    assert second['audioUrls'] == first['audioUrls']
+    assert fakes['polly'].calls == calls
+
+
+def test_open_polly_breaker_gives_a_text_only_answer(fakes, invoke):
+    open_breaker('polly')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'})
+    assert status == 200
+    assert body['fullResponse']
+    assert body['audioUrls'] == []
+    assert fakes['polly'].calls == 0
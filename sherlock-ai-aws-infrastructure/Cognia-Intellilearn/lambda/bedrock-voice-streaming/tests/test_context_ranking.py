@@ -0,0 +1,165 @@
+import time
+
+import pytest
+
+import index
+
+COURSE = '000000123'
+SOURCES = ['courses/000000123/fotosintesis.txt', 'courses/000000123/celulas.txt']
+DOCUMENTS = {
+    SOURCES[0]: (
+        'La fotosíntesis ocurre en los cloroplastos. La clorofila absorbe la luz solar. '
+        'Las plantas producen glucosa y liberan oxígeno durante la fotosíntesis.'
+    ),
+    SOURCES[1]: (
+        'La célula es la unidad básica de la vida. El núcleo guarda el ADN. '
+        'Las mitocondrias producen energía para la célula mediante la respiración.'
+    ),
+}
+
+
+@pytest.fixture
+def course(fakes):
+    for key, text in DOCUMENTS.items():
+        fakes['s3'].seed_object(key, text.encode('utf-8'))
+    return fakes
+
+
+def test_query_terms_keep_the_first_distinct_terms():
+    assert index.query_terms('Fotosíntesis fotosintesis luz, luz y clorofila', 2) == ['fotosintesis', 'luz']
+    assert len(index.query_terms(' '.join(f'termino{i}' for i in range(500)))) == index.CONTEXT_QUERY_MAX_TERMS
+
+
+def test_search_looks_up_a_bounded_number_of_terms():
+    looked_up = []
+
+    class RecordingPostings(dict):
+        def get(self, term, default=None):
+            looked_up.append(term)
+            return super().get(term, default)
+
+    passage_index = index.PassageIndex([('a.txt', 'fotosintesis clorofila luz')])
+    passage_index.postings = RecordingPostings(passage_index.postings)
+    results = passage_index.search('fotosintesis ' + ' '.join(f'termino{i}' for i in range(500)), 4)
+    assert results and results[0][1] == 0
+    assert len(looked_up) == index.CONTEXT_QUERY_MAX_TERMS
+
+
+def test_query_term_cap_is_read_at_search_time(monkeypatch):
+    monkeypatch.setattr(index, 'CONTEXT_QUERY_MAX_TERMS', 3)
+    assert index.query_terms('fotosintesis clorofila luz glucosa oxigeno') == ['fotosintesis', 'clorofila', 'luz']
+
+
+def test_long_transcript_is_capped_before_ranking(monkeypatch, course):
+    queries = []
+    select = index.PassageIndex.select
+    monkeypatch.setattr(
+        index.PassageIndex, 'select', lambda self, query, k, budget: queries.append(query) or select(self, query, k, budget)
+    )
+    transcript = 'fotosíntesis ' + 'palabra ' * 200_000
+    context = index.get_educational_context_optimized(SOURCES, COURSE, 'Biología', 'request-1', query=transcript)
+    assert 'fotosintesis.txt' in context
+    assert len(queries) == 1
+    assert len(queries[0]) <= len('Biología ') + index.TRANSCRIPT_MAX_CHARS
+
+
+def course_index(request_id='request-1', timeout=None):
+    return index.get_course_index(COURSE, SOURCES, request_id, timeout=timeout)
+
+
+def test_search_ranks_the_matching_source_first(course):
+    passage_index = course_index()
+    assert passage_index.passages[passage_index.search('clorofila y luz solar', 4)[0][1]][0] == 'fotosintesis.txt'
+    assert passage_index.passages[passage_index.search('mitocondrias energía', 4)[0][1]][0] == 'celulas.txt'
+    assert passage_index.search('volcanes', 4) == []
+
+
+def test_search_favours_repeated_terms_in_short_passages():
+    passage_index = index.PassageIndex([
+        ('a.txt', 'clorofila ' + 'hoja ' * 40), ('b.txt', 'clorofila clorofila'), ('c.txt', 'clorofila luz')
+    ])
+    assert [passage_id for _, passage_id in passage_index.search('clorofila', 4)] == [1, 2, 0]
+
+
+def test_select_skips_passages_over_the_budget():
+    passage_index = index.PassageIndex([
+        ('a.txt', 'clorofila ' + 'hoja ' * 40), ('b.txt', 'clorofila clorofila'), ('c.txt', 'clorofila luz')
+    ])
+    assert passage_index.select('clorofila', 4, 40) == [('b.txt', 'clorofila clorofila'), ('c.txt', 'clorofila luz')]
+    assert passage_index.select('clorofila', 1, 40) == [('b.txt', 'clorofila clorofila')]
+
+
+def test_select_truncates_a_first_passage_over_the_budget():
+    passage_index = index.PassageIndex([('a.txt', 'clorofila ' + 'hoja ' * 40), ('b.txt', 'clorofila luz')])
+    assert passage_index.select('hoja', 4, 50) == [('a.txt', ('clorofila ' + 'hoja ' * 40)[:50])]
+
+
+def test_course_index_is_built_once(course):
+    first = course_index()
+    assert course['s3'].counts['get'] == len(SOURCES)
+    assert course_index('request-2') is first
+    assert course['s3'].counts['get'] == len(SOURCES)
+    assert course['s3'].counts['head'] == 0
+
+
+def test_stale_index_is_revalidated_by_etag(monkeypatch, course):
+    first = course_index()
+    later = index.time.time() + index.CONTEXT_CACHE_TTL_SECONDS + 1
+    monkeypatch.setattr(index.time, 'time', lambda: later)
+    assert course_index('request-2') is first
+    assert course['s3'].counts['head'] == len(SOURCES)
+    assert course['s3'].counts['get'] == len(SOURCES)
+
+
+def test_changed_source_rebuilds_the_index(monkeypatch, course):
+    first = course_index()
+    course['s3'].seed_object(SOURCES[1], 'Los volcanes expulsan lava y ceniza.'.encode('utf-8'))
+    later = index.time.time() + index.CONTEXT_CACHE_TTL_SECONDS + 1
+    monkeypatch.setattr(index.time, 'time', lambda: later)
+    rebuilt = course_index('request-2')
+    assert rebuilt is not first
+    assert course['s3'].counts['get'] == 2 * len(SOURCES)
+    assert rebuilt.passages[rebuilt.search('volcanes', 4)[0][1]][0] == 'celulas.txt'
+
+
+def test_index_build_times_out(monkeypatch, course):
+    monkeypatch.setattr(index, 'fetch_context_document', lambda *args: time.sleep(0.3))
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        course_index(timeout=0.05)
+    assert time.perf_counter() - started < 0.25
+    assert index.get_ranked_context(SOURCES, COURSE, 'fotosíntesis', 'request-2', timeout=0.05) is None
+
+
+def test_ranked_context_holds_only_matching_passages(course):
+    context = index.get_educational_context_optimized(SOURCES, COURSE, 'Biología', 'request-1', query='¿Qué es la fotosíntesis?')
+    assert context == f"📄 fotosintesis.txt: {DOCUMENTS[SOURCES[0]]}"
+    assert index.context_cache.get(SOURCES[0]) is None
+
+
+def assert_snippet_context(context):
+    assert context.splitlines() == [f"📄 {source.split('/')[-1]}: {DOCUMENTS[source]}" for source in SOURCES]
+    assert index.context_cache.get(SOURCES[0])['snippet'] == DOCUMENTS[SOURCES[0]]
+
+
+def test_no_matching_passage_falls_back_to_snippets(course):
+    assert_snippet_context(
+        index.get_educational_context_optimized(SOURCES, COURSE, 'Geología', 'request-1', query='volcanes')
+    )
+
+
+def test_index_timeout_falls_back_to_snippets(monkeypatch, course):
+    def timed_out(*args):
+        raise TimeoutError()
+    monkeypatch.setattr(index, 'get_course_index', timed_out)
+    assert_snippet_context(
+        index.get_educational_context_optimized(SOURCES, COURSE, 'Biología', 'request-1', query='fotosíntesis')
+    )
+
+
+def test_disabled_ranking_uses_snippets(monkeypatch, course):
+    monkeypatch.setattr(index, 'ENABLE_CONTEXT_RANKING', False)
+    assert_snippet_context(
+        index.get_educational_context_optimized(SOURCES, COURSE, 'Biología', 'request-1', query='fotosíntesis')
+    )
+    assert index.course_index_cache.get(f"{COURSE}|{'|'.join(SOURCES)}") is None
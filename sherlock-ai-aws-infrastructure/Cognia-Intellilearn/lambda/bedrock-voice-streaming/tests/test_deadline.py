@@ -0,0 +1,63 @@
+import index
+from fakes import FakeLambdaContext, LatencyModel, build_answer
+
+
+def test_budget_is_capped_for_api_gateway():
+    deadline = index.Deadline.from_context(FakeLambdaContext(300000))
+    assert deadline.budget_ms == index.DEADLINE_MAX_MS - index.DEADLINE_RESERVE_MS
+    assert index.Deadline.from_context(None).budget_ms == index.DEADLINE_MAX_MS - index.DEADLINE_RESERVE_MS
+
+
+def test_shorter_context_wins():
+    deadline = index.Deadline.from_context(FakeLambdaContext(4000))
+    assert deadline.budget_ms <= 4000 - index.DEADLINE_RESERVE_MS
+
+
+def test_cap_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(index, 'DEADLINE_MAX_MS', 0)
+    assert index.Deadline.from_context(None).budget_ms is None
+    assert index.Deadline.from_context(FakeLambdaContext(300000)).budget_ms > 290000
+
+
+def test_reserves_scale_with_the_budget():
+    full = index.Deadline(29000)
+    assert full.tts_reserve_ms == min(index.DEADLINE_TTS_RESERVE_MS, 28500 * index.DEADLINE_TTS_RESERVE_SHARE)
+    assert full.persist_reserve_ms <= index.DEADLINE_PERSIST_RESERVE_MS
+    
+    short = index.Deadline(4000)
+    # Context and transcription still get most of a short budget
+    assert short.generation_min_ms + short.generation_cutoff_ms() < 1000
+    assert short.timeout(short.generation_min_ms + short.generation_cutoff_ms(), index.DEADLINE_CONTEXT_MAX_MS) > 2.5
+    
+    unbounded = index.Deadline(None)
+    assert unbounded.tts_reserve_ms == index.DEADLINE_TTS_RESERVE_MS
+
+
+def test_short_budget_still_answers(fakes, invoke):
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'}, timeout_ms=4000)
+    assert status == 200
+    assert body['fullResponse']
+    assert body['partial'] is False
+    assert body['audioUrls']
+
+
+def test_first_token_is_awaited_past_the_cutoff(fakes, invoke):
+    bedrock = fakes['bedrock-runtime']
+    bedrock.backend.time_scale = 1
+    # First token arrives after the generation cutoff but before the invocation deadline
+    bedrock.ttft = LatencyModel(1300, 0, 'const')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'}, timeout_ms=2000)
+    assert status == 200
+    assert body['fullResponse']
+    assert body['partial'] is True
+
+
+def test_stream_is_closed_when_generation_is_cut(fakes, invoke):
+    bedrock = fakes['bedrock-runtime']
+    bedrock.backend.time_scale = 1
+    bedrock.chunk_gap = LatencyModel(150, 0, 'const')
+    status, body = invoke({'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'}, timeout_ms=2000)
+    assert status == 200
+    assert body['partial'] is True
+    assert 0 < len(body['fullResponse']) < len(build_answer(bedrock.sentences))
+    assert bedrock.streams[0].closed
@@ -0,0 +1,94 @@
+import base64
+import json
+
+import pytest
+
+import index
+from fakes import FakeLambdaContext, FakePolly
+
+SHORT_TEXT = 'Hola.'
+LONG_TEXT = 'La fotosíntesis convierte la luz en energía química dentro de los cloroplastos. ' * 3
+REQUEST = {'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1'}
+
+
+class StreamedSink(index.BufferedEventSink):
+    streaming = True
+
+
+@pytest.fixture
+def inline_enabled(monkeypatch):
+    monkeypatch.setattr(index, 'AUDIO_INLINE_MAX_BYTES', 10 ** 6)
+    monkeypatch.setattr(index, 'ENABLE_TTS_CACHE', False)
+
+
+def stream_end(events):
+    return next(event for event in events if event['type'] == 'stream_end')
+
+
+def test_inlined_units_have_no_url(fakes, invoke, inline_enabled):
+    status, body = invoke(REQUEST)
+    assert status == 200
+    end = stream_end(body['chunks'])
+    segments = end['audioSegments']
+    assert segments
+    assert body['audioUrls'] == end['audioUrls'] == []
+    assert [segment['chunkIndex'] for segment in segments] == list(range(len(segments)))
+    assert all('audioUrl' not in segment and base64.b64decode(segment['audioData']) for segment in segments)
+    assert body['metadata']['audioChunksGenerated'] == len(segments)
+    assert body['metadata']['audioChunksFailed'] == 0
+
+
+def test_streamed_audio_segments_carry_data_not_urls(fakes, inline_enabled):
+    sink = StreamedSink()
+    response = index.process_voice_request({'body': json.dumps(REQUEST)}, FakeLambdaContext(), sink)
+    assert response['statusCode'] == 200
+    audio_events = [event for event in sink.events if event['type'] == 'audio_segment']
+    assert audio_events
+    assert all('audioUrl' not in event and event['audioData'] and event['contentType'] for event in audio_events)
+    # Streamed clients already hold the audio, so stream_end only gives the order
+    segments = stream_end(sink.events)['audioSegments']
+    assert segments == [{'chunkIndex': event['chunkIndex'], 'inlined': True} for event in audio_events]
+
+
+def test_only_uploaded_units_are_given_as_urls(monkeypatch, fakes):
+    monkeypatch.setattr(index, 'AUDIO_INLINE_MAX_BYTES', len(FakePolly.FRAME) * 100)
+    monkeypatch.setattr(index, 'ENABLE_TTS_CACHE', False)
+    announced = []
+    stage = index.SynthesisStage(
+        'session-1', 'student-1', 'request-1', index.time.perf_counter(),
+        deadline=index.Deadline.from_context(FakeLambdaContext()),
+        on_audio=lambda chunk_index, audio_url, audio_data: announced.append((chunk_index, audio_url, audio_data))
+    )
+    stage.submit(SHORT_TEXT)
+    stage.submit(LONG_TEXT)
+    audio_urls = stage.collect()
+
+    assert list(stage.inlined) == [0]
+    assert len(audio_urls) == 1
+    assert audio_urls[0].split('/', 3)[-1] in fakes['s3'].objects
+    assert stage.failed_chunks == []
+    assert [segment['chunkIndex'] for segment in stage.audio_segments()] == [0, 1]
+    assert stage.audio_segments()[0]['audioData'] == stage.inlined[0]
+    assert stage.audio_segments()[1]['audioUrl'] == audio_urls[0]
+
+    announced.sort()
+    assert announced[0][1] is None and announced[0][2] == stage.inlined[0]
+    assert announced[1][1] == audio_urls[0] and announced[1][2] is None
+
+
+def test_latency_saved_uses_prior_on_a_cold_container(monkeypatch, fakes, invoke, inline_enabled):
+    monkeypatch.setitem(index.audio_upload_stats, 'uploads', 0)
+    monkeypatch.setitem(index.audio_upload_stats, 'ewmaMs', 0.0)
+    _, body = invoke(REQUEST)
+    inline_audio = body['metadata']['inlineAudio']
+    assert inline_audio['chunks'] > 0
+    # Later units may already see the first measured upload
+    assert inline_audio['latencySavedMs'] >= index.AUDIO_UPLOAD_PRIOR_MS
+
+
+def test_latency_saved_follows_measured_uploads(monkeypatch):
+    monkeypatch.setitem(index.audio_upload_stats, 'uploads', 0)
+    monkeypatch.setitem(index.audio_upload_stats, 'ewmaMs', 0.0)
+    assert index.expected_audio_upload_ms() == index.AUDIO_UPLOAD_PRIOR_MS
+    index.record_audio_upload(25.0)
+    assert index.expected_audio_upload_ms() == 25.0
@@ -0,0 +1,75 @@
+import index
+
+
+def configured_router():
+    return index.ModelRouter([
+        {'name': 'quality', 'modelId': 'model-a', 'maxTokens': 1000, 'ttftMs': 900.0,
+         'tokensPerSecond': 40.0, 'prefillMsPer1kTokens': 100.0},
+        {'name': 'fast', 'modelId': 'model-b', 'maxTokens': 800, 'ttftMs': 300.0,
+         'tokensPerSecond': 120.0, 'prefillMsPer1kTokens': 50.0}
+    ])
+
+
+def test_unconfigured_router_keeps_max_tokens():
+    router = index.ModelRouter(index.parse_model_tiers(''))
+    for elapsed_ms in (0, 3000, 7500, 20000):
+        route = router.route(2000, elapsed_ms)
+        assert route['maxTokens'] == index.MAX_TOKENS
+        assert route['modelId'] == index.MODEL_ID
+        assert route['skipped'] == []
+    
+    router.observe('primary', 500, 2000, 10, 5.0)  # 2 tokens/s would size answers far below MAX_TOKENS
+    assert router.route(2000, 1000)['maxTokens'] == index.MAX_TOKENS
+
+
+def test_invalid_tiers_behave_as_unconfigured():
+    assert index.parse_model_tiers('not json') == []
+    assert index.ModelRouter(index.parse_model_tiers('[{"name": "x"}]')).route(100, 0)['maxTokens'] == index.MAX_TOKENS
+
+
+def test_configured_router_sizes_answers_in_steps():
+    route = configured_router().route(1000, 500)
+    assert route['tier'] == 'quality'
+    assert route['maxTokens'] % index.MAX_TOKENS_STEP == 0
+    assert index.MIN_RESPONSE_TOKENS <= route['maxTokens'] <= 1000
+
+
+def test_fallback_when_nothing_fits_is_rounded(monkeypatch):
+    monkeypatch.setattr(index, 'TTFT_FALLBACK_MS', 200)
+    route = configured_router().route(1000, index.LATENCY_SLO_MS - 3000)
+    assert route['tier'] == 'fast'
+    assert [skip['reason'] for skip in route['skipped']] == ['ttft', 'ttft']
+    # (3000 - 350) ms at 120 tokens/s is 318 tokens
+    assert route['maxTokens'] == 300
+
+
+def test_fingerprint_ignores_max_tokens():
+    request = {'max_tokens': 550, 'messages': [{'role': 'user', 'content': 'Hola'}], 'temperature': 0.7}
+    assert index.response_fingerprint(request, 'm') == index.response_fingerprint(dict(request, max_tokens=1000), 'm')
+
+
+def use_memory_response_cache(monkeypatch):
+    monkeypatch.setattr(index, 'ENABLE_RESPONSE_CACHE', True)
+    monkeypatch.setattr(index, 'response_cache', index.ResponseCache(index.InMemoryResponseStore(), 60, 8))
+
+
+def test_identical_requests_hit_the_response_cache(monkeypatch, fakes, invoke):
+    use_memory_response_cache(monkeypatch)
+    first = {'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1', 'topic': 'Física'}
+    second = dict(first, audioData='UklGRg==' * 90, sessionId='session-2')
+    
+    assert invoke(first)[1]['metadata']['responseCacheHit'] is False
+    status, body = invoke(second)
+    assert status == 200
+    assert body['metadata']['responseCacheHit'] is True
+    assert len(fakes['bedrock-runtime'].requests) == 1
+
+
+def test_truncated_answers_are_not_cached(monkeypatch, fakes, invoke):
+    use_memory_response_cache(monkeypatch)
+    fakes['bedrock-runtime'].stop_reason = 'max_tokens'
+    request = {'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1', 'topic': 'Física'}
+    
+    invoke(request)
+    assert invoke(request)[1]['metadata']['responseCacheHit'] is False
+    assert len(fakes['bedrock-runtime'].requests) == 2
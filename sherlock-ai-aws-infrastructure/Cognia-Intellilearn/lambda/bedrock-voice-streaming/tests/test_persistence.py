@@ -0,0 +1,144 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import index
+from fakes import FakeTable
+
+REQUEST = {'audioData': 'UklGRg==' * 40, 'sessionId': 'session-1', 'studentId': 'student-1', 'topic': 'Biología'}
+
+
+def done_future(result=None, exception=None):
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+class FlakyWrite:
+    """
+    Save helper that fails a set number of times before succeeding
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.calls > self.failures
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    """
+    Record retry delays instead of sleeping, with the jitter fixed at 1
+    """
+    delays = []
+    monkeypatch.setattr(index.time, 'sleep', delays.append)
+    monkeypatch.setattr(index.random, 'uniform', lambda low, high: 1.0)
+    return delays
+
+
+@pytest.fixture
+def blocked_queue():
+    """
+    A one-slot queue whose slot is held until the test ends
+    """
+    queue = index.PersistenceQueue(1, 1)
+    release = threading.Event()
+    holder = queue.submit(lambda: release.wait(5))
+    yield queue
+    release.set()
+    holder.result(timeout=5)
+    queue.executor.shutdown(wait=True)
+
+
+def test_ticket_reports_queued_committed_and_failed():
+    pending = Future()
+    assert index.PersistenceTicket([done_future(True), pending]).status() == 'queued'
+    assert index.PersistenceTicket([done_future(True), done_future(True)]).status() == 'committed'
+    assert index.PersistenceTicket([done_future(True), done_future(False)]).status() == 'failed'
+    assert index.PersistenceTicket([pending, done_future(exception=RuntimeError('boom'))]).status() == 'failed'
+    cancelled = Future()
+    cancelled.cancel()
+    assert index.PersistenceTicket([cancelled]).status() == 'failed'
+
+
+def test_write_is_retried_with_exponential_backoff(backoff):
+    write = FlakyWrite(failures=2)
+    assert index.PersistenceQueue._run_with_retries(write)
+    assert write.calls == 3
+    assert backoff == [index.PERSIST_RETRY_BASE_MS / 1000, index.PERSIST_RETRY_BASE_MS * 2 / 1000]
+
+
+def test_write_gives_up_after_the_retries(backoff):
+    write = FlakyWrite(failures=index.PERSIST_MAX_RETRIES + 1)
+    assert not index.PersistenceQueue._run_with_retries(write)
+    assert write.calls == index.PERSIST_MAX_RETRIES + 1
+    assert len(backoff) == index.PERSIST_MAX_RETRIES
+    assert backoff[-1] == index.PERSIST_RETRY_BASE_MS * 2 ** (index.PERSIST_MAX_RETRIES - 1) / 1000
+
+
+def test_queued_write_commits_after_retrying(backoff):
+    queue = index.PersistenceQueue(1, 2)
+    ticket = index.PersistenceTicket([queue.submit(FlakyWrite(failures=1))])
+    ticket.wait(5)
+    assert ticket.status() == 'committed'
+    assert queue.flush(1)
+    queue.executor.shutdown(wait=True)
+
+
+def test_full_queue_fails_the_write_at_the_timeout(blocked_queue):
+    started = time.perf_counter()
+    future = blocked_queue.submit(FlakyWrite(failures=0), timeout=0.05)
+    assert time.perf_counter() - started < 1
+    assert future.done() and future.result() is False
+    assert index.PersistenceTicket([future]).status() == 'failed'
+    assert blocked_queue.try_submit(FlakyWrite(failures=0), timeout=0) is None
+
+
+def test_save_does_not_block_past_the_deadline(monkeypatch, fakes, blocked_queue):
+    monkeypatch.setattr(index, 'persistence_queue', blocked_queue)
+    deadline = index.Deadline(300)
+    started = time.perf_counter()
+    ticket = index.save_ai_content_parallel(
+        'session-1', '000000000', 'Biología', 'student-1', 'prompt', 'respuesta', 'request-1', deadline=deadline
+    )
+    assert time.perf_counter() - started < 0.5
+    assert ticket.status() == 'failed'
+
+
+def test_handler_reports_committed_writes(fakes, invoke):
+    status, body = invoke(REQUEST)
+    assert status == 200
+    assert body['aiContentSaved'] == 'committed'
+
+
+def test_handler_reports_failed_writes(monkeypatch, fakes, invoke, backoff):
+    def failing_put_item(self, Item, **kwargs):
+        raise RuntimeError('dynamodb unavailable')
+    monkeypatch.setattr(FakeTable, 'put_item', failing_put_item)
+    status, body = invoke(REQUEST)
+    assert status == 200
+    assert body['aiContentSaved'] == 'failed'
+    # The fakes sleep for zero; only the metadata write backs off
+    assert [delay for delay in backoff if delay] == [
+        index.PERSIST_RETRY_BASE_MS * 2 ** attempt / 1000 for attempt in range(index.PERSIST_MAX_RETRIES)
+    ]
+
+
+def test_write_behind_reports_queued_writes(monkeypatch, fakes, invoke):
+    release = threading.Event()
+    monkeypatch.setattr(index, 'PERSIST_MODE', 'write_behind')
+    monkeypatch.setattr(index, 'PERSIST_FLUSH_TIMEOUT_MS', 0)
+    monkeypatch.setattr(FakeTable, 'put_item', lambda self, Item, **kwargs: release.wait(5) and {})
+    status, body = invoke(REQUEST)
+    release.set()
+    assert status == 200
+    assert body['aiContentSaved'] == 'queued'
+    assert index.persistence_queue.flush(5)
@@ -0,0 +1,197 @@
+import base64
+
+import pytest
+
+import index
+
+BOUNDARY = 'test-boundary-51c'
+AUDIO = b'\x1aE\xdf\xa3webm\r\n--not-the-boundary\r\n' + bytes(range(256))
+UPLOAD_KEY = index.AUDIO_UPLOAD_PREFIX + 'student-1/clip.webm'
+
+
+def part(name, content, filename=None, content_type=None):
+    headers = f'Content-Disposition: form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+    if content_type:
+        headers += f'\r\nContent-Type: {content_type}'
+    return f'--{BOUNDARY}\r\n{headers}\r\n\r\n'.encode('ascii') + content + b'\r\n'
+
+
+def multipart(*parts, closing=True):
+    return b''.join(parts) + (f'--{BOUNDARY}--\r\n'.encode('ascii') if closing else b'')
+
+
+def multipart_event(raw, content_type=f'multipart/form-data; boundary={BOUNDARY}'):
+    return {
+        'body': base64.b64encode(raw).decode('ascii'),
+        'isBase64Encoded': True,
+        'headers': {'Content-Type': content_type}
+    }
+
+
+def binary_event(audio, content_type='audio/webm'):
+    return {
+        'body': base64.b64encode(audio).decode('ascii'),
+        'isBase64Encoded': True,
+        'headers': {'content-type': content_type},
+        'queryStringParameters': {'sessionId': 'session-1'}
+    }
+
+
+def test_multipart_fields_and_audio():
+    raw = multipart(
+        part('sessionId', b'session-1'),
+        part('history', b'[{"role": "user", "content": "Hola"}]'),
+        part('audio', AUDIO, filename='clip.webm', content_type='audio/webm')
+    )
+    fields = index.parse_multipart(raw, f'multipart/form-data; boundary={BOUNDARY}')
+    assert fields['sessionId'] == 'session-1'
+    assert fields['history'] == [{'role': 'user', 'content': 'Hola'}]
+    assert fields['format'] == 'webm'
+    # The audio part keeps CRLFs and dashes and is a view over the body, not a copy
+    assert isinstance(fields['audioData'], memoryview)
+    assert fields['audioData'].obj is raw
+    assert bytes(fields['audioData']) == AUDIO
+
+
+@pytest.mark.parametrize('content_type', [
+    f'multipart/form-data; boundary="{BOUNDARY}"',
+    f'multipart/form-data; boundary={BOUNDARY}; charset=utf-8',
+    f'multipart/form-data; charset=utf-8; boundary={BOUNDARY}',
+])
+def test_boundary_parameter_forms(content_type):
+    fields = index.parse_multipart(multipart(part('audioData', AUDIO)), content_type)
+    assert bytes(fields['audioData']) == AUDIO
+
+
+def test_preamble_and_empty_parts():
+    raw = b'preamble ignored\r\n' + multipart(part('topic', b''), part('audio', b'', filename='empty.webm'))
+    fields = index.parse_multipart(raw, f'multipart/form-data; boundary={BOUNDARY}')
+    assert fields['topic'] == ''
+    assert bytes(fields['audioData']) == b''
+
+
+def test_any_file_part_is_the_audio():
+    raw = multipart(part('recording', AUDIO, filename='clip.ogg', content_type='audio/ogg'))
+    fields = index.parse_multipart(raw, f'multipart/form-data; boundary={BOUNDARY}')
+    assert bytes(fields['audioData']) == AUDIO
+    assert fields['format'] == 'ogg'
+
+
+@pytest.mark.parametrize('raw, content_type, message', [
+    (multipart(part('audio', AUDIO)), 'multipart/form-data', 'without a boundary'),
+    (b'no delimiter here', f'multipart/form-data; boundary={BOUNDARY}', 'without parts'),
+    (multipart(part('audio', AUDIO), closing=False), f'multipart/form-data; boundary={BOUNDARY}', 'truncated'),
+    (multipart(part('audio', AUDIO))[:-30], f'multipart/form-data; boundary={BOUNDARY}', 'truncated'),
+    (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="audio"'.encode('ascii'),
+     f'multipart/form-data; boundary={BOUNDARY}', 'truncated'),
+])
+def test_malformed_multipart_is_rejected(raw, content_type, message):
+    with pytest.raises(ValueError, match=message):
+        index.parse_multipart(raw, content_type)
+
+
+@pytest.mark.parametrize('name', ['content-type', 'Content-Type', 'CONTENT-TYPE', 'cOnTeNt-TyPe'])
+def test_headers_are_matched_case_insensitively(name):
+    assert index.get_header({'headers': {name: 'audio/webm'}}, 'content-type') == 'audio/webm'
+    assert index.get_header({'headers': {name: 'audio/webm'}}, 'Content-Type') == 'audio/webm'
+
+
+@pytest.mark.parametrize('event', [{}, {'headers': None}, {'headers': {'accept': '*/*'}}])
+def test_missing_header_is_empty(event):
+    assert index.get_header(event, 'content-type') == ''
+
+
+def test_upper_case_content_type_selects_binary_parsing():
+    event = binary_event(AUDIO)
+    event['headers'] = {'CONTENT-TYPE': 'audio/webm'}
+    fields = index.parse_request_body(event)
+    assert bytes(fields['audioData']) == AUDIO
+    assert fields['sessionId'] == 'session-1'
+
+
+@pytest.mark.parametrize('body', [[], 'x', None, 3])
+def test_non_object_json_body_is_rejected(fakes, invoke, body):
+    status, response = invoke(body)
+    assert status == 400
+    assert response['error'] == 'Request body must be a JSON object'
+
+
+def test_multipart_without_audio_part(fakes, invoke):
+    status, response = invoke(event=multipart_event(multipart(part('sessionId', b'session-1'))))
+    assert status == 400
+    assert 'audioData' in response['error']
+
+
+def test_truncated_multipart_is_a_bad_request(fakes, invoke):
+    raw = multipart(part('sessionId', b'session-1'), part('audio', AUDIO, filename='clip.webm'), closing=False)
+    status, response = invoke(event=multipart_event(raw))
+    assert status == 400
+    assert response['error'] == 'truncated multipart body'
+
+
+def test_multipart_audio_reaches_the_handler(fakes, invoke):
+    raw = multipart(part('sessionId', b'session-1'), part('audio', AUDIO, filename='clip.webm'))
+    status, response = invoke(event=multipart_event(raw, f'multipart/form-data; boundary="{BOUNDARY}"'))
+    assert status == 200
+    assert response['fullResponse']
+
+
+def test_binary_audio_at_the_limit_is_accepted(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_MAX_BYTES', len(AUDIO) // 3 * 3)
+    status, _ = invoke(event=binary_event(AUDIO[:index.AUDIO_MAX_BYTES]))
+    assert status == 200
+
+
+def test_oversize_binary_body_is_rejected_before_decoding(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_MAX_BYTES', len(AUDIO) // 3 * 3)
+    monkeypatch.setattr(index.binascii, 'a2b_base64', pytest.fail)
+    status, response = invoke(event=binary_event(AUDIO[:index.AUDIO_MAX_BYTES + 3]))
+    assert status == 413
+    assert response['error'] == f'audio too large (max {index.AUDIO_MAX_BYTES} bytes)'
+
+
+def test_oversize_multipart_body_is_rejected(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_MAX_BYTES', 16)
+    raw = multipart(part('sessionId', b'session-1'), part('audio', b'\x00' * (index.MULTIPART_FIELDS_MAX_BYTES + 64)))
+    status, _ = invoke(event=multipart_event(raw))
+    assert status == 413
+
+
+def test_oversize_multipart_audio_part_is_rejected(monkeypatch, fakes, invoke):
+    # The body fits the form-field allowance, but the audio part alone is over the limit
+    monkeypatch.setattr(index, 'AUDIO_MAX_BYTES', len(AUDIO) - 1)
+    raw = multipart(part('sessionId', b'session-1'), part('audio', AUDIO, filename='clip.webm'))
+    status, _ = invoke(event=multipart_event(raw))
+    assert status == 413
+
+
+def test_uploaded_audio_is_read_from_s3(fakes, invoke):
+    fakes['s3'].seed_object(UPLOAD_KEY, AUDIO)
+    status, response = invoke({'audioS3Key': UPLOAD_KEY, 'sessionId': 'session-1'})
+    assert status == 200
+    assert response['fullResponse']
+
+
+def test_oversize_uploaded_audio_is_rejected(monkeypatch, fakes, invoke):
+    monkeypatch.setattr(index, 'AUDIO_MAX_BYTES', len(AUDIO) - 1)
+    fakes['s3'].seed_object(UPLOAD_KEY, AUDIO)
+    status, response = invoke({'audioS3Key': UPLOAD_KEY, 'sessionId': 'session-1'})
+    assert status == 413
+    assert response['error'] == f'audio too large (max {index.AUDIO_MAX_BYTES} bytes)'
+
+
+def test_missing_uploaded_audio_is_not_found(fakes, invoke):
+    status, response = invoke({'audioS3Key': UPLOAD_KEY, 'sessionId': 'session-1'})
+    assert status == 404
+    assert response['error'] == 'audioS3Key not found'
+
+
+@pytest.mark.parametrize('key', [
+    'courses/000000000/syllabus.pdf',
+    index.AUDIO_UPLOAD_PREFIX + '../courses/syllabus.pdf',
+    ['not', 'a', 'string'],
+])
+def test_audio_key_outside_the_upload_prefix_is_rejected(fakes, invoke, key):
+    status, response = invoke({'audioS3Key': key, 'sessionId': 'session-1'})
+    assert status == 400
+    assert response['error'] == f'audioS3Key must name an object under {index.AUDIO_UPLOAD_PREFIX}'
@@ -0,0 +1,64 @@
+import index
+
+
+def make_request(prompt: str) -> dict:
+    return {
+        'anthropic_version': 'bedrock-2023-05-31',
+        'max_tokens': 1000,
+        'system': index.SYSTEM_PROMPT_FIELD,
+        'messages': [{'role': 'user', 'content': prompt}],
+        'temperature': index.TEMPERATURE,
+        'top_p': index.TOP_P
+    }
+
+
+def test_in_memory_store_hit_and_miss():
+    cache = index.ResponseCache(index.InMemoryResponseStore(), ttl_seconds=60, max_entries=8)
+    assert cache.get('missing', 'req') is None
+    cache.put('present', ['Hola. ', 'Adiós.'], 420, 'req')
+    
+    entry = cache.get('present', 'req')
+    assert entry['chunks'] == ['Hola. ', 'Adiós.']
+    assert entry['generationMs'] == 420
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+    assert cache.hit_ratio() == 0.5
+
+
+def test_shared_store_serves_a_new_container():
+    store = index.InMemoryResponseStore()
+    index.ResponseCache(store, ttl_seconds=60, max_entries=8).put('fp', ['Hola.'], 100, 'req')
+    
+    fresh = index.ResponseCache(store, ttl_seconds=60, max_entries=8)
+    assert fresh.get('fp', 'req')['chunks'] == ['Hola.']
+    assert fresh.local.get('fp') is not None
+
+
+def test_expired_entries_miss(monkeypatch):
+    store = index.InMemoryResponseStore()
+    cache = index.ResponseCache(store, ttl_seconds=60, max_entries=8)
+    now = 1_700_000_000.0
+    monkeypatch.setattr(index.time, 'time', lambda: now)
+    cache.put('fp', ['Hola.'], 100, 'req')
+    assert cache.get('fp', 'req') is not None
+    
+    monkeypatch.setattr(index.time, 'time', lambda: now + 61)
+    assert cache.get('fp', 'req') is None
+    assert index.ResponseCache(store, ttl_seconds=60, max_entries=8).get('fp', 'req') is None
+
+
+def test_fingerprint_ignores_audio_size():
+    short = index.create_educational_prompt('A' * 120, 'Física', 'Material')
+    longer = index.create_educational_prompt('A' * 98000, 'Física', 'Material')
+    binary = index.create_educational_prompt(memoryview(b'\x00' * 5000), 'Física', 'Material')
+    assert short != longer
+    fingerprints = {index.response_fingerprint(make_request(prompt), index.MODEL_ID) for prompt in (short, longer, binary)}
+    assert len(fingerprints) == 1
+
+
+def test_fingerprint_keeps_what_changes_the_answer():
+    base = index.response_fingerprint(make_request(index.create_educational_prompt('A', 'Física', 'Material')), 'm')
+    assert base != index.response_fingerprint(make_request(index.create_educational_prompt('A', 'Química', 'Material')), 'm')
+    assert base != index.response_fingerprint(
+        make_request(index.create_educational_prompt('A', 'Física', 'Material', transcript='¿Qué es la energía?')), 'm'
+    )
+    assert base != index.response_fingerprint(make_request(index.create_educational_prompt('A', 'Física', 'Material')), 'other')
@@ -0,0 +1,88 @@
+import pytest
+
+import index
+
+ANSWER = (
+    "¡Hola! La energía cinética es 0.5 por la masa por la velocidad al cuadrado. "
+    "El Dr. Newton la estudió en el s. XVII, ¿lo sabías? "
+    "Tiene unidades de julios, como el trabajo, el calor, etc. Veamos un ejemplo."
+)
+EXPECTED = [
+    "¡Hola!",
+    "La energía cinética es 0.5 por la masa por la velocidad al cuadrado.",
+    "El Dr. Newton la estudió en el s. XVII, ¿lo sabías?",
+    "Tiene unidades de julios, como el trabajo, el calor, etc.",
+    "Veamos un ejemplo."
+]
+
+
+def segment(deltas):
+    segmenter = index.SentenceSegmenter()
+    sentences = []
+    for delta in deltas:
+        sentences.extend(segmenter.feed(delta))
+    return sentences + segmenter.flush()
+
+
+def test_whole_text():
+    assert index.split_sentences(ANSWER) == EXPECTED
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 12])
+def test_deltas_split_mid_sentence(size):
+    assert segment([ANSWER[i:i + size] for i in range(0, len(ANSWER), size)]) == EXPECTED
+
+
+def test_sentence_is_released_once_the_next_delta_confirms_it():
+    segmenter = index.SentenceSegmenter()
+    assert segmenter.feed("Primera frase.") == []
+    assert segmenter.feed(" Segunda") == ["Primera frase."]
+    assert segmenter.flush() == ["Segunda"]
+
+
+@pytest.mark.parametrize('text', [
+    "Habló con la Sra. García y con el Prof. Ruiz sobre el tema.",
+    "Mira la pág. 12 del libro.",
+    "Lo escribió J. R. Mayer hace tiempo.",
+    "Son unos 3 km aprox. desde aquí."
+])
+def test_abbreviations_and_initials_do_not_end_sentences(text):
+    assert index.split_sentences(text) == [text]
+
+
+@pytest.mark.parametrize('deltas', [
+    ["La masa es 3.5 kg. Ahora calculamos."],
+    ["La masa es 3.", "5 kg. Ahora calculamos."],
+    ["La masa es 3", ".", "5 kg.", " Ahora calculamos."]
+])
+def test_decimals(deltas):
+    assert segment(deltas) == ["La masa es 3.5 kg.", "Ahora calculamos."]
+
+
+def test_etc_ends_a_sentence_before_a_capitalised_word():
+    assert index.split_sentences("Masa, velocidad, etc. Luego vemos la fórmula.") == [
+        "Masa, velocidad, etc.", "Luego vemos la fórmula."
+    ]
+
+
+def test_etc_continues_before_a_lowercase_word():
+    text = "Masa, velocidad, etc. y luego la fórmula."
+    assert index.split_sentences(text) == [text]
+
+
+def test_inverted_marks_keep_the_question_together():
+    assert index.split_sentences("¿Sabes qué es la energía? Es la capacidad de hacer trabajo.") == [
+        "¿Sabes qué es la energía?", "Es la capacidad de hacer trabajo."
+    ]
+
+
+def test_flush_returns_the_tail_and_resets():
+    segmenter = index.SentenceSegmenter()
+    assert segmenter.feed("Una frase completa. Y una sin terminar") == ["Una frase completa."]
+    assert segmenter.flush() == ["Y una sin terminar"]
+    assert segmenter.flush() == []
+    assert segmenter.feed("Nueva frase. Otra") == ["Nueva frase."]
+
+
+def test_flush_closes_a_trailing_terminator_and_newlines():
+    assert segment(["Primera línea\nSegunda línea.", ""]) == ["Primera línea", "Segunda línea."]
@@ -0,0 +1,87 @@
+import gzip
+import json
+
+import pytest
+
+import index
+
+REQUEST = {
+    'audioData': 'UklGRg==' * 40, 'sessionId': 'session-42', 'courseId': '000000123',
+    'topic': 'Física', 'studentId': 'student-1'
+}
+ITEM_KEY = ('VOICE_SESSION#session-42', 'METADATA')
+# Pointer and summary fields; the prompt and response live only in the artifact
+COMPACT_ITEM_FIELDS = {
+    'PK', 'SK', 'sessionId', 'courseId', 'topic', 'studentId', 'responseLength', 'promptLength', 'model',
+    'createdAt', 'requestId', 'TTL', 'GSI1PK', 'GSI1SK',
+    'artifactKey', 'artifactVersion', 'artifactBytes', 'audioChunks', 'timeToFirstAudioMs'
+}
+
+
+def save_session(monkeypatch, invoke, artifact_format):
+    monkeypatch.setattr(index, 'ARTIFACT_FORMAT', artifact_format)
+    status, body = invoke(REQUEST)
+    assert status == 200
+    assert body['aiContentSaved'] == 'committed'
+    return body
+
+
+def session_item(fakes):
+    return fakes['dynamodb'].Table(index.DYNAMODB_TABLE).items[ITEM_KEY]
+
+
+@pytest.mark.parametrize('artifact_format', ['compact', 'legacy'])
+def test_saved_session_reads_back(monkeypatch, fakes, invoke, artifact_format):
+    body = save_session(monkeypatch, invoke, artifact_format)
+    # Readers handle both layouts whatever the current write format is
+    monkeypatch.setattr(index, 'ARTIFACT_FORMAT', 'legacy' if artifact_format == 'compact' else 'compact')
+    record = index.load_session_artifact('session-42')
+    assert record['sessionId'] == 'session-42'
+    assert record['courseId'] == '000000123'
+    assert record['topic'] == 'Física'
+    assert record['studentId'] == 'student-1'
+    assert record['response'] == body['fullResponse']
+    assert record['prompt'].startswith(index.SYSTEM_PROMPT)
+    assert record['model'] == body['metadata']['model']
+    assert record['requestId'] == body['requestId']
+
+
+def test_compact_session_is_one_object_and_a_pointer(monkeypatch, fakes, invoke):
+    body = save_session(monkeypatch, invoke, 'compact')
+    item = session_item(fakes)
+    assert set(item) == COMPACT_ITEM_FIELDS
+    assert item['artifactKey'] == index.session_artifact_key('student-1', 'session-42')
+    assert item['artifactBytes'] == len(fakes['s3'].objects[item['artifactKey']])
+    assert item['audioChunks'] == len(body['audioUrls'])
+    assert isinstance(item['timeToFirstAudioMs'], int)
+    assert not [key for key in fakes['s3'].objects if key.startswith(('AIContent/BedrockPrompts/', 'AIContent/TextOutput/'))]
+
+    record = json.loads(gzip.decompress(fakes['s3'].objects[item['artifactKey']]))
+    assert record['version'] == index.ARTIFACT_VERSION
+    assert [entry['url'] for entry in record['audio']] == body['audioUrls']
+    assert record == index.load_session_artifact('session-42')
+
+
+def test_legacy_session_keeps_the_separate_objects(monkeypatch, fakes, invoke):
+    body = save_session(monkeypatch, invoke, 'legacy')
+    item = session_item(fakes)
+    assert 'artifactKey' not in item
+    assert 'AIContent/BedrockPrompts/Física/session-42.json' in fakes['s3'].objects
+    assert fakes['s3'].objects['AIContent/TextOutput/student-1/session-42.txt'] == body['fullResponse'].encode('utf-8')
+
+    record = index.load_session_artifact('session-42')
+    assert record['version'] == 0
+    assert record['audio'] == [] and record['timing'] == {}
+
+
+def test_legacy_reader_falls_back_to_the_text_output(monkeypatch, fakes, invoke):
+    body = save_session(monkeypatch, invoke, 'legacy')
+    prompt_key = 'AIContent/BedrockPrompts/Física/session-42.json'
+    prompt_data = json.loads(fakes['s3'].objects[prompt_key])
+    del prompt_data['response']
+    fakes['s3'].seed_object(prompt_key, json.dumps(prompt_data).encode('utf-8'))
+    assert index.load_session_artifact('session-42')['response'] == body['fullResponse']
+
+
+def test_unknown_session_reads_as_none(fakes):
+    assert index.load_session_artifact('session-missing') is None
@@ -0,0 +1,191 @@
+import asyncio
+import base64
+import sys
+import threading
+import time
+import types
+from typing import Iterator, List, Optional, Tuple
+
+import pytest
+
+import index
+
+SPOKEN = '¿Qué es la fotosíntesis? Explícamelo con un ejemplo sencillo, por favor.'.encode('utf-8')
+
+
+class FakeTranscribeStream:
+    """
+    One Transcribe streaming session: results are returned after all audio is sent,
+    or the output hangs after the first partial when stall is set
+    """
+
+    def __init__(self, results: List[Tuple[str, bool]], stall: bool):
+        self.results = results
+        self.stall = stall
+        self.received: List[bytes] = []
+        self.cancelled = False
+        self.ended = asyncio.Event()
+        self.input_stream = types.SimpleNamespace(send_audio_event=self.send_audio_event, end_stream=self.end_stream)
+        self.output_stream = self.events()
+
+    async def send_audio_event(self, audio_chunk: bytes) -> None:
+        self.received.append(audio_chunk)
+
+    async def end_stream(self) -> None:
+        self.ended.set()
+
+    async def events(self):
+        try:
+            if self.stall:
+                yield self.event(*self.results[0])
+                await asyncio.sleep(60)
+            await self.ended.wait()
+            for text, is_partial in self.results:
+                yield self.event(text, is_partial)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+    @staticmethod
+    def event(text: str, is_partial: bool):
+        result = types.SimpleNamespace(alternatives=[types.SimpleNamespace(transcript=text)], is_partial=is_partial)
+        return types.SimpleNamespace(transcript=types.SimpleNamespace(results=[result]))
+
+
+@pytest.fixture
+def transcribe_client(monkeypatch):
+    """
+    amazon_transcribe.client.TranscribeStreamingClient replaced by a fake that records its streams
+    """
+    streams: List[FakeTranscribeStream] = []
+    config = {'results': [('Qué es', True), ('Qué es la fotosíntesis', False)], 'stall': False}
+
+    class FakeTranscribeStreamingClient:
+        def __init__(self, region: str):
+            self.region = region
+
+        async def start_stream_transcription(self, **kwargs) -> FakeTranscribeStream:
+            stream = FakeTranscribeStream(config['results'], config['stall'])
+            streams.append(stream)
+            return stream
+
+    package = types.ModuleType('amazon_transcribe')
+    client_module = types.ModuleType('amazon_transcribe.client')
+    client_module.TranscribeStreamingClient = FakeTranscribeStreamingClient
+    package.client = client_module
+    monkeypatch.setitem(sys.modules, 'amazon_transcribe', package)
+    monkeypatch.setitem(sys.modules, 'amazon_transcribe.client', client_module)
+    return types.SimpleNamespace(streams=streams, config=config)
+
+
+class StalledEngine(index.TranscriptionEngine):
+    name = 'stalled'
+
+    def transcribe(
+        self, chunks: Iterator, audio_format: str, request_id: str, timeout: Optional[float] = None
+    ) -> Iterator[Tuple[str, bool]]:
+        yield 'Qué es', False
+        yield 'Qué es la fotosíntesis', False
+        raise TimeoutError('transcription did not finish before the deadline')
+
+
+def transcribe_threads() -> List[threading.Thread]:
+    return [thread for thread in threading.enumerate() if thread.name.startswith('transcribe-')]
+
+
+@pytest.mark.parametrize('chunk_bytes', [3, 5, 64, 8192])
+def test_base64_audio_is_decoded_in_chunks(chunk_bytes):
+    chunks = list(index.iter_audio_chunks(base64.b64encode(SPOKEN).decode('ascii'), chunk_bytes))
+    assert b''.join(chunks) == SPOKEN
+    assert all(len(chunk) <= chunk_bytes // 3 * 3 for chunk in chunks)
+    assert len(chunks) == -(-len(SPOKEN) // (chunk_bytes // 3 * 3))
+
+
+def test_data_url_prefix_is_dropped():
+    data_url = 'data:audio/webm;base64,' + base64.b64encode(SPOKEN).decode('ascii')
+    assert b''.join(index.iter_audio_chunks(data_url, 9)) == SPOKEN
+
+
+def test_binary_audio_is_sliced_without_copying():
+    chunks = list(index.iter_audio_chunks(memoryview(SPOKEN), 10))
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert b''.join(chunks) == SPOKEN
+
+
+def test_local_engine_yields_partials_then_final():
+    engine = index.LocalTranscriptionEngine()
+    results = list(engine.transcribe(index.iter_audio_chunks(memoryview(SPOKEN), 16), 'webm', 'request-1'))
+    assert all(not is_final for _, is_final in results[:-1])
+    assert len(results) > 2
+    assert results[-1] == (SPOKEN.decode('utf-8'), True)
+
+
+def test_local_engine_gives_no_transcript_for_encoded_audio():
+    clip = b'RIFF' + bytes(range(256)) * 4
+    results = list(index.LocalTranscriptionEngine().transcribe(index.iter_audio_chunks(memoryview(clip)), 'wav', 'r'))
+    assert results == [('', True)]
+
+
+def test_engine_interface_is_abstract():
+    with pytest.raises(TypeError):
+        index.TranscriptionEngine()
+
+
+@pytest.mark.parametrize('name', ['none', '', 'whisper'])
+def test_unknown_engine_disables_transcription(name):
+    assert index.create_transcription_engine(name) is None
+
+
+def test_local_engine_is_opt_in():
+    assert isinstance(index.create_transcription_engine('local'), index.LocalTranscriptionEngine)
+
+
+def test_transcribe_engine_needs_its_package(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'amazon_transcribe', None)
+    assert index.create_transcription_engine('transcribe') is None
+
+
+def test_transcribe_engine_is_created_with_its_package(transcribe_client):
+    assert isinstance(index.create_transcription_engine('transcribe'), index.AmazonTranscribeEngine)
+
+
+def test_no_engine_gives_an_empty_transcript(monkeypatch):
+    monkeypatch.setattr(index, 'transcription_engine', None)
+    assert index.transcribe_audio(memoryview(SPOKEN), 'webm', 'request-1') == ''
+
+
+def test_timeout_falls_back_to_latest_partial(monkeypatch):
+    monkeypatch.setattr(index, 'transcription_engine', StalledEngine())
+    partials = []
+    transcript = index.transcribe_audio(memoryview(SPOKEN), 'webm', 'request-1', on_partial=partials.append)
+    assert transcript == 'Qué es la fotosíntesis'
+    assert partials == ['Qué es', 'Qué es la fotosíntesis']
+
+
+def test_transcribe_streams_chunks_and_returns_final(monkeypatch, transcribe_client):
+    monkeypatch.setattr(index, 'transcription_engine', index.create_transcription_engine('transcribe'))
+    transcript = index.transcribe_audio(memoryview(SPOKEN), 'pcm', 'request-1')
+    assert transcript == 'Qué es la fotosíntesis'
+    assert b''.join(transcribe_client.streams[0].received) == SPOKEN
+
+
+def test_transcribe_rejects_unsupported_formats(transcribe_client):
+    engine = index.create_transcription_engine('transcribe')
+    with pytest.raises(ValueError):
+        list(engine.transcribe(iter([SPOKEN]), 'webm', 'request-1', 1.0))
+
+
+def test_transcribe_timeout_cancels_the_worker(monkeypatch, transcribe_client):
+    transcribe_client.config['stall'] = True
+    monkeypatch.setattr(index, 'transcription_engine', index.create_transcription_engine('transcribe'))
+    monkeypatch.setattr(index, 'DEADLINE_TRANSCRIPTION_MAX_MS', 200)
+    started = time.perf_counter()
+    transcript = index.transcribe_audio(memoryview(SPOKEN), 'pcm', 'request-1')
+    assert transcript == 'Qué es'
+    assert time.perf_counter() - started < 1
+
+    deadline = time.perf_counter() + 2
+    while transcribe_threads() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert not transcribe_threads()
+    assert transcribe_client.streams[0].cancelled
@@ -45,6 +45,7 @@ export interface VoiceStreamingSession {
   courseId?: string
   topic?: string
   studentId?: string
+  inlinedAudio?: Map<number, string> // data: URLs of inlined audio by chunk index
 }
 
 export class VoiceStreamingService {
@@ -330,7 +331,7 @@ export class VoiceStreamingService {
           })
           break
 
-        case 'audio_segment':
+        case 'audio_segment': {
           console.log('🎵 Audio segment received')
           
           // Save audio segment using AI Content service
@@ -339,24 +340,43 @@ export class VoiceStreamingService {
             console.log('🔗 Audio URL:', data.audioUrl)
           }
 
-          this.dispatchVoiceEvent('audio', { sessionId, audioUrl: data.audioUrl })
+          // Small segments arrive inline, before their S3 upload has finished
+          const audioUrl = data.audioData ? this.inlineAudioUrl(data.audioData, data.contentType) : data.audioUrl
+          if (data.audioData) {
+            session.inlinedAudio = session.inlinedAudio || new Map()
+            session.inlinedAudio.set(data.chunkIndex, audioUrl)
+          }
+
+          this.dispatchVoiceEvent('audio', { sessionId, audioUrl })
           break
+        }
 
         case 'error':
           console.error('❌ Backend error:', data.message)
           this.handleStreamingError(sessionId, data.message)
           break
 
-        case 'stream_end':
+        case 'stream_end': {
           console.log('🎵 Audio URLs received:', data.audioUrls)
-          if (data.audioUrls && data.audioUrls.length > 0) {
+          // audioUrls leaves inlined segments out; audioSegments lists every segment in playback order
+          const audioUrls: string[] = data.audioSegments
+            ? data.audioSegments
+                .map((segment: any) => segment.audioUrl
+                  || (segment.audioData
+                    ? this.inlineAudioUrl(segment.audioData, segment.contentType)
+                    : session.inlinedAudio?.get(segment.chunkIndex)))
+                .filter(Boolean)
+            : data.audioUrls
+          session.inlinedAudio = undefined
+          if (audioUrls && audioUrls.length > 0) {
             this.dispatchVoiceEvent('audioUrls', { 
               sessionId, 
-              audioUrls: data.audioUrls,
+              audioUrls,
               fullResponse: data.fullResponse 
             })
           }
           break
+        }
 
         default:
           console.log('📨 Unknown streaming data type:', data.type)
@@ -475,6 +495,13 @@ export class VoiceStreamingService {
     window.dispatchEvent(event)
   }
 
+  /**
+   * Build a playable URL for base64 audio returned inline by the backend
+   */
+  private inlineAudioUrl(audioData: string, contentType: string = 'audio/mpeg'): string {
+    return `data:${contentType};base64,${audioData}`
+  }
+
   /**
    * Get active sessions
    */